@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+"""
+cli.py
+------
+Línea de comandos para trabajos programados sin la API HTTP: llama a los
+servicios directamente sobre rutas locales.
+
+    python -m backend.app.cli merge ORIGEN... [--master M | --master-id ID] [--date YYYY-MM-DD]
+                                    [--out DIR] [--zip ARCHIVO]
+    python -m backend.app.cli export-pdf XLS... [--out DIR] [--hoja-base H]
+                                    [--orden IDS] [--excluir IDS] [--date YYYY-MM-DD] [--zip ARCHIVO]
+    python -m backend.app.cli preview XLS... [--hoja-base H]
+    python -m backend.app.cli bench ORIGEN [--master M] [--repeat N] [--warmup N]
+    python -m backend.app.cli bench-scan XLS... [--chunks 250,1000,4000] [--repeat N] [--biff] [--memory]
+    python -m backend.app.cli history-import ORIGEN... [--date YYYY-MM-DD]
+
+(o ``python -m app.cli ...`` desde ``backend``). ORIGEN/XLS acepta archivos,
+carpetas (se toman sus .xls) y patrones glob (``"C:/in/*.XLS"``).
+
+Paralelismo: ``--mode thread`` (un solo Excel, en secuencia) o ``--mode
+process --workers N`` (N procesos con su propio Excel).
+
+El progreso por archivo sale por stderr y el resumen JSON (con tiempos por
+etapa) por stdout. Códigos de salida: 0 todo bien, 1 nada se procesó o error,
+2 uso incorrecto (argparse), 3 algunos archivos fallaron.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import logging
+import os
+import statistics
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .logging_setup import configure_logging
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+
+SOURCE_SUFFIXES = (".xls", ".xlsx")
+GLOB_CHARS = ("*", "?", "[")
+
+
+def _collect_sources(paths: Sequence[str]) -> List[Tuple[str, str]]:
+    """Archivos, carpetas y patrones glob -> [(ruta, nombre)] en orden, sin repetir."""
+    found: List[Tuple[str, str]] = []
+    seen = set()
+    for raw in paths:
+        if any(ch in raw for ch in GLOB_CHARS):
+            candidates = [Path(m) for m in sorted(glob.glob(raw, recursive=True)) if os.path.isfile(m)]
+        else:
+            p = Path(raw)
+            if p.is_dir():
+                candidates = sorted(c for c in p.iterdir() if c.is_file() and c.suffix.lower() in SOURCE_SUFFIXES)
+            elif p.is_file():
+                candidates = [p]
+            else:
+                raise FileNotFoundError(f"No existe: {raw}")
+        for c in candidates:
+            key = os.path.normcase(str(c.resolve()))
+            if key not in seen:
+                seen.add(key)
+                found.append((str(c), c.name))
+    return found
+
+
+def _parse_ids(value: Optional[str]) -> List[str]:
+    """Lista JSON ('["a","b"]') o separada por comas."""
+    if not value:
+        return []
+    value = value.strip()
+    if value.startswith("["):
+        return [str(v) for v in json.loads(value)]
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def _default_out(prefix: str) -> str:
+    return os.path.abspath(f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+
+def _emit(summary: Dict[str, Any]) -> None:
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2, default=str)
+    sys.stdout.write("\n")
+
+
+def _exit_code(summary: Dict[str, Any]) -> int:
+    if not summary.get("ok"):
+        return EXIT_FAILED
+    return EXIT_OK if not summary.get("failed") else EXIT_PARTIAL
+
+
+def _status_printer(quiet: bool = False):
+    """Imprime por stderr cada cambio de estado de un archivo (no cada porcentaje)."""
+    last: Dict[int, str] = {}
+
+    def cb(pct: int, msg: str, files: List[Dict[str, Any]]) -> None:
+        if quiet:
+            return
+        for f in files:
+            if last.get(f["index"]) != f["status"]:
+                last[f["index"]] = f["status"]
+                detail = f" ({f['error']})" if f["status"] == "error" else ""
+                print(f"[{pct:3d}%] {f['name']}: {f['status']}{detail}", file=sys.stderr, flush=True)
+
+    return cb
+
+
+def _sources_or_fail(args: argparse.Namespace) -> Optional[List[Tuple[str, str]]]:
+    try:
+        sources = _collect_sources(args.sources)
+    except FileNotFoundError as exc:
+        _emit({"ok": 0, "total": 0, "error": str(exc)})
+        return None
+    if not sources:
+        _emit({"ok": 0, "total": 0, "error": "No se encontraron archivos."})
+        return None
+    return sources
+
+
+def _master_or_fail(args: argparse.Namespace, total: int) -> Optional[str]:
+    from .services.master_registry import MasterNotFound, get_registry
+
+    registry = get_registry()
+    if args.master_id:
+        try:
+            return str(registry.path_for(args.master_id))
+        except MasterNotFound:
+            _emit({"ok": 0, "total": total, "error": f"No existe el maestro {args.master_id} en el registro."})
+            return None
+    master = args.master or str(registry.default_path())
+    if not os.path.isfile(master):
+        _emit({"ok": 0, "total": total, "error": f"No existe el maestro: {master}"})
+        return None
+    return master
+
+
+def _zip_if_requested(args: argparse.Namespace, summary: Dict[str, Any]) -> None:
+    from .services.batch_merge import zip_batch_outputs
+
+    if args.zip and summary["ok"]:
+        summary["zip"] = os.path.abspath(args.zip)
+        summary["zipped"] = zip_batch_outputs(summary, args.zip)
+
+
+# ------------------------------------------------------------------
+# Subcomandos
+# ------------------------------------------------------------------
+def cmd_merge(args: argparse.Namespace) -> int:
+    from .services.batch_merge import merge_batch
+
+    sources = _sources_or_fail(args)
+    if sources is None:
+        return EXIT_FAILED
+    master = _master_or_fail(args, len(sources))
+    if master is None:
+        return EXIT_FAILED
+
+    summary = merge_batch(
+        sources, master, args.out or _default_out("cobranza_lote"),
+        header_date=args.date,
+        progress_cb=_status_printer(args.quiet),
+        workers=args.workers,
+    )
+    _zip_if_requested(args, summary)
+    _emit(summary)
+    return _exit_code(summary)
+
+
+def cmd_export_pdf(args: argparse.Namespace) -> int:
+    from .services.batch_merge import BatchFile, batch_files, run_batch
+    from .services.pdf_export_service import DEFAULT_FULL_SHEETS
+
+    sources = _sources_or_fail(args)
+    if sources is None:
+        return EXIT_FAILED
+    out_root = args.out or _default_out("cobranza_pdfs")
+    files = batch_files(sources)
+    single = len(files) == 1
+    orden_ids = _parse_ids(args.orden)
+    excluir_ids = _parse_ids(args.excluir)
+
+    def payload_for(f: BatchFile) -> Dict[str, Any]:
+        # Una subcarpeta por libro para que los PDFs de distintos archivos no choquen
+        sub = out_root if single else os.path.join(out_root, f"{f.index + 1:03d}_{Path(f.name).stem}")
+        return {
+            "xls_path": f.source_path,
+            "out_dir": sub,
+            "hojas_completas": DEFAULT_FULL_SHEETS,
+            "hoja_base": args.hoja_base,
+            "orden_ids": orden_ids,
+            "excluir_ids": excluir_ids,
+            "pdf_date": args.date,
+        }
+
+    def finish(f: BatchFile, result: Dict[str, Any]) -> Dict[str, Any]:
+        if not result["files"]:
+            raise RuntimeError("No se detectaron bloques de vendedores ni hojas SUR/NORTE.")
+        return {"outputs": list(result["files"])}
+
+    summary = run_batch(
+        files, "export_pdf", payload_for, finish,
+        progress_cb=_status_printer(args.quiet), workers=args.workers,
+    )
+    summary["out_dir"] = out_root
+    _zip_if_requested(args, summary)
+    _emit(summary)
+    return _exit_code(summary)
+
+
+def cmd_preview(args: argparse.Namespace) -> int:
+    from .services.batch_merge import BatchFile, batch_files, run_batch
+    from .services.pdf_export_service import DEFAULT_FULL_SHEETS
+
+    sources = _sources_or_fail(args)
+    if sources is None:
+        return EXIT_FAILED
+
+    def payload_for(f: BatchFile) -> Dict[str, Any]:
+        return {"xls_path": f.source_path, "hojas_completas": DEFAULT_FULL_SHEETS, "hoja_base": args.hoja_base}
+
+    def finish(f: BatchFile, blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"details": {"blocks": blocks}}
+
+    summary = run_batch(
+        batch_files(sources), "list_blocks", payload_for, finish,
+        progress_cb=_status_printer(args.quiet), workers=args.workers,
+    )
+    _emit(summary)
+    return _exit_code(summary)
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "min": round(min(values), 2),
+        "median": round(statistics.median(values), 2),
+        "max": round(max(values), 2),
+        "mean": round(statistics.fmean(values), 2),
+    }
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    import shutil
+    import tempfile
+
+    from .services.batch_merge import merge_batch
+
+    sources = _sources_or_fail(args)
+    if sources is None:
+        return EXIT_FAILED
+    master = _master_or_fail(args, len(sources))
+    if master is None:
+        return EXIT_FAILED
+    if args.repeat < 1 or args.warmup < 0:
+        print("--repeat debe ser >= 1 y --warmup >= 0", file=sys.stderr)
+        return EXIT_USAGE
+
+    # Las corridas repetidas no son instantáneas reales: fuera del histórico
+    # (los trabajadores del pool heredan el entorno al crearse)
+    os.environ["COBRANZA_HISTORY"] = "0"
+
+    # Cada origen se repite warmup + repeat veces en el mismo lote (mismo Excel)
+    runs = [(path, name) for path, name in sources for _ in range(args.warmup + args.repeat)]
+    out_dir = tempfile.mkdtemp(prefix="cobranza_bench_")
+    try:
+        summary = merge_batch(
+            runs, master, out_dir,
+            header_date=args.date,
+            progress_cb=_status_printer(args.quiet),
+            workers=args.workers,
+        )
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    per_source = args.warmup + args.repeat
+    measured = [
+        f for f in summary["files"]
+        if f["status"] == "done" and f["index"] % per_source >= args.warmup
+    ]
+    stage_values: Dict[str, List[float]] = {}
+    for f in measured:
+        for name, ms in f["stages_ms"].items():
+            stage_values.setdefault(name, []).append(ms)
+
+    result: Dict[str, Any] = {
+        "sources": [name for _, name in sources],
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "mode": summary["mode"],
+        "workers": summary["workers"],
+        "ok": summary["ok"],
+        "failed": summary["failed"],
+        "elapsed_s": summary["elapsed_s"],
+        "files_per_min": summary["files_per_min"],
+        "errors": sorted({f["error"] for f in summary["files"] if f["error"]}),
+    }
+    if measured:
+        result["file_ms"] = _stats([f["elapsed_ms"] for f in measured])
+        result["stages_ms"] = {name: _stats(values) for name, values in sorted(stage_values.items())}
+    _emit(result)
+    return _exit_code(summary)
+
+
+def cmd_bench_scan(args: argparse.Namespace) -> int:
+    from .services.batch_merge import BatchFile, batch_files, run_batch
+
+    sources = _sources_or_fail(args)
+    if sources is None:
+        return EXIT_FAILED
+    try:
+        chunks = [int(c) for c in _parse_ids(args.chunks)]
+    except ValueError:
+        chunks = []
+    if not chunks or min(chunks) < 1 or args.repeat < 1:
+        print("--chunks debe ser una lista de enteros >= 1 y --repeat >= 1", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.biff:
+        # Lector BIFF en este proceso: sin Excel
+        from .services.scan_bench import bench_xls_file
+        from .services.xls_reader import XlsReadError
+
+        files: List[Dict[str, Any]] = []
+        for path, name in sources:
+            try:
+                files.append({"name": name, "status": "done", **bench_xls_file(path, chunks, args.repeat, args.memory)})
+            except (XlsReadError, OSError) as exc:
+                files.append({"name": name, "status": "error", "error": f"{type(exc).__name__}: {exc}"})
+        ok = sum(1 for f in files if f["status"] == "done")
+        summary: Dict[str, Any] = {"files": files, "total": len(files), "ok": ok, "failed": len(files) - ok}
+        _emit(summary)
+        return _exit_code(summary)
+
+    def payload_for(f: BatchFile) -> Dict[str, Any]:
+        return {"xls_path": f.source_path, "chunks": chunks, "repeat": args.repeat, "memory": args.memory}
+
+    def finish(f: BatchFile, result: Dict[str, Any]) -> Dict[str, Any]:
+        return {"details": result}
+
+    summary = run_batch(
+        batch_files(sources), "scan_bench", payload_for, finish,
+        progress_cb=_status_printer(args.quiet), workers=args.workers,
+    )
+    _emit(summary)
+    return _exit_code(summary)
+
+
+def cmd_history_import(args: argparse.Namespace) -> int:
+    from .services.vendor_history import HistoryError, get_history, import_source_file
+    from .services.xls_reader import XlsReadError
+
+    sources = _sources_or_fail(args)
+    if sources is None:
+        return EXIT_FAILED
+    history = get_history()
+    files: List[Dict[str, Any]] = []
+    for path, name in sources:
+        try:
+            files.append({"name": name, "status": "done", **import_source_file(path, args.date, name=name, history=history)})
+        except (HistoryError, XlsReadError, OSError) as exc:
+            files.append({"name": name, "status": "error", "error": f"{type(exc).__name__}: {exc}"})
+        if not args.quiet:
+            f = files[-1]
+            detail = f" ({f['error']})" if f["status"] == "error" else f" {f['date']}: {f['vendors']} vendedores"
+            print(f"{name}: {f['status']}{detail}", file=sys.stderr, flush=True)
+    ok = sum(1 for f in files if f["status"] == "done")
+    summary: Dict[str, Any] = {
+        "db": str(history.path), "files": files, "total": len(files), "ok": ok, "failed": len(files) - ok,
+    }
+    _emit(summary)
+    return _exit_code(summary)
+
+
+# ------------------------------------------------------------------
+# Parser
+# ------------------------------------------------------------------
+def _add_common(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--mode", choices=("thread", "process"), help="Un Excel en secuencia (thread) o pool de procesos (process).")
+    p.add_argument("--workers", type=int, help="Procesos de Excel en modo process.")
+    p.add_argument("--quiet", action="store_true", help="Sin progreso por stderr.")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m backend.app.cli", description="Cobranza: trabajos de Excel sin la API HTTP.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("merge", aliases=["merge-batch"], help="Merge de uno o varios orígenes contra el maestro.")
+    p.add_argument("sources", nargs="+", help="Archivos .xls, carpetas o patrones glob.")
+    p.add_argument("--master", help="Maestro (por defecto el vigente del registro o el de app/data).")
+    p.add_argument("--master-id", help="Maestro registrado (/masters) por id.")
+    p.add_argument("--date", help="Fecha de encabezado YYYY-MM-DD.")
+    p.add_argument("--out", help="Carpeta de salida para los .xls.")
+    p.add_argument("--zip", help="Además, empaquetar los resultados en este ZIP.")
+    _add_common(p)
+    p.set_defaults(func=cmd_merge)
+
+    p = sub.add_parser("export-pdf", help="PDFs por vendedor de uno o varios libros.")
+    p.add_argument("sources", nargs="+", help="Archivos .xls, carpetas o patrones glob.")
+    p.add_argument("--out", help="Carpeta de salida (una subcarpeta por libro si son varios).")
+    p.add_argument("--hoja-base", help="Sólo esta hoja para bloques de vendedor.")
+    p.add_argument("--orden", help="IDs de bloque en orden (JSON o separados por comas).")
+    p.add_argument("--excluir", help="IDs de bloque a excluir del consolidado.")
+    p.add_argument("--date", help="Fecha YYYY-MM-DD para el nombre de los PDFs.")
+    p.add_argument("--zip", help="Además, empaquetar los PDFs en este ZIP.")
+    _add_common(p)
+    p.set_defaults(func=cmd_export_pdf)
+
+    p = sub.add_parser("preview", help="Lista los bloques de vendedor de uno o varios libros.")
+    p.add_argument("sources", nargs="+", help="Archivos .xls, carpetas o patrones glob.")
+    p.add_argument("--hoja-base", help="Sólo esta hoja para bloques de vendedor.")
+    _add_common(p)
+    p.set_defaults(func=cmd_preview)
+
+    p = sub.add_parser("bench", help="Mide el merge repetido sobre los mismos orígenes.")
+    p.add_argument("sources", nargs="+", help="Archivos .xls, carpetas o patrones glob.")
+    p.add_argument("--master", help="Maestro (por defecto el vigente del registro o el de app/data).")
+    p.add_argument("--master-id", help="Maestro registrado (/masters) por id.")
+    p.add_argument("--date", help="Fecha de encabezado YYYY-MM-DD.")
+    p.add_argument("--repeat", type=int, default=3, help="Corridas medidas por origen (3).")
+    p.add_argument("--warmup", type=int, default=1, help="Corridas previas descartadas por origen (1).")
+    _add_common(p)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("bench-scan", help="Mide los escáneres de hoja por tamaño de bloque de filas.")
+    p.add_argument("sources", nargs="+", help="Archivos .xls, carpetas o patrones glob.")
+    p.add_argument("--chunks", default="250,1000,2000,4000", help="Tamaños de bloque a medir (250,1000,2000,4000).")
+    p.add_argument("--repeat", type=int, default=3, help="Corridas por tamaño; se toma la mejor (3).")
+    p.add_argument("--biff", action="store_true", help="Leer con el lector BIFF en vez de Excel.")
+    p.add_argument("--memory", action="store_true", help="Medir también el pico de memoria (más lento).")
+    _add_common(p)
+    p.set_defaults(func=cmd_bench_scan)
+
+    p = sub.add_parser("history-import", help="Carga orígenes antiguos al histórico de totales por vendedor (sin Excel).")
+    p.add_argument("sources", nargs="+", help="Archivos .xls, carpetas o patrones glob.")
+    p.add_argument("--date", help="Fecha YYYY-MM-DD para todos (por defecto la del nombre del archivo).")
+    p.add_argument("--quiet", action="store_true", help="Sin progreso por stderr.")
+    p.set_defaults(func=cmd_history_import)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # El modo y el tamaño del pool se leen del entorno al crear el pool
+    if getattr(args, "mode", None):
+        os.environ["COBRANZA_EXEC_MODE"] = args.mode
+    if getattr(args, "workers", None):
+        os.environ["COBRANZA_EXCEL_WORKERS"] = str(args.workers)
+    configure_logging()
+    try:
+        return args.func(args)
+    except Exception as exc:
+        # Fallo del lote completo (p.ej. Excel no arranca): también en JSON
+        logging.getLogger("cobranza.cli").exception("CLI command failed: %s", exc)
+        _emit({"ok": 0, "error": f"{type(exc).__name__}: {exc}"})
+        return EXIT_FAILED
+    finally:
+        from .services.excel_workers import shutdown_excel_pool
+
+        shutdown_excel_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+job_store.py
+------------
+Estado de los trabajos (progreso, resultado, rutas de salida) que consultan
+/progress y /download.
+
+- ``MemoryJobStore``: diccionario en memoria (se pierde al reiniciar; útil
+  en pruebas).
+- ``SqliteJobStore`` (por defecto): SQLite en modo WAL. Las actualizaciones
+  de progreso (``progress``) se acumulan y se escriben juntas cada
+  COBRANZA_JOB_FLUSH_MS (200 ms): un merge emite decenas de avisos por
+  segundo y sólo interesa el último. Los cambios de estado (``update``:
+  terminado, error, rutas de salida) se escriben en el momento.
+
+Al arrancar, ``recover()`` marca como error los trabajos que quedaron "en
+curso" de un proceso que ya no existe (reinicio o caída de la bandeja),
+borra los terminados hace más de COBRANZA_JOB_RETENTION_DAYS días (7) y
+deja disponibles los terminados cuyos archivos siguen en el temporal.
+
+COBRANZA_JOB_STORE=sqlite | memory
+COBRANZA_JOB_DB: ruta de la base (por defecto app/data/jobs.sqlite3, o
+junto al ejecutable).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from .paths import app_path
+
+logger = logging.getLogger("cobranza.jobs")
+
+ACTIVE_STATUSES = ("queued", "running")
+DEFAULT_FLUSH_MS = 200
+DEFAULT_RETENTION_DAYS = 7
+BUSY_TIMEOUT_MS = 10_000
+OUTPUT_FIELDS = ("out_path", "pdf_zip")
+RECOVERED_MSG = "Interrumpido: la aplicación se reinició durante el proceso."
+
+JobState = Dict[str, Any]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def job_db_path() -> Path:
+    env_path = os.getenv("COBRANZA_JOB_DB")
+    if env_path:
+        return Path(env_path)
+    if getattr(sys, "frozen", False):
+        # _MEIPASS es temporal: la base vive junto al ejecutable
+        return Path(sys.executable).resolve().parent / "jobs.sqlite3"
+    return app_path("data", "jobs.sqlite3")
+
+
+def pid_alive(pid: int) -> bool:
+    """¿Sigue vivo el proceso ``pid``? (sin señales en Windows: os.kill lo terminaría)."""
+    if pid <= 0:
+        return False
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        ERROR_ACCESS_DENIED = 5
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+        try:
+            code = wintypes.DWORD()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _outputs_exist(state: JobState) -> bool:
+    paths = [state.get(f) for f in OUTPUT_FIELDS]
+    outputs = state.get("outputs")
+    if isinstance(outputs, dict):
+        paths.extend(outputs.values())
+    paths = [p for p in paths if isinstance(p, str)]
+    return bool(paths) and all(os.path.isfile(p) for p in paths)
+
+
+class JobStore(ABC):
+    """
+    Interfaz común. ``create`` registra el trabajo, ``update`` guarda campos
+    de inmediato, ``progress`` puede diferirse (se conserva el último valor
+    de cada campo), ``get`` devuelve una copia del estado o None y
+    ``delete`` lo borra (True si existía).
+    """
+
+    @abstractmethod
+    def create(self, job_id: str, **fields: Any) -> None:
+        ...
+
+    @abstractmethod
+    def update(self, job_id: str, **fields: Any) -> None:
+        ...
+
+    def progress(self, job_id: str, **fields: Any) -> None:
+        self.update(job_id, **fields)
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[JobState]:
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str) -> bool:
+        ...
+
+    def recover(self) -> Dict[str, int]:
+        return {"failed": 0, "available": 0, "purged": 0}
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self) -> None:
+        self._jobs: Dict[str, JobState] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            self._jobs[job_id] = dict(fields)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            self._jobs.setdefault(job_id, {}).update(fields)
+
+    def get(self, job_id: str) -> Optional[JobState]:
+        with self._lock:
+            state = self._jobs.get(job_id)
+            return dict(state) if state is not None else None
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            return self._jobs.pop(job_id, None) is not None
+
+
+class SqliteJobStore(JobStore):
+    """
+    Una fila por trabajo: estado y dueño (pid) en columnas, el resto como
+    JSON. Cada escritura mezcla los campos nuevos con los guardados dentro
+    de una transacción ``BEGIN IMMEDIATE``, así varios procesos pueden
+    actualizar campos distintos del mismo trabajo sin pisarse.
+    """
+
+    def __init__(self, path: Path, flush_interval: Optional[float] = None):
+        self.path = Path(path)
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else max(0.0, _env_float("COBRANZA_JOB_FLUSH_MS", DEFAULT_FLUSH_MS) / 1000)
+        )
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self._pending: Dict[str, JobState] = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False, isolation_level=None,
+        )
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id     TEXT PRIMARY KEY,
+                status     TEXT,
+                owner      INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                data       TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at);
+            """
+        )
+
+    # ------------------------------------------------------------------
+    def _write(self, items: Iterable[tuple[str, JobState]], replace: bool = False) -> None:
+        items = list(items)
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job_id, fields in items:
+                    row = None if replace else self._conn.execute(
+                        "SELECT data, created_at, owner FROM jobs WHERE job_id = ?", (job_id,)
+                    ).fetchone()
+                    state: JobState = json.loads(row[0]) if row is not None else {}
+                    state.update(fields)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO jobs (job_id, status, owner, created_at, updated_at, data)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            # El dueño es el proceso que creó el trabajo (lo ejecuta)
+                            job_id, state.get("status"),
+                            row[2] if row is not None else self._pid,
+                            row[1] if row is not None else now, now,
+                            json.dumps(state, ensure_ascii=False, default=str),
+                        ),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="job-store-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait()
+            if self._closed:
+                break
+            time.sleep(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as exc:
+                logger.warning("Job progress flush failed: %s", exc)
+
+    # ------------------------------------------------------------------
+    def create(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            self._pending.pop(job_id, None)
+            self._write([(job_id, fields)], replace=True)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            merged = self._pending.pop(job_id, {})
+            merged.update(fields)
+            self._write([(job_id, merged)])
+
+    def progress(self, job_id: str, **fields: Any) -> None:
+        if self.flush_interval <= 0:
+            self.update(job_id, **fields)
+            return
+        with self._lock:
+            self._pending.setdefault(job_id, {}).update(fields)
+            self._ensure_flusher()
+        self._wake.set()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._write(pending.items())
+
+    def get(self, job_id: str) -> Optional[JobState]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            pending = self._pending.get(job_id)
+            if row is None and pending is None:
+                return None
+            state: JobState = json.loads(row[0]) if row is not None else {}
+            if pending:
+                state.update(pending)
+        return state
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            pending = self._pending.pop(job_id, None)
+            deleted = self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)).rowcount
+        return bool(deleted) or pending is not None
+
+    # ------------------------------------------------------------------
+    def recover(self) -> Dict[str, int]:
+        summary = {"failed": 0, "available": 0, "purged": 0}
+        cutoff = time.time() - _env_float("COBRANZA_JOB_RETENTION_DAYS", DEFAULT_RETENTION_DAYS) * 86400
+        marks = ", ".join("?" for _ in ACTIVE_STATUSES)
+        with self._lock:
+            summary["purged"] = self._conn.execute(
+                f"DELETE FROM jobs WHERE status NOT IN ({marks}) AND updated_at < ?",
+                (*ACTIVE_STATUSES, cutoff),
+            ).rowcount
+            orphans = [
+                job_id
+                for job_id, owner in self._conn.execute(
+                    f"SELECT job_id, owner FROM jobs WHERE status IN ({marks})", ACTIVE_STATUSES,
+                ).fetchall()
+                if owner != self._pid and not pid_alive(owner)
+            ]
+            self._write(
+                (job_id, {"status": "error", "pct": 100, "msg": RECOVERED_MSG, "recovered": True})
+                for job_id in orphans
+            )
+            summary["failed"] = len(orphans)
+            for (data,) in self._conn.execute("SELECT data FROM jobs WHERE status = 'done'"):
+                if _outputs_exist(json.loads(data)):
+                    summary["available"] += 1
+        if any(summary.values()):
+            logger.info(
+                "Job store recovered: %d interrupted, %d with outputs, %d purged",
+                summary["failed"], summary["available"], summary["purged"],
+            )
+        return summary
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._conn.close()
+
+
+_store: Optional[JobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Almacén del proceso según COBRANZA_JOB_STORE (se crea al primer uso)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            kind = os.getenv("COBRANZA_JOB_STORE", "sqlite").strip().lower()
+            if kind == "memory":
+                _store = MemoryJobStore()
+            else:
+                try:
+                    _store = SqliteJobStore(job_db_path())
+                except (sqlite3.Error, OSError) as exc:
+                    # Sin base utilizable la app sigue funcionando, sin persistencia
+                    logger.error("Job store unavailable (%s); using in-memory store", exc)
+                    _store = MemoryJobStore()
+        return _store
+
+
+def set_job_store(store: Optional[JobStore]) -> Optional[JobStore]:
+    """Reemplaza el almacén (p.ej. ``MemoryJobStore()`` en pruebas); devuelve el anterior."""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
+
+
+def close_job_store() -> None:
+    """Escribe el progreso pendiente y cierra la base (al apagar la app)."""
+    store = set_job_store(None)
+    if store is not None:
+        store.close()
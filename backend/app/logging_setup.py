@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+logging_setup.py
+----------------
+Subsistema único de logging para la app y los lanzadores:
+- los hilos que loguean sólo encolan (QueueHandler); la escritura a disco la
+  hace un QueueListener en segundo plano,
+- rotación por tamaño (por defecto) o por tiempo,
+- salida JSON por línea con request_id / job_id tomados del contexto.
+
+Un solo proceso escribe cada archivo: los procesos hijos (varios procesos
+de uvicorn con COBRANZA_WORKERS, trabajadores de Excel en modo process)
+escriben en ``cobranza.<pid>.log`` junto al principal. En Windows la
+rotación falla si otro proceso tiene el archivo abierto, y las líneas de
+varios procesos se mezclarían. El proceso principal borra al arrancar los
+logs de hijos sin cambios en COBRANZA_LOG_CHILD_DAYS días (7).
+
+Variables de entorno:
+  COBRANZA_LOG_DIR, COBRANZA_LOG_FILE (cobranza.log), COBRANZA_LOG_LEVEL (INFO),
+  COBRANZA_LOG_ROTATION (size|time), COBRANZA_LOG_MAX_BYTES (5 MB),
+  COBRANZA_LOG_BACKUPS (5), COBRANZA_LOG_WHEN (midnight),
+  COBRANZA_LOG_CHILD_DAYS (7).
+"""
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("cobranza_request_id", default=None)
+job_id_var: ContextVar[Optional[str]] = ContextVar("cobranza_job_id", default=None)
+
+# Loggers que se enrutan al archivo común
+ROUTED_LOGGERS = ("cobranza", "uvicorn.error")
+DEFAULT_CHILD_LOG_DAYS = 7.0
+
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+_configured_path: Optional[Path] = None
+_setup_lock = threading.Lock()
+
+
+def default_log_dir() -> Path:
+    env_dir = os.getenv("COBRANZA_LOG_DIR")
+    if env_dir:
+        return Path(env_dir)
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).resolve().parent
+    return Path(__file__).resolve().parent.parent
+
+
+class _ContextFilter(logging.Filter):
+    """Inyecta request_id / job_id del contexto actual (si no vienen en ``extra``)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        if getattr(record, "job_id", None) is None:
+            record.job_id = job_id_var.get()
+        return True
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """Resuelve mensaje y traceback en el hilo emisor, pero sin mezclarlos."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "job_id": getattr(record, "job_id", None),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key in _STD_ATTRS or key in payload:
+                continue
+            payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def process_log_path(path: Path) -> Path:
+    """``cobranza.log`` en el proceso principal; ``cobranza.<pid>.log`` en un proceso hijo."""
+    if multiprocessing.parent_process() is None:
+        return path
+    return path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}")
+
+
+def prune_child_logs(path: Path, max_age_days: Optional[float] = None) -> int:
+    """Borra los logs de procesos hijos de ``path`` (y sus rotados) sin cambios en ``max_age_days``."""
+    if max_age_days is None:
+        try:
+            max_age_days = float(os.getenv("COBRANZA_LOG_CHILD_DAYS", str(DEFAULT_CHILD_LOG_DAYS)))
+        except ValueError:
+            max_age_days = DEFAULT_CHILD_LOG_DAYS
+    pattern = re.compile(rf"^{re.escape(path.stem)}\.\d+{re.escape(path.suffix)}(\..+)?$")
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    try:
+        candidates = [p for p in path.parent.iterdir() if pattern.match(p.name)]
+    except OSError:
+        return 0
+    for candidate in candidates:
+        try:
+            if candidate.stat().st_mtime < cutoff:
+                candidate.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _file_handler(path: Path) -> logging.Handler:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rotation = os.getenv("COBRANZA_LOG_ROTATION", "size").strip().lower()
+    backups = int(os.getenv("COBRANZA_LOG_BACKUPS", "5"))
+    if rotation == "time":
+        handler: logging.Handler = logging.handlers.TimedRotatingFileHandler(
+            str(path),
+            when=os.getenv("COBRANZA_LOG_WHEN", "midnight"),
+            backupCount=backups,
+            encoding="utf-8",
+            delay=True,
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            str(path),
+            maxBytes=int(os.getenv("COBRANZA_LOG_MAX_BYTES", str(5 * 1024 * 1024))),
+            backupCount=backups,
+            encoding="utf-8",
+            delay=True,
+        )
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def configure_logging(log_file: Optional[Path] = None) -> Path:
+    """
+    Configura (una sola vez por proceso) el logging no bloqueante.
+    Devuelve la ruta del archivo de log efectivo.
+    """
+    global _listener, _queue_handler, _configured_path
+    with _setup_lock:
+        if _listener is not None and _configured_path is not None:
+            return _configured_path
+
+        path = process_log_path(log_file or default_log_dir() / os.getenv("COBRANZA_LOG_FILE", "cobranza.log"))
+        try:
+            target = _file_handler(path)
+        except OSError:
+            # Carpeta sin permisos (p.ej. Program Files): usar %TEMP%
+            import tempfile
+
+            path = Path(tempfile.gettempdir()) / path.name
+            target = _file_handler(path)
+        if multiprocessing.parent_process() is None:
+            prune_child_logs(path)
+
+        q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        queue_handler = _ContextQueueHandler(q)
+        queue_handler.addFilter(_ContextFilter())
+
+        level = getattr(logging, os.getenv("COBRANZA_LOG_LEVEL", "INFO").upper(), logging.INFO)
+        for name in ROUTED_LOGGERS:
+            lg = logging.getLogger(name)
+            lg.addHandler(queue_handler)
+            lg.setLevel(level)
+            lg.propagate = False
+
+        _queue_handler = queue_handler
+        _listener = logging.handlers.QueueListener(q, target, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        _configured_path = path
+        return path
+
+
+def shutdown_logging() -> None:
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _queue_handler is not None:
+            for name in ROUTED_LOGGERS:
+                logging.getLogger(name).removeHandler(_queue_handler)
+            _queue_handler = None
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+@contextmanager
+def job_context(job_id: str) -> Iterator[None]:
+    """Asocia ``job_id`` a todos los logs emitidos dentro del bloque."""
+    token = job_id_var.set(job_id)
+    try:
+        yield
+    finally:
+        job_id_var.reset(token)
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import json
 import os
+import shutil
 import sys
 import tempfile
 import threading
 import uuid
+import zipfile
+from contextlib import asynccontextmanager
+from datetime import datetime
 from pathlib import Path
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, List, Optional
 
 import logging
 
@@ -15,87 +20,58 @@ from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Response
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 
+from . import metrics, startup
+from .job_store import ACTIVE_STATUSES, close_job_store, get_job_store
+from .logging_setup import configure_logging, job_context
+from .routers import history as history_router
+from .routers import masters as masters_router
 from .routers import pdf as pdf_router
 from .observability import health_payload, setup_observability
+from .paths import app_path, resolve_default_master
 from .queue_runtime import queue_status_payload
+from .static_serving import SPAStaticFiles
 
-from .services.excel_copy import copy_first_sheet_exact, ExcelCopyError
+from .services.batch_merge import merge_batch, zip_batch_outputs
+from .services.cancellation import CancelToken, JobCancelled
+from .services.excel_copy import ExcelCopyError
+from .services.excel_watchdog import ExcelStageTimeout, sweep_orphan_excel
+from .services.excel_workers import ExcelWorkerError, WorkerTimeout, run_excel_job, shutdown_excel_pool
+from .services.master_registry import MasterNotFound, get_registry
+from .services.pdf_export_service import zip_pdfs
+from .services.preflight import preflight_merge
 
-def app_path(*parts: str) -> Path:
-    """
-    Devuelve la ruta correcta tanto en desarrollo como en ejecutable (PyInstaller).
-    Prioriza la variable de entorno COBRANZA_BASE_DIR si existe (la seteará el launcher).
-    """
-    base_env = os.getenv("COBRANZA_BASE_DIR")
-    if base_env:
-        return Path(base_env).joinpath(*parts)
-    if getattr(sys, "frozen", False):
-        base_root = Path(sys._MEIPASS)  # type: ignore[attr-defined]
-        base = base_root / "app"
-        if not base.exists():
-            base = base_root
-    else:
-        base = Path(__file__).parent
-    return base.joinpath(*parts)
-
-
-def resolve_default_master() -> Path:
-    """
-    Busca la ruta del maestro por defecto con reglas configurables.
-    """
-    env_override = os.getenv("COBRANZA_DEFAULT_MASTER")
-    if env_override:
-        env_path = Path(env_override)
-        if env_path.is_file():
-            return env_path.resolve()
-
-    data_dir = app_path("data")
-    for name in ("COBRANZA-formateado.XLS", "COBRANZA-formateado.xls"):
-        candidate = data_dir / name
-        if candidate.is_file():
-            return candidate.resolve()
-
-    try:
-        for candidate in sorted(data_dir.glob("COBRANZA-formateado.*")):
-            if candidate.is_file():
-                return candidate.resolve()
-    except FileNotFoundError:
-        pass
 
-    return (data_dir / "COBRANZA-formateado.XLS").resolve()
-
-
-# Ruta del maestro por defecto
+# Maestro incluido (el vigente puede cambiarse en /masters/default)
 DEFAULT_MASTER_PATH = resolve_default_master()
 
 logger = logging.getLogger("cobranza.app")
-
-app = FastAPI()
+configure_logging()  # idempotente: los lanzadores ya lo configuran antes (hijos: cobranza.<pid>.log)
+
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    # pywin32/pypdf se cargan en segundo plano: el socket ya puede aceptar conexiones
+    startup.start_prewarm()
+    if SPA_STATIC is not None:
+        # Índice + variantes gzip/br del build; mientras tanto se sirve sin comprimir
+        SPA_STATIC.warm_in_background()
+    # Trabajos de una ejecución anterior: en curso -> error, terminados -> descargables
+    get_job_store().recover()
+    # Excel que quedaron de una ejecución anterior (sin bloquear el arranque)
+    threading.Thread(target=sweep_orphan_excel, name="excel-sweep", daemon=True).start()
+    startup.mark_app_ready()
+    yield
+    shutdown_excel_pool()
+    close_job_store()
+
+
+app = FastAPI(lifespan=_lifespan)
 app.include_router(pdf_router.router)
+app.include_router(masters_router.router)
+app.include_router(history_router.router)
 setup_observability(app)
 
 
-class SPAStaticFiles(StaticFiles):
-    """
-    Variante de StaticFiles que hace fallback a index.html (SPA) ante 404.
-    """
-
-    def __init__(self, *args, spa_index: str = "index.html", **kwargs):
-        self.spa_index = spa_index
-        super().__init__(*args, **kwargs)
-
-    async def get_response(self, path: str, scope):
-        try:
-            return await super().get_response(path, scope)
-        except HTTPException as exc:
-            if exc.status_code == 404 and scope["method"] in ("GET", "HEAD"):
-                try:
-                    return await super().get_response(self.spa_index, scope)
-                except HTTPException:
-                    pass
-            raise
-
-
 def resolve_frontend_dist() -> Optional[Path]:
     """
     Intenta ubicar frontend/dist tanto en dev como en ejecutable (PyInstaller).
@@ -157,30 +133,31 @@ DELETE_ROWS_AFTER_PASTE = 6
 
 
 # -------------------------------------------------
-#            GESTIÓN DE PROGRESO (MEMORIA)
+#            GESTIÓN DE PROGRESO (JobStore)
 # -------------------------------------------------
-class ProgressState(Dict[str, object]):
-    pass
-
-
-_progress: Dict[str, ProgressState] = {}
-_progress_lock = threading.Lock()
-
-
 def _set_progress(
     job_id: str,
     pct: int,
     msg: str,
     status: str = "running",
     out_path: Optional[str] = None,
+    report: Optional[Dict[str, object]] = None,
+    pdf_zip: Optional[str] = None,
+    **extra: object,
 ):
-    with _progress_lock:
-        st: ProgressState = _progress.setdefault(job_id, ProgressState())
-        st["pct"] = int(max(0, min(100, pct)))
-        st["msg"] = msg
-        st["status"] = status
-        if out_path is not None:
-            st["out_path"] = out_path
+    """
+    Avance del trabajo. Mientras sigue en curso sin resultados nuevos se
+    guarda diferido (sólo cuenta el último aviso); el resto se guarda ya.
+    """
+    fields: Dict[str, object] = {"pct": int(max(0, min(100, pct))), "msg": msg, "status": status}
+    results = {"out_path": out_path, "report": report, "pdf_zip": pdf_zip}
+    fields.update({k: v for k, v in results.items() if v is not None})
+    fields.update(extra)
+    store = get_job_store()
+    if status == "running" and all(v is None for v in results.values()):
+        store.progress(job_id, **fields)
+    else:
+        store.update(job_id, **fields)
 
 
 def _progress_cb_factory(job_id: str) -> Callable[[int, str], None]:
@@ -189,6 +166,71 @@ def _progress_cb_factory(job_id: str) -> Callable[[int, str], None]:
     return cb
 
 
+# Tokens de los trabajos de este proceso. Un DELETE atendido por otro
+# proceso de uvicorn marca ``cancel_requested`` en el JobStore y el token
+# del dueño lo lee (como mucho cada medio segundo).
+_cancel_tokens: Dict[str, CancelToken] = {}
+_cancel_lock = threading.Lock()
+
+
+def _register_job(job_id: str, **fields: object) -> CancelToken:
+    """Registra el trabajo en cola (aún sin Excel) y devuelve su token de cancelación."""
+    token = CancelToken(probe=lambda: bool((get_job_store().get(job_id) or {}).get("cancel_requested")))
+    with _cancel_lock:
+        _cancel_tokens[job_id] = token
+    get_job_store().create(job_id, pct=0, msg="En cola…", status="queued", **fields)
+    return token
+
+
+def _release_job(job_id: str) -> None:
+    with _cancel_lock:
+        _cancel_tokens.pop(job_id, None)
+
+
+def _remove_job_files(st: Dict[str, object]) -> None:
+    """Borra los resultados de un trabajo (y sus carpetas temporales ``cobranza_*``)."""
+    paths = [st.get("out_path"), st.get("pdf_zip")]
+    outputs = st.get("outputs")
+    if isinstance(outputs, dict):
+        paths.extend(outputs.values())
+    tmp_root = os.path.normcase(os.path.abspath(tempfile.gettempdir()))
+    for p in paths:
+        if not isinstance(p, str):
+            continue
+        parent = os.path.dirname(os.path.abspath(p))
+        if (
+            os.path.normcase(os.path.dirname(parent)) == tmp_root
+            and os.path.basename(parent).startswith("cobranza_")
+        ):
+            shutil.rmtree(parent, ignore_errors=True)
+        else:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+def _parse_dates(value: Optional[str]) -> List[str]:
+    """'["2026-01-31", ...]' o '2026-01-31,2026-02-28' -> fechas ISO validadas, sin repetir."""
+    if not value or not value.strip():
+        return []
+    raw = value.strip()
+    try:
+        items = json.loads(raw) if raw.startswith("[") else raw.split(",")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"hdr_dates inválido: {exc}")
+    dates: List[str] = []
+    for item in items:
+        iso = str(item).strip()
+        try:
+            datetime.strptime(iso, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Fecha inválida (se espera YYYY-MM-DD): {iso}")
+        if iso not in dates:
+            dates.append(iso)
+    return dates
+
+
 def _save_upload_to_tmp(upload: UploadFile) -> str:
     if upload is None:
         raise HTTPException(status_code=400, detail="Archivo no recibido.")
@@ -205,25 +247,92 @@ def _worker(
     mst_path: str,
     hdr_date: Optional[str],
     desired_name: Optional[str] = None,
+    pdf_options: Optional[Dict[str, object]] = None,
+    hdr_dates: Optional[List[str]] = None,
+    cancel: Optional[CancelToken] = None,
 ) -> None:
     """Hilo que ejecuta el copiado y va reportando progreso."""
+    with job_context(job_id):
+        try:
+            if hdr_dates:
+                _run_merge_dates_job(job_id, src_path, mst_path, hdr_dates, desired_name, cancel)
+            else:
+                _run_merge_job(job_id, src_path, mst_path, hdr_date, desired_name, pdf_options, cancel)
+        finally:
+            _release_job(job_id)
+
+
+def _fail_job(job_id: str, exc: Exception) -> None:
+    if isinstance(exc, JobCancelled):
+        logger.info("Job cancelled: %s", exc)
+        _set_progress(job_id, 100, "Cancelado.", status="cancelled")
+    elif isinstance(exc, (ExcelStageTimeout, WorkerTimeout)):
+        logger.error("Merge job timed out: %s", exc)
+        _set_progress(job_id, 100, f"Tiempo agotado: {exc}", status="timeout")
+    elif isinstance(exc, ExcelCopyError):
+        logger.error("Merge job failed (Excel): %s", exc)
+        _set_progress(job_id, 100, f"Error de Excel: {exc}", status="error")
+    elif isinstance(exc, ExcelWorkerError):
+        logger.error("Merge job failed (worker): %s", exc)
+        _set_progress(job_id, 100, f"Error del proceso de Excel: {exc}", status="error")
+    else:
+        logger.exception("Merge job failed: %s", exc)
+        _set_progress(job_id, 100, f"Error: {exc}", status="error")
+
+
+def _result_name(desired_name: Optional[str], iso_date: Optional[str] = None) -> str:
+    """Nombre base del archivo de origen (.xls si no trae extensión), con la fecha si se indica."""
+    base = os.path.basename(desired_name or "").strip() or "COBRANZA.xls"
+    root, ext = os.path.splitext(base)
+    ext = ext or ".xls"
+    return f"{root}_{iso_date}{ext}" if iso_date else root + ext
+
+
+def _run_merge_job(
+    job_id: str,
+    src_path: str,
+    mst_path: str,
+    hdr_date: Optional[str],
+    desired_name: Optional[str],
+    pdf_options: Optional[Dict[str, object]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> None:
+    """
+    Con ``pdf_options`` (hoja_base, orden_ids, excluir_ids) el mismo trabajo
+    exporta además los PDFs por vendedor sobre el libro recién guardado y los
+    deja en un ZIP descargable con /download/{job_id}?part=pdfs.
+    """
+    pdf_dir: Optional[str] = None
     try:
         cb = _progress_cb_factory(job_id)
-        _set_progress(job_id, 1, "Preparando archivos…", status="running")
-        out_path = copy_first_sheet_exact(
-            src_path,
-            mst_path,
-            header_date=hdr_date,                       # <- recibe 'hdr_date'
-            delete_first_rows=DELETE_ROWS_AFTER_PASTE,  # <- 6 filas
-            progress_cb=cb,
-        )
+        payload: Dict[str, object] = {
+            "source_xls_path": src_path,
+            "master_xls_path": mst_path,
+            "header_date": hdr_date,                        # <- recibe 'hdr_date'
+            "delete_first_rows": DELETE_ROWS_AFTER_PASTE,   # <- 6 filas
+            "source_name": desired_name,
+        }
+        if pdf_options is not None:
+            pdf_dir = tempfile.mkdtemp(prefix="cobranza_pdf_")
+            payload.update(pdf_options, out_dir=pdf_dir)
+        result = run_excel_job("merge_export" if pdf_dir else "merge", payload, progress_cb=cb, cancel=cancel)
+        out_path = result["out_path"]
+        report = result["report"]
+        pdf_zip: Optional[str] = None
+        if pdf_dir is not None:
+            files = [Path(p) for p in result["files"]]
+            if files:
+                stem = Path(os.path.basename(desired_name or "") or "COBRANZA").stem
+                pdf_zip = os.path.join(pdf_dir, f"PDFS_{stem}.zip")
+                zip_pdfs(files, pdf_zip)
+                for f in files:
+                    f.unlink(missing_ok=True)
+            else:
+                logger.warning("Merge+PDF job produced no PDFs")
         # --- Normalizar nombre final al del archivo de origen (sin prefijos) ---
         if desired_name:
             # Asegura sólo el nombre base y extensión .xls si faltara
-            base = os.path.basename(desired_name).strip() or "COBRANZA.xls"
-            root, ext = os.path.splitext(base)
-            if not ext:
-                base = root + ".xls"
+            base = _result_name(desired_name)
             target = os.path.join(os.path.dirname(out_path), base)
             try:
                 if os.path.normcase(os.path.basename(out_path)) != os.path.normcase(base):
@@ -232,20 +341,103 @@ def _worker(
             except Exception as e:
                 # No es fatal; seguimos con el path original
                 _set_progress(job_id, 95, f"No se pudo renombrar el archivo: {e}", status="running")
-        _set_progress(job_id, 100, "Completado.", status="done", out_path=out_path)
-    except ExcelCopyError as e:
-        _set_progress(job_id, 100, f"Error de Excel: {e}", status="error")
+        _set_progress(job_id, 100, "Completado.", status="done", out_path=out_path, report=report, pdf_zip=pdf_zip)
+        logger.info("Merge job finished: %s", out_path, extra={"stages_ms": report["stages_ms"]})
     except Exception as e:
-        _set_progress(job_id, 100, f"Error: {e}", status="error")
+        if isinstance(e, JobCancelled) and pdf_dir is not None:
+            shutil.rmtree(pdf_dir, ignore_errors=True)
+        _fail_job(job_id, e)
     finally:
-        # Limpieza de temporales subidos
-        abs_default = os.path.abspath(str(DEFAULT_MASTER_PATH))
-        for p in (src_path, mst_path):
+        _cleanup_uploads(src_path, mst_path)
+
+
+def _run_merge_dates_job(
+    job_id: str,
+    src_path: str,
+    mst_path: str,
+    hdr_dates: List[str],
+    desired_name: Optional[str],
+    cancel: Optional[CancelToken] = None,
+) -> None:
+    """
+    Un merge y un .xls por fecha (sólo cambia fecha/título). Cada archivo se
+    descarga con /download/{job_id}?date=YYYY-MM-DD y todos juntos en un ZIP
+    con /download/{job_id}.
+    """
+    try:
+        cb = _progress_cb_factory(job_id)
+        result = run_excel_job(
+            "merge_dates",
+            {
+                "source_xls_path": src_path,
+                "master_xls_path": mst_path,
+                "header_dates": hdr_dates,
+                "delete_first_rows": DELETE_ROWS_AFTER_PASTE,
+                "source_name": desired_name,
+            },
+            progress_cb=cb,
+            cancel=cancel,
+        )
+        report = result["report"]
+        outputs: Dict[str, str] = {}
+        for iso, path in result["outputs"]:
+            target = os.path.join(os.path.dirname(path), _result_name(desired_name, iso))
             try:
-                if p and os.path.isfile(p) and os.path.abspath(p) != abs_default:
-                    os.remove(p)
-            except Exception:
-                pass
+                os.replace(path, target)
+                path = target
+            except OSError as e:
+                logger.warning("Could not rename %s: %s", path, e)
+            outputs[iso] = path
+
+        first = next(iter(outputs.values()))
+        root = os.path.splitext(_result_name(desired_name))[0]
+        zip_path = os.path.join(os.path.dirname(first), f"{root}_FECHAS.zip")
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for path in outputs.values():
+                zf.write(path, arcname=os.path.basename(path))
+
+        _set_progress(job_id, 100, "Completado.", status="done", out_path=zip_path, report=report, outputs=outputs)
+        logger.info("Multi-date merge job finished: %d files", len(outputs), extra={"stages_ms": report["stages_ms"]})
+    except Exception as e:
+        _fail_job(job_id, e)
+    finally:
+        _cleanup_uploads(src_path, mst_path)
+
+
+def _cleanup_uploads(*paths: Optional[str]) -> None:
+    """Limpieza de temporales subidos (nunca el maestro incluido ni los del registro)."""
+    abs_default = os.path.abspath(str(DEFAULT_MASTER_PATH))
+    registry = get_registry()
+    for p in paths:
+        try:
+            if p and os.path.isfile(p) and os.path.abspath(p) != abs_default and not registry.contains(p):
+                os.remove(p)
+        except Exception:
+            pass
+
+
+def _resolve_master_path(
+    master: Optional[UploadFile],
+    use_default_master: int,
+    master_id: Optional[str],
+) -> str:
+    """Maestro del merge: ``master_id`` del registro, el por defecto vigente o el subido."""
+    if master_id:
+        try:
+            return str(get_registry().path_for(master_id))
+        except MasterNotFound:
+            raise HTTPException(status_code=404, detail=f"No existe el maestro {master_id}.")
+    if use_default_master:
+        path = get_registry().default_path()
+        if not path.exists():
+            raise HTTPException(status_code=500, detail="No se encuentra el maestro por defecto en app/data.")
+        return str(path)
+    if master is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Sube un maestro o activa 'Usar maestro por defecto'."
+        )
+    return _save_upload_to_tmp(master)
 
 
 # -------------------------------------------------
@@ -256,31 +448,51 @@ def start_merge(
     source: UploadFile = File(...),
     master: Optional[UploadFile] = File(default=None),
     hdr_date: Optional[str] = Form(None),
+    hdr_dates: Optional[str] = Form(None),
     use_default_master: int = Form(0),
+    master_id: Optional[str] = Form(None),
+    preflight: int = Form(0),
+    export_pdfs: int = Form(0),
+    hoja_base: Optional[str] = Form(None),
+    orden: Optional[str] = Form(None),
+    excluir: Optional[str] = Form(None),
 ):
 
     """
     Inicia el copiado en un hilo. Guarda el nombre ORIGINAL del archivo de
     origen para usarlo al descargar en /download/{job_id}.
+    Con ``preflight=1`` valida antes el origen sin Excel y responde 422 si
+    no es el archivo esperado.
+    Con ``export_pdfs=1`` el mismo trabajo exporta también los PDFs por
+    vendedor (``hoja_base``, ``orden`` y ``excluir`` como en /pdf/export-upload).
+    Con ``hdr_dates`` (lista JSON o separada por comas de fechas ISO) se
+    genera un .xls por fecha desde un solo merge.
+    Con ``master_id`` se usa un maestro del registro (/masters) sin subirlo.
     """
     orig_name = source.filename or "COBRANZA.xls"
+    dates = _parse_dates(hdr_dates)
+    if len(dates) == 1:
+        hdr_date, dates = dates[0], []
+    if dates and export_pdfs:
+        raise HTTPException(status_code=400, detail="hdr_dates con varias fechas no se combina con export_pdfs.")
+    pdf_options: Optional[Dict[str, object]] = None
+    if export_pdfs:
+        try:
+            pdf_options = {
+                "hoja_base": hoja_base,
+                "orden_ids": pdf_router._parse_json_list(orden),
+                "excluir_ids": pdf_router._parse_json_list(excluir),
+            }
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
 
     try:
         src_path = _save_upload_to_tmp(source)
-
-        if use_default_master:
-            # Usar el maestro alojado
-            if not DEFAULT_MASTER_PATH.exists():
-                raise HTTPException(status_code=500, detail="No se encuentra el maestro por defecto en app/data.")
-            mst_path = str(DEFAULT_MASTER_PATH)
-        else:
-            # Requiere archivo maestro subido por el usuario
-            if master is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Sube un maestro o activa 'Usar maestro por defecto'."
-                )
-            mst_path = _save_upload_to_tmp(master)
+        try:
+            mst_path = _resolve_master_path(master, use_default_master, master_id)
+        except HTTPException:
+            _cleanup_uploads(src_path)
+            raise
 
     finally:
         try:
@@ -293,56 +505,223 @@ def start_merge(
         except Exception:
             pass
     
+    if preflight:
+        try:
+            check = preflight_merge(src_path, mst_path)
+        except Exception:
+            _cleanup_uploads(src_path, mst_path)
+            raise
+        if check["parsed"] and not check["ok"]:
+            _cleanup_uploads(src_path, mst_path)
+            return JSONResponse({"detail": "Validación previa fallida.", "preflight": check}, status_code=422)
+
     # --- Preparar hilo y devolver job_id (ESTO DEBE ESTAR DENTRO DEL ENDPOINT) ---
     job_id = uuid.uuid4().hex[:12]
-    with _progress_lock:
-        st: ProgressState = _progress.setdefault(job_id, ProgressState())
-        st["orig_name"] = orig_name
-
-    _set_progress(job_id, 0, "Iniciando…", status="running")
+    cancel = _register_job(job_id, orig_name=orig_name)
     t = threading.Thread(
         target=_worker,
-        args=(job_id, src_path, mst_path, hdr_date, orig_name),  # <- pasamos el nombre deseado
+        args=(job_id, src_path, mst_path, hdr_date, orig_name, pdf_options, dates, cancel),  # <- pasamos el nombre deseado
         daemon=True,
     )
     t.start()
     return {"job_id": job_id}
 
 
+@app.post("/batch-merge")
+def start_batch_merge(
+    sources: List[UploadFile] = File(...),
+    master: Optional[UploadFile] = File(default=None),
+    hdr_date: Optional[str] = Form(None),
+    use_default_master: int = Form(1),
+    master_id: Optional[str] = Form(None),
+    workers: Optional[int] = Form(None),
+):
+    """
+    Merge de varios archivos de origen contra el mismo maestro en un solo
+    trabajo (una sesión de Excel, o repartido en el pool en modo proceso).
+    El progreso por archivo está en /progress/{job_id} (``files``) y el ZIP
+    con los resultados en /download/{job_id}.
+    """
+    if not sources:
+        raise HTTPException(status_code=400, detail="No se recibieron archivos de origen.")
+    saved: List[tuple[str, str]] = []
+    mst_path: Optional[str] = None
+    try:
+        for upload in sources:
+            saved.append((_save_upload_to_tmp(upload), upload.filename or "COBRANZA.xls"))
+        mst_path = _resolve_master_path(master, use_default_master, master_id)
+    except Exception:
+        _cleanup_uploads(*(path for path, _ in saved))
+        raise
+    finally:
+        for upload in [*sources, master]:
+            try:
+                if upload is not None:
+                    upload.file.close()
+            except Exception:
+                pass
+
+    job_id = uuid.uuid4().hex[:12]
+    zip_name = f"COBRANZA_LOTE_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    cancel = _register_job(job_id, orig_name=zip_name)
+    t = threading.Thread(
+        target=_batch_worker,
+        args=(job_id, saved, mst_path, hdr_date, zip_name, workers, cancel),
+        daemon=True,
+    )
+    t.start()
+    return {"job_id": job_id, "files": len(saved)}
+
+
+def _batch_worker(
+    job_id: str,
+    sources: List[tuple[str, str]],
+    mst_path: str,
+    hdr_date: Optional[str],
+    zip_name: str,
+    workers: Optional[int],
+    cancel: Optional[CancelToken] = None,
+) -> None:
+    with job_context(job_id):
+        out_dir: Optional[str] = None
+        try:
+            def cb(pct: int, msg: str, files: List[Dict[str, object]]) -> None:
+                _set_progress(job_id, min(pct, 99), msg, status="running", files=files)
+
+            out_dir = tempfile.mkdtemp(prefix="cobranza_batch_")
+            summary = merge_batch(
+                sources, mst_path, out_dir,
+                header_date=hdr_date,
+                delete_first_rows=DELETE_ROWS_AFTER_PASTE,
+                progress_cb=cb,
+                workers=workers,
+                cancel=cancel,
+            )
+            get_job_store().update(
+                job_id,
+                files=summary["files"],
+                batch={k: v for k, v in summary.items() if k not in ("files", "out_dir")},
+            )
+            logger.info(
+                "Batch merge finished: %d/%d ok, %.2f files/min",
+                summary["ok"], summary["total"], summary["files_per_min"],
+            )
+            if not summary["ok"]:
+                _set_progress(job_id, 100, "Ningún archivo del lote se pudo procesar.", status="error")
+                return
+            zip_path = os.path.join(out_dir, zip_name)
+            zip_batch_outputs(summary, zip_path)
+            msg = f"Completado: {summary['ok']}/{summary['total']} archivos."
+            _set_progress(job_id, 100, msg, status="done", out_path=zip_path)
+        except Exception as e:
+            if isinstance(e, JobCancelled) and out_dir is not None:
+                shutil.rmtree(out_dir, ignore_errors=True)
+            _fail_job(job_id, e)
+        finally:
+            _release_job(job_id)
+            _cleanup_uploads(mst_path, *(path for path, _ in sources))
+
+
+@app.post("/merge/preflight")
+def merge_preflight(
+    source: UploadFile = File(...),
+    master: Optional[UploadFile] = File(default=None),
+    use_default_master: int = Form(1),
+    master_id: Optional[str] = Form(None),
+):
+    """
+    Valida el origen contra el maestro sin abrir Excel (lector BIFF):
+    vendedores encontrados, sin destino, faltantes y totales.
+    """
+    src_path = _save_upload_to_tmp(source)
+    mst_path: Optional[str] = None
+    try:
+        mst_path = _resolve_master_path(master, use_default_master or master is None, master_id)
+        return preflight_merge(src_path, mst_path)
+    finally:
+        _cleanup_uploads(src_path, mst_path)
+
+
 @app.get("/progress/{job_id}")
 def get_progress(job_id: str):
-    with _progress_lock:
-        st = _progress.get(job_id)
-        if not st:
-            return JSONResponse(
-                {"pct": 0, "msg": "No existe el proceso.", "status": "unknown"},
-                status_code=404,
-            )
-        return st
+    st = get_job_store().get(job_id)
+    if not st:
+        return JSONResponse(
+            {"pct": 0, "msg": "No existe el proceso.", "status": "unknown"},
+            status_code=404,
+        )
+    return st
 
 
-@app.get("/download/{job_id}")
-def download(job_id: str):
-    with _progress_lock:
-        st = _progress.get(job_id)
-        if not st:
-            raise HTTPException(status_code=404, detail="Proceso no encontrado.")
-        if st.get("status") != "done":
-            raise HTTPException(status_code=409, detail="El proceso aún no ha finalizado.")
+@app.delete("/jobs/{job_id}")
+def delete_job(job_id: str):
+    """
+    Trabajo en cola o en curso: pide la cancelación y responde 202; el estado
+    pasa a ``cancelled`` cuando se detiene (los de la cola nunca abren Excel;
+    los en curso paran entre etapas, cierran sus libros sin guardar y borran
+    sus temporales). Trabajo terminado: borra sus archivos y el registro.
+    """
+    store = get_job_store()
+    st = store.get(job_id)
+    if not st:
+        raise HTTPException(status_code=404, detail="Proceso no encontrado.")
+    if st.get("status") in ACTIVE_STATUSES:
+        store.update(job_id, cancel_requested=True, msg="Cancelando…")
+        with _cancel_lock:
+            token = _cancel_tokens.get(job_id)
+        if token is not None:
+            token.cancel()
+        return JSONResponse({"job_id": job_id, "status": "cancelling"}, status_code=202)
+    _remove_job_files(st)
+    store.delete(job_id)
+    return {"job_id": job_id, "deleted": True}
 
-        out_path_obj = st.get("out_path")
-        if not isinstance(out_path_obj, str) or not os.path.isfile(out_path_obj):
-            raise HTTPException(status_code=404, detail="Archivo no disponible.")
-        out_path: str = out_path_obj
-
-        # ← aquí está el fix de tipado
-        fname_obj = st.get("orig_name")
-        if isinstance(fname_obj, str) and fname_obj.strip():
-            # asegúrate de que sea solo el nombre base
-            fname: str = os.path.basename(fname_obj.strip())
-        else:
-            fname = os.path.basename(out_path)
 
+@app.get("/download/{job_id}")
+def download(job_id: str, part: str = "xls", date: Optional[str] = None):
+    """
+    ``part=xls`` (por defecto) el libro resultante; ``part=pdfs`` el ZIP de PDFs.
+    En trabajos con varias fechas ``date=YYYY-MM-DD`` elige un .xls y sin
+    ``date`` se descarga el ZIP con todos.
+    """
+    st = get_job_store().get(job_id)
+    if not st:
+        raise HTTPException(status_code=404, detail="Proceso no encontrado.")
+    if st.get("status") != "done":
+        raise HTTPException(status_code=409, detail="El proceso aún no ha finalizado.")
+
+    if part == "pdfs":
+        zip_obj = st.get("pdf_zip")
+        if not isinstance(zip_obj, str) or not os.path.isfile(zip_obj):
+            raise HTTPException(status_code=404, detail="PDFs no disponibles para este proceso.")
+        zip_path: str = zip_obj
+    elif part != "xls":
+        raise HTTPException(status_code=400, detail="part debe ser 'xls' o 'pdfs'.")
+
+    outputs = st.get("outputs")
+    if date is not None:
+        if not isinstance(outputs, dict) or date not in outputs:
+            raise HTTPException(status_code=404, detail=f"No hay archivo para la fecha {date}.")
+        out_path_obj = outputs[date]
+    else:
+        out_path_obj = st.get("out_path")
+    if not isinstance(out_path_obj, str) or not os.path.isfile(out_path_obj):
+        raise HTTPException(status_code=404, detail="Archivo no disponible.")
+    out_path: str = out_path_obj
+    if out_path.lower().endswith(".zip"):
+        # Trabajos con varios resultados (fechas, lotes): ZIP con todos
+        zip_path = out_path
+        part = "zip"
+
+    # ← aquí está el fix de tipado
+    fname_obj = st.get("orig_name")
+    fname: str = os.path.basename(out_path)
+    if date is None and isinstance(fname_obj, str) and fname_obj.strip():
+        # asegúrate de que sea solo el nombre base
+        fname = os.path.basename(fname_obj.strip())
+
+    if part in ("pdfs", "zip"):
+        return FileResponse(zip_path, filename=os.path.basename(zip_path), media_type="application/zip")
     return FileResponse(out_path, filename=fname, media_type="application/vnd.ms-excel")
 
 
@@ -355,6 +734,7 @@ def merge_compat(
     master: Optional[UploadFile] = File(default=None),
     hdr_date: Optional[str] = Form(None),
     use_default_master: int = Form(0),
+    master_id: Optional[str] = Form(None),
 ):
 
     """
@@ -365,29 +745,26 @@ def merge_compat(
 
     try:
         src_path = _save_upload_to_tmp(source)
-        if use_default_master:
-            mst_path = str(DEFAULT_MASTER_PATH)
-        else:
-            if master is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Sube un maestro o activa 'Usar maestro por defecto'."
-                )
-            mst_path = _save_upload_to_tmp(master)
-        
-        out_path = copy_first_sheet_exact(
-            src_path,
-            mst_path,
-            header_date=hdr_date,                       # <- recibe 'hdr_date'
-            delete_first_rows=DELETE_ROWS_AFTER_PASTE,  # <- 6 filas
-            progress_cb=None,
-        )
+        mst_path = _resolve_master_path(master, use_default_master, master_id)
+
+        out_path = run_excel_job(
+            "merge",
+            {
+                "source_xls_path": src_path,
+                "master_xls_path": mst_path,
+                "header_date": hdr_date,                        # <- recibe 'hdr_date'
+                "delete_first_rows": DELETE_ROWS_AFTER_PASTE,   # <- 6 filas
+                "source_name": orig_name,
+            },
+        )["out_path"]
         # Descargar con el **nombre original** del archivo de origen (nombre base)
         return FileResponse(
             out_path,
             filename=os.path.basename(orig_name.strip() or "COBRANZA.xls"),
             media_type="application/vnd.ms-excel",
         )
+    except HTTPException:
+        raise
     except ExcelCopyError as e:
         raise HTTPException(status_code=500, detail=f"Error de Excel: {e}")
     except Exception as e:
@@ -405,12 +782,17 @@ def merge_compat(
 
 @app.get("/master/default-info")
 def master_default_info():
-    path = Path(DEFAULT_MASTER_PATH)
+    registry = get_registry()
+    path = registry.default_path()
     exists = path.is_file()
     payload: Dict[str, Optional[str] | bool] = {
         "exists": exists,
         "name": path.name if exists else None,
+        "master_id": registry.default_id,
     }
+    if registry.default_id is not None and exists:
+        # Nombre con el que se subió (el archivo del registro se llama <id>.xls)
+        payload["name"] = registry.get(registry.default_id).name
     if os.getenv("COBRANZA_DEBUG") == "1":
         payload["debug_path"] = str(path)
     return payload
@@ -421,24 +803,60 @@ def health():
     return health_payload()
 
 
+@app.get("/metrics")
+def metrics_snapshot():
+    """
+    Contadores y tiempos de la app y de los trabajadores de Excel (p.ej.
+    ``write_plan.*``). Con varios procesos de uvicorn son los del proceso
+    que atiende (``pid``).
+    """
+    return {**metrics.snapshot(), "pid": os.getpid()}
+
+
 @app.get("/queue/status")
 def queue_status():
     return queue_status_payload()
 
 
+@app.get("/diagnostics/startup")
+def diagnostics_startup(importtime: int = 0):
+    """Hitos de arranque, precalentamiento y (opcional) reporte -X importtime."""
+    return startup.startup_payload(include_importtime=bool(importtime))
+
+
+@app.post("/diagnostics/paste-check")
+def diagnostics_paste_check(source: UploadFile = File(...)):
+    """
+    Verifica la transferencia sin portapapeles contra el pegado clásico
+    (valores, formatos, fuentes, rellenos, bordes, combinadas y anchos).
+    """
+    src_path = _save_upload_to_tmp(source)
+    try:
+        return run_excel_job("verify_transfer", {"xls_path": src_path})
+    except (ExcelCopyError, ExcelWorkerError) as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        try:
+            os.remove(src_path)
+        except Exception:
+            pass
+
+
 # -------------------------------------------------
 #              SPA / FRONTEND STATIC BUILD
 # -------------------------------------------------
 SPA_ROOT_DIR: Optional[Path] = None
+SPA_STATIC: Optional[SPAStaticFiles] = None
 for candidate in (FRONTEND_DIST_PATH, LEGACY_STATIC_PATH):
     if candidate and candidate.exists():
         SPA_ROOT_DIR = candidate
         break
 
 if SPA_ROOT_DIR is not None:
+    SPA_STATIC = SPAStaticFiles(directory=str(SPA_ROOT_DIR), html=True)
     app.mount(
         "/",
-        SPAStaticFiles(directory=str(SPA_ROOT_DIR), html=True),
+        SPA_STATIC,
         name="frontend-app",
     )
 else:
@@ -459,3 +877,5 @@ if (
         name="legacy-ui",
     )
 
+startup.mark("app_imported")
+
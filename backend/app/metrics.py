@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py
+----------
+Métricas del proceso (contadores y tiempos) para /metrics.
+
+- ``incr(nombre, n)``: contador.
+- ``observe(nombre, ms)``: tiempo con count/sum/max.
+
+Los trabajadores de Excel (modo ``process``) acumulan en su propio proceso;
+tras cada trabajo envían el delta (``drain``) y el padre lo suma (``merge``),
+así /metrics refleja todos los procesos.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+
+
+def incr(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def observe(name: str, ms: float) -> None:
+    with _lock:
+        t = _timings.setdefault(name, {"count": 0, "sum_ms": 0.0, "max_ms": 0.0})
+        t["count"] += 1
+        t["sum_ms"] = round(t["sum_ms"] + ms, 3)
+        t["max_ms"] = round(max(t["max_ms"], ms), 3)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        timings = {
+            name: {**t, "avg_ms": round(t["sum_ms"] / t["count"], 3) if t["count"] else 0.0}
+            for name, t in _timings.items()
+        }
+        return {"counters": dict(_counters), "timings": timings}
+
+
+def drain() -> Dict[str, Any]:
+    """Devuelve lo acumulado y lo pone a cero (delta para el proceso padre)."""
+    global _counters, _timings
+    with _lock:
+        delta = {"counters": _counters, "timings": _timings}
+        _counters, _timings = {}, {}
+    return delta
+
+
+def merge(delta: Dict[str, Any]) -> None:
+    """Suma un delta de ``drain`` de otro proceso."""
+    with _lock:
+        for name, n in delta.get("counters", {}).items():
+            _counters[name] = _counters.get(name, 0) + n
+        for name, other in delta.get("timings", {}).items():
+            t = _timings.setdefault(name, {"count": 0, "sum_ms": 0.0, "max_ms": 0.0})
+            t["count"] += other["count"]
+            t["sum_ms"] = round(t["sum_ms"] + other["sum_ms"], 3)
+            t["max_ms"] = round(max(t["max_ms"], other["max_ms"]), 3)
+
+
+def reset() -> None:
+    drain()
@@ -7,8 +7,14 @@ from uuid import uuid4
 
 from fastapi import FastAPI, Request
 
+from .logging_setup import request_id_var
+
 logger = logging.getLogger("cobranza.observability")
 
+# Endpoints de alta frecuencia (polling): se loguea 1 de cada N peticiones OK
+DEFAULT_SAMPLED_PATHS = "/progress/,/queue/status,/health"
+SLOW_REQUEST_MS = 1000.0
+
 
 def _env_bool(name: str, default: bool = False) -> bool:
     value = os.getenv(name)
@@ -77,10 +83,30 @@ def _init_otel(app: FastAPI) -> None:
         logger.warning("OpenTelemetry setup skipped: %s", exc)
 
 
+def _sampled_prefixes() -> tuple[str, ...]:
+    raw = os.getenv("COBRANZA_LOG_SAMPLE_PATHS", DEFAULT_SAMPLED_PATHS)
+    return tuple(p.strip() for p in raw.split(",") if p.strip())
+
+
 def _install_http_middleware(app: FastAPI) -> None:
+    sampled_prefixes = _sampled_prefixes()
+    sample_every = max(1, int(os.getenv("COBRANZA_LOG_SAMPLE_EVERY", "20")))
+    sample_counters: dict[str, int] = {}
+
+    def should_log(path: str, status: int, elapsed_ms: float) -> bool:
+        if status >= 400 or elapsed_ms >= SLOW_REQUEST_MS:
+            return True
+        for prefix in sampled_prefixes:
+            if path.startswith(prefix):
+                seen = sample_counters.get(prefix, 0)
+                sample_counters[prefix] = seen + 1
+                return seen % sample_every == 0
+        return True
+
     @app.middleware("http")
     async def with_request_context(request: Request, call_next):
         request_id = request.headers.get("x-request-id") or uuid4().hex[:12]
+        token = request_id_var.set(request_id)
         started = time.perf_counter()
 
         try:
@@ -93,21 +119,32 @@ def _install_http_middleware(app: FastAPI) -> None:
                 request.method,
                 request.url.path,
                 elapsed_ms,
+                extra={"method": request.method, "path": request.url.path, "duration_ms": round(elapsed_ms, 2)},
             )
             raise
+        finally:
+            request_id_var.reset(token)
 
         elapsed_ms = (time.perf_counter() - started) * 1000
         response.headers["x-request-id"] = request_id
         response.headers["x-process-time-ms"] = f"{elapsed_ms:.2f}"
 
-        logger.info(
-            "request_id=%s method=%s path=%s status=%s duration_ms=%.2f",
-            request_id,
-            request.method,
-            request.url.path,
-            response.status_code,
-            elapsed_ms,
-        )
+        if should_log(request.url.path, response.status_code, elapsed_ms):
+            logger.info(
+                "request_id=%s method=%s path=%s status=%s duration_ms=%.2f",
+                request_id,
+                request.method,
+                request.url.path,
+                response.status_code,
+                elapsed_ms,
+                extra={
+                    "request_id": request_id,
+                    "method": request.method,
+                    "path": request.url.path,
+                    "status": response.status_code,
+                    "duration_ms": round(elapsed_ms, 2),
+                },
+            )
         return response
 
 
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+paths.py
+--------
+Rutas de la aplicación (desarrollo o ejecutable PyInstaller) y del maestro
+por defecto. Separado de ``main`` para que la CLI no tenga que importar la
+app FastAPI.
+"""
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+
+def app_path(*parts: str) -> Path:
+    """
+    Devuelve la ruta correcta tanto en desarrollo como en ejecutable (PyInstaller).
+    Prioriza la variable de entorno COBRANZA_BASE_DIR si existe (la seteará el launcher).
+    """
+    base_env = os.getenv("COBRANZA_BASE_DIR")
+    if base_env:
+        return Path(base_env).joinpath(*parts)
+    if getattr(sys, "frozen", False):
+        base_root = Path(sys._MEIPASS)  # type: ignore[attr-defined]
+        base = base_root / "app"
+        if not base.exists():
+            base = base_root
+    else:
+        base = Path(__file__).parent
+    return base.joinpath(*parts)
+
+
+def resolve_default_master() -> Path:
+    """
+    Busca la ruta del maestro por defecto con reglas configurables.
+    """
+    env_override = os.getenv("COBRANZA_DEFAULT_MASTER")
+    if env_override:
+        env_path = Path(env_override)
+        if env_path.is_file():
+            return env_path.resolve()
+
+    data_dir = app_path("data")
+    for name in ("COBRANZA-formateado.XLS", "COBRANZA-formateado.xls"):
+        candidate = data_dir / name
+        if candidate.is_file():
+            return candidate.resolve()
+
+    try:
+        for candidate in sorted(data_dir.glob("COBRANZA-formateado.*")):
+            if candidate.is_file():
+                return candidate.resolve()
+    except FileNotFoundError:
+        pass
+
+    return (data_dir / "COBRANZA-formateado.XLS").resolve()
@@ -10,6 +10,8 @@ class QueueStatus:
     redis_url_configured: bool
     arq_enabled: bool
     arq_installed: bool
+    excel_workers: int
+    pool: dict | None
 
 
 
@@ -32,7 +34,9 @@ def read_queue_status() -> QueueStatus:
     except Exception:
         arq_installed = False
 
-    mode = "thread"
+    from .services.excel_workers import execution_mode, pool_status
+
+    mode = execution_mode()
     if arq_enabled and redis_url and arq_installed:
         mode = "arq"
 
@@ -41,9 +45,11 @@ def read_queue_status() -> QueueStatus:
         redis_url_configured=bool(redis_url),
         arq_enabled=arq_enabled,
         arq_installed=arq_installed,
+        excel_workers=int(os.getenv("COBRANZA_EXCEL_WORKERS", "1")) if mode == "process" else 0,
+        pool=pool_status(),
     )
 
 
 
-def queue_status_payload() -> dict[str, str | bool]:
+def queue_status_payload() -> dict[str, object]:
     return asdict(read_queue_status())
@@ -0,0 +1,90 @@
+# app/routers/history.py
+import logging
+import time
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ..services.vendor_history import HistoryError, get_history, series_by_vendor
+
+router = APIRouter(prefix="/history", tags=["history"])
+
+logger = logging.getLogger("cobranza.history")
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+@router.get("/snapshots")
+def list_snapshots(start: str | None = None, end: str | None = None):
+    """Fechas con instantánea (una por merge/fecha), con el origen y los hashes."""
+    started = time.perf_counter()
+    try:
+        snapshots = get_history().snapshots(start, end)
+    except HistoryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"snapshots": snapshots, "elapsed_ms": _elapsed_ms(started)}
+
+
+@router.delete("/snapshots/{as_of}")
+def delete_snapshot(as_of: str):
+    try:
+        deleted = get_history().delete_snapshot(as_of)
+    except HistoryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"No hay instantánea del {as_of}.")
+    return {"deleted": as_of}
+
+
+@router.get("/vendors")
+def list_vendors(start: str | None = None, end: str | None = None):
+    """Vendedores con histórico: primera/última fecha, instantáneas y últimos totales."""
+    started = time.perf_counter()
+    try:
+        vendors = get_history().vendors(start, end)
+    except HistoryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"vendors": vendors, "elapsed_ms": _elapsed_ms(started)}
+
+
+@router.get("/vendors/totals")
+def vendor_totals(
+    vendor: list[str] | None = Query(None),
+    start: str | None = None,
+    end: str | None = None,
+    limit: int | None = Query(None, ge=0),
+    format: str = Query("series", pattern="^(series|rows)$"),
+):
+    """
+    Totales entre ``start`` y ``end`` (YYYY-MM-DD, inclusivos) de los
+    vendedores indicados (``vendor`` repetible; todos si se omite).
+    ``format=series`` agrupa por vendedor; ``rows`` devuelve filas planas.
+    """
+    started = time.perf_counter()
+    try:
+        rows = get_history().totals(vendor, start, end, limit)
+    except HistoryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    payload: dict = {"start": start, "end": end, "count": len(rows)}
+    if format == "rows":
+        payload["rows"] = [r.as_dict() for r in rows]
+    else:
+        payload["series"] = series_by_vendor(rows)
+    payload["elapsed_ms"] = _elapsed_ms(started)
+    return payload
+
+
+@router.get("/vendors/{vendor}")
+def vendor_series(vendor: str, start: str | None = None, end: str | None = None):
+    """Serie de un vendedor (nombre del origen o del maestro; se aplican los alias)."""
+    started = time.perf_counter()
+    try:
+        rows = get_history().totals([vendor], start, end)
+    except HistoryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Sin histórico para {vendor}.")
+    series = series_by_vendor(rows)
+    key, points = next(iter(series.items()))
+    return {"vendor": key, "points": points, "elapsed_ms": _elapsed_ms(started)}
@@ -0,0 +1,84 @@
+# app/routers/masters.py
+import logging
+import os
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+
+from ..services.master_registry import MasterNotFound, get_registry
+
+router = APIRouter(prefix="/masters", tags=["masters"])
+
+logger = logging.getLogger("cobranza.masters")
+
+
+def _default_payload() -> dict:
+    registry = get_registry()
+    path = registry.default_path()
+    exists = path.is_file()
+    name = path.name if exists else None
+    if registry.default_id is not None and exists:
+        name = registry.get(registry.default_id).name
+    return {"default_id": registry.default_id, "name": name, "exists": exists}
+
+
+@router.get("")
+def list_masters():
+    """Maestros registrados (sin metadatos completos) y el maestro por defecto vigente."""
+    registry = get_registry()
+    return {
+        "masters": [m.summary() for m in registry.list()],
+        "default": _default_payload(),
+    }
+
+
+@router.post("")
+def upload_master(
+    file: UploadFile = File(...),
+    name: str | None = Form(None),
+    make_default: int = Form(0),
+):
+    """
+    Registra un maestro (una sola vez por contenido) y lo pre-analiza.
+    Con ``make_default=1`` pasa a ser el maestro por defecto sin reiniciar.
+    """
+    filename = os.path.basename(name or file.filename or "maestro.xls")
+    if not filename.lower().endswith((".xls", ".xlsx", ".xlsm")):
+        raise HTTPException(status_code=400, detail="El maestro debe ser un archivo de Excel.")
+    try:
+        info = get_registry().add_stream(file.file, filename)
+    finally:
+        try:
+            file.file.close()
+        except Exception:
+            pass
+    if make_default:
+        get_registry().set_default(info.id)
+    return {**info.summary(), "metadata": info.metadata, "default": _default_payload()}
+
+
+@router.put("/default")
+def set_default_master(master_id: str | None = Form(None)):
+    """Cambia el maestro por defecto; vacío vuelve al incluido en app/data."""
+    try:
+        get_registry().set_default(master_id or None)
+    except MasterNotFound:
+        raise HTTPException(status_code=404, detail=f"No existe el maestro {master_id}.")
+    return _default_payload()
+
+
+@router.get("/{master_id}")
+def get_master(master_id: str):
+    try:
+        info = get_registry().get(master_id)
+    except MasterNotFound:
+        raise HTTPException(status_code=404, detail=f"No existe el maestro {master_id}.")
+    return {**info.summary(), "sha256": info.sha256, "metadata": info.metadata}
+
+
+@router.delete("/{master_id}")
+def delete_master(master_id: str):
+    try:
+        get_registry().remove(master_id)
+    except MasterNotFound:
+        raise HTTPException(status_code=404, detail=f"No existe el maestro {master_id}.")
+    return {"deleted": master_id, "default": _default_payload()}
@@ -1,9 +1,7 @@
 ﻿# app/routers/pdf.py
 import io
 import json
-import traceback
-import zipfile
-from datetime import datetime
+import logging
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
@@ -16,17 +14,15 @@ from fastapi import (
     UploadFile,
 )
 
-from ..services.pdf_export_service import export_vendor_pdfs, list_vendor_blocks
+from starlette.concurrency import run_in_threadpool
 
-router = APIRouter(prefix="/pdf", tags=["pdf"])
-
-LOG_FILE = Path("pdf_export.log")
+from ..services.com_retry import co_initialize, co_uninitialize
+from ..services.excel_workers import run_excel_job
+from ..services.pdf_export_service import zip_pdfs
 
+router = APIRouter(prefix="/pdf", tags=["pdf"])
 
-def _log(msg: str) -> None:
-    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with LOG_FILE.open("a", encoding="utf-8") as fh:
-        fh.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}\n")
+logger = logging.getLogger("cobranza.pdf")
 
 def _parse_json_list(value: str | None) -> list[str]:
     if not value:
@@ -83,24 +79,25 @@ def exportar_pdfs(
         raise HTTPException(status_code=400, detail=str(exc))
 
     try:
-        pdfs = export_vendor_pdfs(
-            xls_path=xls,
-            out_dir=out,
-            hojas_completas=("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
-            hoja_base=hoja_base,
-            orden_ids=orden_ids,
-            excluir_ids=excluir_ids,
-            pdf_date=pdf_date,
-        )
+        result = run_excel_job("export_pdf", {
+            "xls_path": str(xls),
+            "out_dir": str(out),
+            "hojas_completas": ("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
+            "hoja_base": hoja_base,
+            "orden_ids": orden_ids,
+            "excluir_ids": excluir_ids,
+            "pdf_date": pdf_date,
+        })
+        pdfs = [Path(p) for p in result["files"]]
+        logger.info("PDF export finished: %d files", len(pdfs), extra={"stages_ms": result["report"]["stages_ms"]})
     except (ValueError, RuntimeError) as exc:
-        _log(f"ERROR export: {exc}")
+        logger.error("ERROR export: %s", exc)
         raise HTTPException(status_code=400, detail=str(exc))
     except Exception as exc:
-        tb = traceback.format_exc()
-        _log(f"ERROR export: {exc}\n{tb}")
+        logger.exception("ERROR export: %s", exc)
         raise HTTPException(status_code=500, detail=f"Fallo exportando PDFs: {exc}")
 
-    _log(f"OK export: {xls} -> {out} | {len(pdfs)} archivos")
+    logger.info("OK export: %s -> %s | %d archivos", xls, out, len(pdfs))
     return {"status": "ok", "count": len(pdfs), "out_dir": str(out), "files": [str(p) for p in pdfs]}
 
 
@@ -134,15 +131,18 @@ async def export_pdfs_upload(
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc))
 
-        files = export_vendor_pdfs(
-            xls_path=xls_path,
-            out_dir=out_dir,
-            hojas_completas=("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
-            hoja_base=hoja_base,
-            orden_ids=orden_ids,
-            excluir_ids=excluir_ids,
-            pdf_date=pdf_date,
-        )
+        # Fuera del event loop: el trabajo de Excel no debe bloquear otras peticiones
+        result = await run_in_threadpool(run_excel_job, "export_pdf", {
+            "xls_path": str(xls_path),
+            "out_dir": str(out_dir),
+            "hojas_completas": ("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
+            "hoja_base": hoja_base,
+            "orden_ids": orden_ids,
+            "excluir_ids": excluir_ids,
+            "pdf_date": pdf_date,
+        })
+        files = [Path(p) for p in result["files"]]
+        logger.info("PDF export finished: %d files", len(files), extra={"stages_ms": result["report"]["stages_ms"]})
         if not files:
             raise HTTPException(
                 status_code=409,
@@ -150,9 +150,7 @@ async def export_pdfs_upload(
             )
 
         buf = io.BytesIO()
-        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
-            for file_path in files:
-                z.write(file_path, arcname=file_path.name)
+        zip_pdfs(files, buf)
         buf.seek(0)
 
     zip_name = f"PDFS_{Path(safe_name).stem}.zip"
@@ -182,17 +180,16 @@ async def preview_pdfs_upload(
         xls_path.write_bytes(await excel.read())
 
         try:
-            blocks = list_vendor_blocks(
-                xls_path=xls_path,
-                hojas_completas=("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
-                hoja_base=hoja_base,
-            )
+            blocks = await run_in_threadpool(run_excel_job, "list_blocks", {
+                "xls_path": str(xls_path),
+                "hojas_completas": ("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
+                "hoja_base": hoja_base,
+            })
         except (ValueError, RuntimeError) as exc:
-            _log(f"ERROR preview: {exc}")
+            logger.error("ERROR preview: %s", exc)
             raise HTTPException(status_code=400, detail=str(exc))
         except Exception as exc:
-            tb = traceback.format_exc()
-            _log(f"ERROR preview: {exc}\n{tb}")
+            logger.exception("ERROR preview: %s", exc)
             raise HTTPException(status_code=500, detail=f"Fallo analizando XLS: {exc}")
 
     payload = [
@@ -218,7 +215,7 @@ def debug_blocks(file_path: str, hoja: str):
 
         initialized = False
         try:
-            pythoncom.CoInitialize()
+            co_initialize()
             initialized = True
         except pythoncom.com_error as exc:
             raise HTTPException(status_code=500, detail=f'No se pudo inicializar COM: {exc}')
@@ -251,10 +248,9 @@ def debug_blocks(file_path: str, hoja: str):
                 except Exception:
                     pass
             if initialized:
-                pythoncom.CoUninitialize()
+                co_uninitialize()
     except HTTPException:
         raise
     except Exception as exc:
-        tb = traceback.format_exc()
-        _log(f"ERROR debug-blocks: {exc}\n{tb}")
+        logger.exception("ERROR debug-blocks: %s", exc)
         raise HTTPException(status_code=500, detail=f"Fallo en debug-blocks: {exc}")
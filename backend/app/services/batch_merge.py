@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+batch_merge.py
+--------------
+Trabajos de Excel sobre varios archivos (merge contra un mismo maestro,
+exportación de PDFs) sin lanzar un Excel por archivo:
+
+- modo ``thread``: un único Excel propio (``dedicated_engine``) procesa los
+  archivos en secuencia,
+- modo ``process``: los archivos se reparten entre los trabajadores del pool,
+  cada uno con su Excel ya abierto.
+
+Cada archivo lleva su estado (pendiente, en curso, listo, error, cancelado)
+y su progreso; un error en un archivo no detiene el lote. Cancelar el lote
+descarta los archivos pendientes y detiene los en curso entre etapas. El
+resumen incluye el rendimiento en archivos por minuto.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .cancellation import CancelToken, JobCancelled
+from .excel_copy import DELETE_FIRST_ROWS
+from .excel_workers import dedicated_engine, execution_mode, get_excel_pool
+
+BatchProgressCb = Callable[[int, str, List[Dict[str, Any]]], None]
+RunJob = Callable[..., Any]  # (kind, payload, progress, cancel=...) de engine.run / pool.run
+FinishCb = Callable[["BatchFile", Any], Dict[str, Any]]
+
+
+@dataclass
+class BatchFile:
+    index: int
+    name: str
+    source_path: str
+    status: str = "pending"  # pending | running | done | error | cancelled
+    pct: int = 0
+    msg: str = ""
+    out_path: Optional[str] = None
+    outputs: List[str] = field(default_factory=list)
+    details: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
+    stages_ms: Dict[str, float] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("source_path")
+        return data
+
+
+FINISHED = ("done", "error", "cancelled")
+
+
+def _output_name(name: str, taken: Set[str]) -> str:
+    """Nombre base del origen (.xls si no trae extensión), sin repetir dentro del lote."""
+    base = os.path.basename(name).strip() or "COBRANZA.xls"
+    root, ext = os.path.splitext(base)
+    ext = ext or ".xls"
+    candidate, n = root + ext, 2
+    while candidate.lower() in taken:
+        candidate = f"{root} ({n}){ext}"
+        n += 1
+    taken.add(candidate.lower())
+    return candidate
+
+
+def batch_files(sources: Sequence[Tuple[str, str]]) -> List[BatchFile]:
+    """[(ruta, nombre)] -> archivos del lote en estado pendiente."""
+    return [BatchFile(index=i, name=name, source_path=path) for i, (path, name) in enumerate(sources)]
+
+
+class _Batch:
+    def __init__(self, files: List[BatchFile], progress_cb: Optional[BatchProgressCb]):
+        self.files = files
+        self.progress_cb = progress_cb
+        self._lock = threading.Lock()
+
+    def update(self, f: BatchFile, msg: str, **changes: Any) -> None:
+        with self._lock:
+            for attr, value in changes.items():
+                setattr(f, attr, value)
+            f.msg = msg
+            if self.progress_cb is None:
+                return
+            pct = sum(100 if x.status in FINISHED else x.pct for x in self.files) // len(self.files)
+            self.progress_cb(pct, f"[{f.index + 1}/{len(self.files)}] {f.name}: {msg}", [x.as_dict() for x in self.files])
+
+
+def run_batch(
+    files: List[BatchFile],
+    kind: str,
+    payload_for: Callable[[BatchFile], Dict[str, Any]],
+    finish: Optional[FinishCb] = None,
+    *,
+    progress_cb: Optional[BatchProgressCb] = None,
+    workers: Optional[int] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Dict[str, Any]:
+    """
+    Ejecuta un trabajo ``kind`` por archivo con un solo Excel (modo thread) o
+    repartido en el pool (modo process). ``finish(archivo, resultado)``
+    devuelve campos extra del archivo (p.ej. ``out_path``) tras un trabajo exitoso.
+    Si ``cancel`` se activa, los archivos restantes quedan ``cancelled`` y al
+    terminar se lanza ``JobCancelled``.
+    """
+    batch = _Batch(files, progress_cb)
+
+    def run_one(f: BatchFile, run_job: RunJob) -> None:
+        if cancel is not None and cancel.cancelled:
+            batch.update(f, "Cancelado.", status="cancelled")
+            return
+        started = time.perf_counter()
+        batch.update(f, "Iniciando…", status="running", pct=1)
+
+        def file_progress(pct: int, msg: str) -> None:
+            batch.update(f, msg, pct=pct)
+
+        try:
+            result = run_job(kind, payload_for(f), file_progress, cancel=cancel)
+            changes = finish(f, result) if finish is not None else {}
+            report = result.get("report") if isinstance(result, dict) else None
+            batch.update(
+                f, "Listo.", status="done", pct=100,
+                stages_ms=report["stages_ms"] if report else {},
+                elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+                **changes,
+            )
+        except JobCancelled:
+            batch.update(
+                f, "Cancelado.", status="cancelled",
+                elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+            )
+        except Exception as exc:
+            batch.update(
+                f, f"Error: {exc}", status="error", error=f"{type(exc).__name__}: {exc}",
+                elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+            )
+
+    started = time.perf_counter()
+    mode = execution_mode()
+    used_workers = 1
+    if files:
+        if mode == "process":
+            pool = get_excel_pool()
+            used_workers = max(1, min(workers or pool.size, pool.size, len(files)))
+            with ThreadPoolExecutor(max_workers=used_workers, thread_name_prefix="cobranza-batch") as ex:
+                for f in files:
+                    ex.submit(run_one, f, pool.run)
+        else:
+            # Un solo Excel para todo el lote
+            with dedicated_engine() as engine:
+                for f in files:
+                    run_one(f, engine.run)
+
+    if cancel is not None and cancel.cancelled:
+        raise JobCancelled("Lote cancelado.")
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for f in files if f.status == "done")
+    stages: Dict[str, float] = {}
+    for f in files:
+        for name, ms in f.stages_ms.items():
+            stages[name] = round(stages.get(name, 0.0) + ms, 2)
+    return {
+        "files": [f.as_dict() for f in files],
+        "total": len(files),
+        "ok": ok,
+        "failed": len(files) - ok,
+        "mode": mode,
+        "workers": used_workers,
+        "elapsed_s": round(elapsed, 3),
+        "files_per_min": round(len(files) * 60 / elapsed, 2) if elapsed > 0 else 0.0,
+        "stages_ms": stages,
+    }
+
+
+def merge_batch(
+    sources: Sequence[Tuple[str, str]],
+    master_xls_path: str,
+    out_dir: str,
+    *,
+    header_date: Optional[str] = None,
+    delete_first_rows: int = DELETE_FIRST_ROWS,
+    progress_cb: Optional[BatchProgressCb] = None,
+    workers: Optional[int] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Dict[str, Any]:
+    """
+    sources: [(ruta, nombre original)] de cada archivo de origen.
+    out_dir: carpeta donde quedan los .xls resultantes (con el nombre del origen).
+    progress_cb(pct_total, mensaje, estado_por_archivo).
+    workers: en modo ``process``, cuántos trabajadores usar como máximo.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    files = batch_files(sources)
+    taken: Set[str] = set()
+    names = {f.index: _output_name(f.name, taken) for f in files}
+
+    def payload_for(f: BatchFile) -> Dict[str, Any]:
+        return {
+            "source_xls_path": f.source_path,
+            "master_xls_path": master_xls_path,
+            "header_date": header_date,
+            "delete_first_rows": delete_first_rows,
+            "source_name": f.name,
+        }
+
+    def finish(f: BatchFile, result: Dict[str, Any]) -> Dict[str, Any]:
+        target = os.path.join(out_dir, names[f.index])
+        work_dir = os.path.dirname(result["out_path"])
+        shutil.move(result["out_path"], target)
+        # Carpeta temporal del merge (cobranza_xls_*): ya no tiene nada útil
+        if os.path.normcase(os.path.abspath(work_dir)) != os.path.normcase(os.path.abspath(out_dir)):
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return {"out_path": target}
+
+    summary = run_batch(files, "merge", payload_for, finish, progress_cb=progress_cb, workers=workers, cancel=cancel)
+    summary["out_dir"] = out_dir
+    return summary
+
+
+def zip_batch_outputs(summary: Dict[str, Any], target) -> int:
+    """Empaqueta los archivos generados del lote (``out_path`` u ``outputs``) en ``target`` (ruta o archivo binario)."""
+    root = summary.get("out_dir")
+    written = 0
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for f in summary["files"]:
+            if f["status"] != "done":
+                continue
+            for path in ([f["out_path"]] if f["out_path"] else []) + list(f["outputs"]):
+                # Rutas relativas a la carpeta del lote (subcarpetas por archivo en PDFs)
+                arcname = os.path.relpath(path, root) if root else os.path.basename(path)
+                zf.write(path, arcname=arcname)
+                written += 1
+    return written
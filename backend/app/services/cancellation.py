@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+cancellation.py
+---------------
+Cancelación cooperativa de trabajos de Excel.
+
+El trabajo revisa su ``CancelToken`` entre etapas (``check()``): COM no se
+interrumpe a mitad de una llamada, así que cancelar nunca deja un libro a
+medio escribir; el ``finally`` de cada etapa cierra los libros y decide si
+Excel vuelve al pool o se cierra.
+
+El aviso puede venir de:
+- un ``threading.Event`` / ``multiprocessing.Event`` (mismo proceso o el
+  proceso trabajador del pool, que recibe el evento al nacer),
+- ``probe``: una función consultada como mucho cada ``probe_interval``
+  segundos (p.ej. el campo ``cancel_requested`` del almacén de trabajos,
+  para un DELETE atendido por otro proceso de uvicorn).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Optional
+
+DEFAULT_PROBE_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """El trabajo se canceló a pedido del usuario."""
+
+    def __init__(self, message: str = "Trabajo cancelado."):
+        super().__init__(message)
+
+
+class CancelToken:
+    def __init__(
+        self,
+        event: Any = None,
+        probe: Optional[Callable[[], bool]] = None,
+        probe_interval: float = DEFAULT_PROBE_INTERVAL,
+    ):
+        self._event = event if event is not None else threading.Event()
+        self._probe = probe
+        self._probe_interval = probe_interval
+        self._next_probe = 0.0
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self._probe is not None:
+            now = time.monotonic()
+            if now >= self._next_probe:
+                self._next_probe = now + self._probe_interval
+                try:
+                    if self._probe():
+                        self._event.set()
+                        return True
+                except Exception:
+                    pass
+        return False
+
+    def check(self) -> None:
+        """Lanza ``JobCancelled`` si se pidió cancelar."""
+        if self.cancelled:
+            raise JobCancelled()
+
+
+def check_cancel(cancel: Optional[CancelToken]) -> None:
+    """``cancel.check()`` tolerando ``None`` (trabajos sin token)."""
+    if cancel is not None:
+        cancel.check()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+com_retry.py
+------------
+Reintentos de llamadas COM a un Excel ocupado.
+
+Excel rechaza llamadas mientras está ocupado (recalculando, abriendo,
+exportando): ``RPC_E_CALL_REJECTED`` / ``RPC_E_SERVERCALL_RETRYLATER``, o
+``VBA_E_IGNORE`` si está en modo edición. Antes se compensaba con pausas
+fijas (``time.sleep(0.2)``), que cuestan siempre y no alcanzan bajo carga.
+
+Dos capas:
+
+- ``MessageFilter`` (IMessageFilter): ``co_initialize()`` lo registra en
+  el hilo junto con ``CoInitialize``, así TODAS las llamadas COM del hilo a
+  un Excel que responde "reintentar más tarde" se reintentan dentro de COM
+  con espera exponencial (base, tope y plazo total).
+- ``com_call(fn, *args, **kwargs)``: reintenta en Python, con la misma
+  política, sólo los HRESULT transitorios que COM devuelve como error
+  (``VBA_E_IGNORE``, portapapeles ocupado, ...). Se usa en las llamadas
+  largas o sensibles (Open, SaveAs, pegado, ExportAsFixedFormat, Quit).
+
+Los reintentos se cuentan en /metrics: ``com.filter_retries``,
+``com.filter_giveups``, ``com.retries`` y ``com.giveups``.
+
+COBRANZA_COM_RETRY_BASE_MS (25), COBRANZA_COM_RETRY_CAP_MS (1000) y
+COBRANZA_COM_RETRY_TOTAL_MS (30000) ajustan la política.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, FrozenSet, Iterable, Optional, TypeVar
+
+from .. import metrics
+
+logger = logging.getLogger("cobranza.com")
+
+T = TypeVar("T")
+
+# HRESULT (sin signo)
+RPC_E_CALL_REJECTED = 0x80010001
+RPC_E_SERVERCALL_RETRYLATER = 0x8001010A
+VBA_E_IGNORE = 0x800AC472            # Excel en modo edición / ocupado
+CLIPBRD_E_CANT_OPEN = 0x800401D0     # portapapeles tomado por otro proceso
+XL_E_METHOD_FAILED = 0x800A03EC      # error genérico de Excel (p.ej. Paste sin datos aún)
+DISP_E_EXCEPTION = 0x80020009
+
+TRANSIENT_HRESULTS: FrozenSet[int] = frozenset({RPC_E_CALL_REJECTED, RPC_E_SERVERCALL_RETRYLATER, VBA_E_IGNORE})
+
+# IMessageFilter
+IID_IMESSAGEFILTER = "{00000016-0000-0000-C000-000000000046}"
+SERVERCALL_ISHANDLED = 0
+SERVERCALL_RETRYLATER = 2
+PENDINGMSG_WAITDEFPROCESS = 2
+RETRY_IMMEDIATELY_BELOW_MS = 100   # COM: 0-99 reintenta ya; >= 100 espera esos ms
+
+
+def _env_ms(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def hresult_of(exc: BaseException) -> Optional[int]:
+    """HRESULT (sin signo) de un ``pywintypes.com_error``; el ``scode`` si es DISP_E_EXCEPTION."""
+    hr = getattr(exc, "hresult", None)
+    args = getattr(exc, "args", ())
+    if hr is None and args and isinstance(args[0], int) and not isinstance(args[0], bool):
+        hr = args[0]
+    if not isinstance(hr, int):
+        return None
+    hr &= 0xFFFFFFFF
+    excepinfo = args[2] if len(args) > 2 else None
+    if hr == DISP_E_EXCEPTION and isinstance(excepinfo, tuple) and len(excepinfo) > 5 and excepinfo[5]:
+        hr = int(excepinfo[5]) & 0xFFFFFFFF
+    return hr
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Espera exponencial ``base_ms * 2**intento`` con tope ``cap_ms`` y plazo total ``total_ms``."""
+
+    base_ms: float = 25.0
+    cap_ms: float = 1000.0
+    total_ms: float = 30000.0
+    transient: FrozenSet[int] = TRANSIENT_HRESULTS
+
+    def delay_ms(self, attempt: int) -> float:
+        return min(self.cap_ms, self.base_ms * (2 ** attempt))
+
+    def is_transient(self, exc: BaseException) -> bool:
+        return hresult_of(exc) in self.transient
+
+    def with_transient(self, extra: Iterable[int]) -> "RetryPolicy":
+        return replace(self, transient=self.transient | frozenset(extra))
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as exc:
+                if not self.is_transient(exc):
+                    raise
+                delay = self.delay_ms(attempt)
+                elapsed_ms = (time.monotonic() - started) * 1000
+                if elapsed_ms + delay > self.total_ms:
+                    metrics.incr("com.giveups")
+                    logger.warning(
+                        "COM call %s still busy after %d retries (%.0f ms): %s",
+                        getattr(fn, "__name__", fn), attempt, elapsed_ms, exc,
+                    )
+                    raise
+                metrics.incr("com.retries")
+                attempt += 1
+                time.sleep(delay / 1000)
+
+
+_policy: Optional[RetryPolicy] = None
+
+
+def default_policy() -> RetryPolicy:
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy(
+            base_ms=_env_ms("COBRANZA_COM_RETRY_BASE_MS", RetryPolicy.base_ms),
+            cap_ms=_env_ms("COBRANZA_COM_RETRY_CAP_MS", RetryPolicy.cap_ms),
+            total_ms=_env_ms("COBRANZA_COM_RETRY_TOTAL_MS", RetryPolicy.total_ms),
+        )
+    return _policy
+
+
+def com_call(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """``fn(*args, **kwargs)`` reintentando los HRESULT transitorios (política por defecto)."""
+    return default_policy().call(fn, *args, **kwargs)
+
+
+# -------------------------------------------------------------------
+# IMessageFilter
+# -------------------------------------------------------------------
+class MessageFilter:
+    """
+    Filtro de mensajes COM del hilo. ``RetryRejectedCall`` recibe los ms
+    transcurridos desde la llamada original: se espera ese mismo tiempo
+    (acotado a [base, tope]), lo que duplica la espera acumulada en cada
+    rechazo, y se cancela al pasar el plazo total.
+    """
+
+    _public_methods_ = ["HandleInComingCall", "RetryRejectedCall", "MessagePending"]
+    _com_interfaces_ = [IID_IMESSAGEFILTER]
+
+    def __init__(self, policy: Optional[RetryPolicy] = None):
+        self.policy = policy or default_policy()
+
+    def HandleInComingCall(self, dwCallType, htaskCaller, dwTickCount, lpInterfaceInfo):  # noqa: N802
+        return SERVERCALL_ISHANDLED
+
+    def RetryRejectedCall(self, htaskCallee, dwTickCount, dwRejectType):  # noqa: N802
+        if dwRejectType != SERVERCALL_RETRYLATER:
+            # SERVERCALL_REJECTED: Excel no la aceptará nunca
+            return -1
+        if dwTickCount >= self.policy.total_ms:
+            metrics.incr("com.filter_giveups")
+            logger.warning("Excel kept rejecting a COM call for %d ms; giving up", dwTickCount)
+            return -1
+        metrics.incr("com.filter_retries")
+        return int(max(RETRY_IMMEDIATELY_BELOW_MS, self.policy.base_ms, min(self.policy.cap_ms, dwTickCount)))
+
+    def MessagePending(self, htaskCallee, dwTickCount, dwPendingType):  # noqa: N802
+        return PENDINGMSG_WAITDEFPROCESS
+
+
+_thread_state = threading.local()
+
+
+def co_initialize() -> None:
+    """``CoInitialize`` del hilo y registro del ``MessageFilter`` (anidable)."""
+    import pythoncom
+
+    pythoncom.CoInitialize()
+    depth = getattr(_thread_state, "depth", 0)
+    _thread_state.depth = depth + 1
+    if depth:
+        return
+    _thread_state.previous = None
+    _thread_state.registered = False
+    try:
+        from win32com.server.util import wrap
+
+        _thread_state.previous = pythoncom.CoRegisterMessageFilter(
+            wrap(MessageFilter(), pythoncom.IID_IMessageFilter)
+        )
+        _thread_state.registered = True
+    except Exception as exc:
+        # Sin filtro siguen valiendo los reintentos de com_call
+        logger.warning("Could not register COM message filter: %s", exc)
+
+
+def co_uninitialize() -> None:
+    """Quita el filtro (restaura el anterior) y ``CoUninitialize``."""
+    import pythoncom
+
+    depth = getattr(_thread_state, "depth", 0)
+    if depth == 1 and getattr(_thread_state, "registered", False):
+        try:
+            pythoncom.CoRegisterMessageFilter(_thread_state.previous)
+        except Exception:
+            pass
+        _thread_state.registered = False
+        _thread_state.previous = None
+    _thread_state.depth = max(0, depth - 1)
+    pythoncom.CoUninitialize()
@@ -11,20 +11,30 @@ Requiere: pywin32 (pythoncom, win32com.client).
 """
 from __future__ import annotations
 
+import logging
 import os
 import re
+import shutil
 import tempfile
 import uuid
-import time
-import unicodedata
-# Fuerza inclusión en el .exe
-import win32timezone  # noqa: F401
 
 from datetime import datetime
-from typing import Optional, Callable, Dict, List, Tuple
+from typing import Any, Optional, Callable, Dict, Iterator, List, Tuple
 
-import pythoncom
-from win32com.client import DispatchEx
+from .cancellation import CancelToken, JobCancelled, check_cancel
+from .com_retry import co_initialize, co_uninitialize, com_call
+from .excel_session import ExcelSession
+from .row_iter import iter_rows
+from .job_report import JobReport
+from .text_rewrite import RewriteRule, SheetTarget, TextRewriter
+from .sheet_transfer import paste_via_clipboard, transfer_sheet_direct, verify_direct_transfer
+from .vendor_history import record_merge_totals
+from .vendor_matcher import DEFAULT_ALIAS_MAP, VendorMatcher, get_matcher, norm_name
+from .workbook_index import SheetEntry, WorkbookIndex
+from .write_plan import WritePlan, get_write_plan
+
+
+logger = logging.getLogger("cobranza.excel")
 
 
 # -------------------------------------------------------------------
@@ -42,32 +52,32 @@ HEADER_SCAN_ROWS = 8             # Cuántas filas superiores considerar "encabez
 HEADER_SCAN_COLS = 60            # Cuántas columnas a revisar para fecha en celdas
 TARGET_NAME_COL = 2              # Columna B para nombres de vendedor en hojas destino
 TARGET_VAL_COLS = (3, 4)         # Columnas C (Importe) y D (A cuenta)
+TARGET_SHEET_ORDER = ("SUR", "NORTE", "SURQUILLO")  # Hojas destino preferidas (luego el resto)
 MAX_LOOKAHEAD_VALUES = 20        # Cuántas columnas hacia la derecha buscar valores
 PASTE_VALUES_PER_VENDOR = 2      # Solo los 2 primeros valores (Importe, A cuenta)
+PASTE_MODES = ("auto", "direct", "clipboard")
 
-# Alias de "Saldo para ..." -> cómo aparece el vendedor en col B de la pestaña destino
-ALIAS_MAP = {
-    "OFICINA (VES)": "OFICINA",
-    "MANUEL CARRASCO": "MANUEL",
-    "PITER HUAYTA": "PITER",
-    "BEATRIZ ROJAS": "BEATRIZ",
-    "LEONEL MEZA": "LEONEL",
-    "CAÑETE - (MANUEL)": "CAÑETE",
-    "CIUDAD - (ROSA)": "CIUDAD",
-    "LURIN - (ROSA)": "LURIN",
-    "MANCHAY - (ROSA)": "MANCHAY",
-    "UNICACHI SUR - (ROSA)": "UNICACHI",
-    "SURQ/SURCO - (OSCAR)": "SURQ/SURCO",      # va a pestaña SURQUILLO
-    "SAN LUIS (OSCAR)": "SAN LUIS",
-    "CAQUETA (ROSA)": "CAQUETA",
-    "SURQUILLO (OSCAR)": "SURQUILLO", 
-    "SURCO (OSCAR)": "SURCO", # texto en col B
-    "NORTE - ROSA": "NORTE",
-    "RAUL ARROYO": "RAUL",
-}
+# Alias de "Saldo para ..." -> vendedor en col B (editable en vendor_aliases.json)
+ALIAS_MAP = DEFAULT_ALIAS_MAP
 
 DATE_RE = re.compile(r"\b(\d{1,2})[\/-](\d{1,2})[\/-](\d{2,4})\b", re.IGNORECASE)
 SALDO_PARA_RE = re.compile(r"^\s*saldo\s+para\s+(.+?)\s*$", re.IGNORECASE)
+TITLE_RE = re.compile(r"COBRANZA AL", re.IGNORECASE)
+TITLE_SHEETS = ("SUR", "NORTE")
+TITLE_SCAN_ROWS = 6
+TITLE_SCAN_COLS = 30
+
+
+def _win32():
+    """
+    Importa pywin32 bajo demanda: cargar COM al importar el módulo retrasa el
+    arranque del servidor aunque todavía no haya ningún trabajo.
+    """
+    import pythoncom
+    # Fuerza inclusión en el .exe
+    import win32timezone  # noqa: F401
+    from win32com.client import DispatchEx
+    return pythoncom, DispatchEx
 
 
 def _progress_notify(progress_cb: Callable[[int, str], None] | None, pct: int, msg: str) -> None:
@@ -78,33 +88,81 @@ def _progress_notify(progress_cb: Callable[[int, str], None] | None, pct: int, m
     except Exception:
         pass
 
-def _paste_all_robust(excel, src_ws, dst_ws):
-    """Estrategia robusta de pegado."""
+def paste_mode() -> str:
+    """COBRANZA_PASTE_MODE: auto (por defecto) | direct | clipboard."""
+    mode = os.getenv("COBRANZA_PASTE_MODE", "auto").strip().lower()
+    return mode if mode in PASTE_MODES else "auto"
+
+
+def _paste_all_robust(excel, src_ws, dst_ws, mode: str | None = None):
+    """
+    Estrategia robusta de pegado.
+    - auto: Copy(Destination) -> transferencia directa -> portapapeles.
+    - direct: sólo transferencia directa (nunca usa el portapapeles).
+    - clipboard: Copy(Destination) -> portapapeles (comportamiento anterior).
+    Copy(Destination) y la transferencia directa no pasan por el portapapeles,
+    así que varios merges pueden correr a la vez; el portapapeles queda como
+    último recurso y serializado con ``clipboard_lock``.
+    """
+    mode = mode or paste_mode()
     last = ""
-    try:
-        src_ws.UsedRange.Copy(Destination=dst_ws.Range("A1"))
-        return "Copy(Destination)"
-    except Exception as e1:
-        last = f"Copy(Destination) -> {e1}"
+    if mode != "direct":
+        try:
+            com_call(src_ws.UsedRange.Copy, Destination=dst_ws.Range("A1"))
+            return "Copy(Destination)"
+        except Exception as e1:
+            last = f"Copy(Destination) -> {e1}"
 
-    try:
-        excel.CutCopyMode = False
-        src_ws.UsedRange.Copy()
-        time.sleep(0.2)
-        dst_ws.Paste(Destination=dst_ws.Range("A1"))
-        return "Worksheet.Paste"
-    except Exception as e2:
-        last += f" | Worksheet.Paste -> {e2}"
+    if mode != "clipboard":
+        try:
+            dst_ws.Cells.Clear()
+            transfer_sheet_direct(src_ws, dst_ws)
+            return "Direct(XMLSpreadsheet)"
+        except Exception as e2:
+            last += f" | Direct -> {e2}"
+            if mode == "direct":
+                raise ExcelCopyError(last.lstrip(" |"))
 
     try:
-        excel.CutCopyMode = False
-        src_ws.UsedRange.Copy()
-        time.sleep(0.2)
-        dst_ws.Range("A1").PasteSpecial(Paste=-4104)  # xlPasteAll
-        return "Range.PasteSpecial(xlPasteAll)"
+        return paste_via_clipboard(excel, src_ws, dst_ws)
     except Exception as e3:
-        last += f" | PasteSpecial(xlPasteAll) -> {e3}"
-        raise ExcelCopyError(last)
+        last += f" | {e3}"
+        raise ExcelCopyError(last.lstrip(" |"))
+
+
+def verify_paste_transfer(xls_path: str, *, excel=None) -> dict:
+    """
+    Compara, para la hoja 1 de ``xls_path``, el pegado por portapapeles con
+    la transferencia directa (valores, formatos, fuentes, rellenos, bordes,
+    combinadas y anchos). Ver ``sheet_transfer.verify_direct_transfer``.
+    """
+    if not os.path.isfile(xls_path):
+        raise ExcelCopyError(f"No existe el archivo: {xls_path}")
+    own_excel = excel is None
+    if own_excel:
+        _, DispatchEx = _win32()
+        co_initialize()
+    wb = None
+    try:
+        if own_excel:
+            excel = DispatchEx("Excel.Application")
+            excel.Visible = False
+            excel.DisplayAlerts = False
+        wb = com_call(excel.Workbooks.Open, xls_path, UpdateLinks=0, ReadOnly=True)
+        return verify_direct_transfer(excel, wb.Worksheets(1))
+    finally:
+        try:
+            if wb is not None:
+                wb.Close(SaveChanges=False)
+        except Exception:
+            pass
+        if own_excel:
+            try:
+                if excel is not None:
+                    excel.Quit()
+            except Exception:
+                pass
+            co_uninitialize()
 
 
 def _iso_to_es_ddmmyyyy(iso_date: str) -> str | None:
@@ -115,87 +173,28 @@ def _iso_to_es_ddmmyyyy(iso_date: str) -> str | None:
         return None
 
 
-def _update_header_date_in_cells(dst_ws, header_date_iso: str, header_rows: int, header_cols: int):
-    """Reemplaza fechas en TEXTO dentro de celdas del encabezado."""
+def _header_rules(header_date_iso: str) -> list[RewriteRule]:
+    """Reglas de la fecha seleccionada: dd/mm/yyyy en encabezados y título 'COBRANZA AL ...'."""
+    rules: list[RewriteRule] = []
     es_date = _iso_to_es_ddmmyyyy(header_date_iso)
-    if not es_date:
-        return
-    used = dst_ws.UsedRange
-    rows = min(header_rows, used.Rows.Count)
-    cols = min(header_cols, used.Columns.Count)
-
-    for r in range(1, rows + 1):
-        for c in range(1, cols + 1):
-            cell = dst_ws.Cells(r, c)
-            val = cell.Value
-            if isinstance(val, str) and DATE_RE.search(val):
-                try:
-                    cell.Value = DATE_RE.sub(es_date, val)
-                except Exception:
-                    pass
-
-
-def _replace_date_in_shapes(dst_ws, es_date: str):
-    """Reemplaza fechas en cuadros de texto (Shapes)."""
-    try:
-        for shp in dst_ws.Shapes:
-            # TextFrame2 (Office 2010+)
-            try:
-                if shp.TextFrame2.HasText:
-                    t = shp.TextFrame2.TextRange.Text
-                    if t and DATE_RE.search(t):
-                        shp.TextFrame2.TextRange.Text = DATE_RE.sub(es_date, t)
-                        continue
-            except Exception:
-                pass
-            # TextFrame clásico
-            try:
-                t = shp.TextFrame.Characters().Text
-                if t and DATE_RE.search(t):
-                    shp.TextFrame.Characters().Text = DATE_RE.sub(es_date, t)
-            except Exception:
-                pass
-    except Exception:
-        pass
-
-
-def _replace_date_in_page_headers(dst_ws, es_date: str):
-    """Reemplaza fechas en encabezados/pies de página (PageSetup)."""
-    try:
-        ps = dst_ws.PageSetup
-        for attr in ("LeftHeader", "CenterHeader", "RightHeader",
-                     "LeftFooter", "CenterFooter", "RightFooter"):
-            try:
-                s = getattr(ps, attr, "")
-                if isinstance(s, str) and s and DATE_RE.search(s):
-                    setattr(ps, attr, DATE_RE.sub(es_date, s))
-            except Exception:
-                pass
-    except Exception:
-        pass
+    if es_date:
+        rules.append(RewriteRule("header_date", DATE_RE, es_date))
+    title = _es_title_from_iso(header_date_iso)
+    if title:
+        # Reemplaza el texto COMPLETO (celdas y shapes) por el título target
+        rules.append(RewriteRule("title", TITLE_RE, title, whole=True, kinds=("cells", "shapes")))
+    return rules
 
 
 def _norm(s: str) -> str:
     """Normaliza: quita acentos, mayúsculas, colapsa espacios."""
-    t = unicodedata.normalize("NFD", s)
-    t = "".join(ch for ch in t if unicodedata.category(ch) != "Mn")
-    t = " ".join(t.split())
-    return t.upper()
+    return norm_name(s)
 
 def _tokens(norm_text: str) -> list[str]:
     return [t for t in re.split(r"[^A-Z0-9]+", norm_text) if len(t) >= 3]
 
-def _is_fuzzy_match(cell_norm: str, vendor_norm: str) -> bool:
-    # Match exacto solamente (nombres fijos del sistema).
-    return cell_norm == vendor_norm
-
-def _alias_map_norm() -> dict[str, str]:
-    return { _norm(k): _norm(v) for k, v in ALIAS_MAP.items() }
-
-def _map_vendor_key_to_target(vendor_key_norm: str) -> str:
-    return _alias_map_norm().get(vendor_key_norm, vendor_key_norm)
-
-
+def _map_vendor_key_to_target(vendor_key_norm: str, matcher: VendorMatcher | None = None) -> str:
+    return (matcher or get_matcher()).map_source(vendor_key_norm)
 
 
 def _try_number(val) -> float | None:
@@ -218,21 +217,16 @@ def _try_number(val) -> float | None:
     return None
 
 
-def _collect_vendor_totals_from_sheet1(dst_ws) -> dict[str, tuple[float | None, float | None, float | None]]:
+def vendor_totals_from_rows(rows, ncols: int) -> dict[str, tuple[float | None, float | None, float | None]]:
     """
     Busca filas con "Saldo para <VENDEDOR>" y recoge hasta 3 valores numéricos
     en esa misma fila, hacia la derecha del rótulo.
+    ``rows``: iterable de (fila, valores) con columnas 1..ncols (COM o BIFF).
     Devuelve dict: { vendedor_normalizado: (v1, v2, v3) }
     """
     results: dict[str, tuple[float | None, float | None, float | None]] = {}
-    used = dst_ws.UsedRange
-    rows = used.Rows.Count
-    cols = used.Columns.Count
-
-    for r in range(1, rows + 1):
-        for c in range(1, cols + 1):
-            cell = dst_ws.Cells(r, c)
-            val = cell.Value
+    for _r, row in rows:
+        for c, val in enumerate(row, start=1):
             if isinstance(val, str):
                 m = SALDO_PARA_RE.match(val)
                 if m:
@@ -240,8 +234,8 @@ def _collect_vendor_totals_from_sheet1(dst_ws) -> dict[str, tuple[float | None,
                     vend_key = _norm(raw_name)
                     # Buscar hasta 3 valores numéricos en la misma fila, a la derecha
                     values = []
-                    for j in range(c + 1, min(cols, c + 1 + MAX_LOOKAHEAD_VALUES)):
-                        num = _try_number(dst_ws.Cells(r, j).Value)
+                    for j in range(c + 1, min(ncols, c + MAX_LOOKAHEAD_VALUES) + 1):
+                        num = _try_number(row[j - 1] if j - 1 < len(row) else None)
                         if num is not None:
                             values.append(num)
                         if len(values) >= 3:
@@ -254,78 +248,110 @@ def _collect_vendor_totals_from_sheet1(dst_ws) -> dict[str, tuple[float | None,
     return results
 
 
-def _write_vendor_values_to_other_sheets(dst_wb, vendor_map: dict[str, tuple[float | None, float | None, float | None]]):
+def _collect_vendor_totals_from_sheet1(
+    dst_ws,
+    chunk: int | None = None,
+) -> dict[str, tuple[float | None, float | None, float | None]]:
+    """Totales por vendedor de la Hoja1 (UsedRange leído por bloques de ``chunk`` filas)."""
+    used = dst_ws.UsedRange
+    rows = used.Rows.Count
+    cols = used.Columns.Count
+    if rows < 1 or cols < 1:
+        return {}
+    return vendor_totals_from_rows(iter_rows(dst_ws, cols=(1, cols), start=1, end=rows, chunk=chunk), cols)
+
+
+def _scan_target_cells(wb_index: WorkbookIndex) -> Iterator[tuple[str, Any, int, str]]:
+    """(hoja, ws, fila, texto col B) recorriendo por COM: SUR → NORTE → SURQUILLO → resto."""
+    ordenadas: list[SheetEntry] = []
+    vistos: set[int] = set()
+
+    for p in TARGET_SHEET_ORDER:
+        entry = wb_index.entry(p)
+        if entry is not None and entry.position >= 2:
+            ordenadas.append(entry)
+            vistos.add(entry.position)
+    for entry in wb_index:
+        if entry.position >= 2 and entry.position not in vistos:
+            ordenadas.append(entry)
+
+    for entry in ordenadas:
+        ws = entry.ws
+        rows = wb_index.used_bounds(entry)[2]
+        for r in range(1, rows + 1):
+            raw = ws.Cells(r, TARGET_NAME_COL).Value
+            if isinstance(raw, str):
+                yield entry.name, ws, r, raw
+
+
+def _plan_target_cells(plan: WritePlan, wb_index: WorkbookIndex) -> Iterator[tuple[str, Any, int, str]]:
+    """Mismas celdas desde el plan precalculado (sin leer la columna B)."""
+    for item in plan.entries:
+        ws = wb_index.get(item.sheet)
+        if ws is not None:
+            yield item.sheet, ws, item.row, item.name
+
+
+def _write_vendor_values_to_other_sheets(
+    dst_wb,
+    vendor_map: dict[str, tuple[float | None, float | None, float | None]],
+    matcher: VendorMatcher | None = None,
+    wb_index: WorkbookIndex | None = None,
+    plan: WritePlan | None = None,
+) -> dict[str, object]:
     """
     Escribe v1,v2 (Importe, Cuenta) en columnas C y D de la fila cuyo col B coincida
-    con el vendedor destino. Usa alias y match difuso. Recorre en orden: SUR → NORTE → SURQUILLO → resto.
+    con el vendedor destino. Usa alias y match difuso. Recorre en orden: SUR → NORTE → SURQUILLO → resto,
+    o las coordenadas del ``plan`` del maestro si se indica.
+    Devuelve un resumen: vendedores escritos, sin destino y coincidencias difusas.
     """
+    summary: dict[str, object] = {"matched": [], "unmatched": [], "fuzzy": {}}
     if not vendor_map:
-        return
+        return summary
+    matcher = matcher or get_matcher()
+    summary["alias_version"] = matcher.version
 
     # 1) Normaliza claves del vendor_map y aplica alias → target
     # vendor_map viene con claves normalizadas? Si no, normalizamos aquí por seguridad.
     norm_vendor_map = { _norm(k): v for k, v in vendor_map.items() }
     mapped: dict[str, tuple[float | None, float | None, float | None]] = {}
     for key_norm, vals in norm_vendor_map.items():
-        target_norm = _map_vendor_key_to_target(key_norm)
+        target_norm = _map_vendor_key_to_target(key_norm, matcher)
         # Si dos orígenes mapean al mismo destino, el último gana (si quieres sumar, lo cambio).
         mapped[target_norm] = vals
 
-    # 2) Orden de recorrido de hojas
-    total = dst_wb.Worksheets.Count
-    preferred = ["SUR", "NORTE", "SURQUILLO"]  # <--- añadimos SURQUILLO
-    indices_ordenados: list[int] = []
-    vistos = set()
-
-    def _find_idx(name_norm: str) -> int | None:
-        for i in range(2, total + 1):
-            ws = dst_wb.Worksheets(i)
-            if _norm(ws.Name) == name_norm:
-                return i
-        return None
-
-    for p in preferred:
-        idx = _find_idx(_norm(p))
-        if idx is not None:
-            indices_ordenados.append(idx)
-            vistos.add(idx)
-    for i in range(2, total + 1):
-        if i not in vistos:
-            indices_ordenados.append(i)
+    # 2) Celdas candidatas de la columna B (plan precalculado o recorrido por COM)
+    wb_index = wb_index or WorkbookIndex(dst_wb)
+    cells = _plan_target_cells(plan, wb_index) if plan is not None else _scan_target_cells(wb_index)
 
     # 3) Escribir valores
-    target_keys = list(mapped.keys())  # ya normalizadas
-    for i in indices_ordenados:
-        ws = dst_wb.Worksheets(i)
-        used = ws.UsedRange
-        rows = used.Rows.Count
+    targets = matcher.index_for(mapped.keys())  # claves ya normalizadas
+    written: set[str] = set()
+    fuzzy: dict[str, dict[str, object]] = {}
+    for sheet_name, ws, r, raw in cells:
+        cell_norm = _norm(raw)
+
+        # Busca coincidencia exacta o difusa con keys destino
+        hit = targets.match(cell_norm)
+        if hit is not None:
+            match_key, score = hit
+            written.add(match_key)
+            if score < 1.0 or cell_norm != match_key:
+                fuzzy[f"{sheet_name}!{raw}"] = {"vendor": match_key, "score": round(score, 3)}
+            v1, v2, _ = mapped.get(match_key, (None, None, None))
+            try:
+                if v1 is not None:
+                    ws.Cells(r, TARGET_VAL_COLS[0]).Value = v1  # C
+                if v2 is not None:
+                    ws.Cells(r, TARGET_VAL_COLS[1]).Value = v2  # D
+            except Exception:
+                pass
+            # Sigue buscando otras filas (por si hay varias áreas con el mismo vendedor).
 
-        for r in range(1, rows + 1):
-            raw = ws.Cells(r, TARGET_NAME_COL).Value
-            if not isinstance(raw, str):
-                continue
-            cell_norm = _norm(raw)
-
-            # Busca coincidencia exacta o difusa con keys destino
-            match_key = None
-            if cell_norm in mapped:
-                match_key = cell_norm
-            else:
-                for tk in target_keys:
-                    if _is_fuzzy_match(cell_norm, tk):
-                        match_key = tk
-                        break
-
-            if match_key:
-                v1, v2, _ = mapped.get(match_key, (None, None, None))
-                try:
-                    if v1 is not None:
-                        ws.Cells(r, TARGET_VAL_COLS[0]).Value = v1  # C
-                    if v2 is not None:
-                        ws.Cells(r, TARGET_VAL_COLS[1]).Value = v2  # D
-                except Exception:
-                    pass
-                # Sigue buscando otras filas (por si hay varias áreas con el mismo vendedor).
+    summary["matched"] = sorted(written)
+    summary["unmatched"] = sorted(set(mapped) - written)
+    summary["fuzzy"] = fuzzy
+    return summary
 
 
 
@@ -336,8 +362,73 @@ def copy_first_sheet_exact(
     header_date: str | None = None,
     delete_first_rows: int = DELETE_FIRST_ROWS,
     progress_cb: Callable[[int, str], None] | None = None,
+    excel=None,
+    report: JobReport | None = None,
+    after_save: Callable[[Any, WorkbookIndex, ExcelSession], None] | None = None,
+    source_name: str | None = None,
+    cancel: CancelToken | None = None,
 ) -> str:
-    """Pipeline principal."""
+    """
+    Pipeline principal.
+    Si se pasa ``excel`` (instancia ya creada, p.ej. la del proceso trabajador)
+    se reutiliza y no se cierra; si no, se abre y se cierra un Excel propio.
+    ``report`` acumula los tiempos por etapa (ms) y detalles del trabajo.
+    ``after_save(dst_wb, dst_index, session)`` se ejecuta tras guardar, con el
+    libro destino aún abierto y la sesión ya finalizada (p.ej. exportar PDFs
+    sin volver a abrir el archivo).
+    ``source_name`` (nombre original del origen) queda en el histórico de
+    totales por vendedor.
+    ``cancel`` se revisa entre etapas: al cancelar se cierran los libros sin
+    guardar, se borran los archivos generados y se lanza ``JobCancelled``.
+    """
+    outputs = _merge_pass(
+        source_xls_path, master_xls_path, [header_date],
+        delete_first_rows=delete_first_rows, progress_cb=progress_cb,
+        excel=excel, report=report, after_save=after_save, source_name=source_name,
+        cancel=cancel,
+    )
+    return outputs[0][1]
+
+
+def copy_first_sheet_per_date(
+    source_xls_path: str,
+    master_xls_path: str,
+    header_dates: List[str],
+    *,
+    delete_first_rows: int = DELETE_FIRST_ROWS,
+    progress_cb: Callable[[int, str], None] | None = None,
+    excel=None,
+    report: JobReport | None = None,
+    source_name: str | None = None,
+    cancel: CancelToken | None = None,
+) -> List[Tuple[str, str]]:
+    """
+    Un solo merge (abrir, pegar, propagar vendedores) y, por cada fecha,
+    sólo la reescritura de fecha/título y un ``SaveAs``.
+    Devuelve [(fecha ISO, ruta .xls)] en el orden recibido.
+    """
+    if not header_dates:
+        raise ExcelCopyError("Se requiere al menos una fecha.")
+    return _merge_pass(  # type: ignore[return-value]
+        source_xls_path, master_xls_path, list(header_dates),
+        delete_first_rows=delete_first_rows, progress_cb=progress_cb,
+        excel=excel, report=report, source_name=source_name, cancel=cancel,
+    )
+
+
+def _merge_pass(
+    source_xls_path: str,
+    master_xls_path: str,
+    header_dates: List[str | None],
+    *,
+    delete_first_rows: int,
+    progress_cb: Callable[[int, str], None] | None,
+    excel,
+    report: JobReport | None,
+    after_save: Callable[[Any, WorkbookIndex, ExcelSession], None] | None = None,
+    source_name: str | None = None,
+    cancel: CancelToken | None = None,
+) -> List[Tuple[str | None, str]]:
     if not os.path.isfile(source_xls_path):
         raise ExcelCopyError(f"No existe el archivo origen: {source_xls_path}")
     if not os.path.isfile(master_xls_path):
@@ -350,97 +441,172 @@ def copy_first_sheet_exact(
 
     notify(5, "Inicializando Excel...")
 
-
-    pythoncom.CoInitialize()
-    excel = None
+    report = report if report is not None else JobReport()
+    own_excel = excel is None
+    if own_excel:
+        _, DispatchEx = _win32()
+        co_initialize()
     src_wb = None
     dst_wb = None
+    session: ExcelSession | None = None
+    out_dir: str | None = None
+    cancelled = False
     try:
-        excel = DispatchEx("Excel.Application")  # instancia nueva evita conflictos
-        excel.Visible = False
-        excel.DisplayAlerts = False
-
-        src_wb = excel.Workbooks.Open(source_xls_path, UpdateLinks=0, ReadOnly=True)
-        dst_wb = excel.Workbooks.Open(master_xls_path, UpdateLinks=0, ReadOnly=False)
+        check_cancel(cancel)
+        if own_excel:
+            with report.stage("excel_start"):
+                excel = DispatchEx("Excel.Application")  # instancia nueva evita conflictos
+                excel.Visible = False
+                excel.DisplayAlerts = False
+
+        with report.stage("open"):
+            src_wb = com_call(excel.Workbooks.Open, source_xls_path, UpdateLinks=0, ReadOnly=True)
+            dst_wb = com_call(excel.Workbooks.Open, master_xls_path, UpdateLinks=0, ReadOnly=False)
         notify(25, "Abriendo libros en Excel...")
+        check_cancel(cancel)
+
+        # Cálculo manual / sin repintado ni eventos mientras se edita el maestro
+        session = ExcelSession(excel, report).apply()
 
         src_ws = src_wb.Worksheets(1)
-        dst_ws = dst_wb.Worksheets(1)
+        dst_index = WorkbookIndex(dst_wb)
+        dst_ws = dst_index.at(1).ws
         notify(45, "Copiando hoja de origen...")
 
         # Limpiar y pegar robusto
-        dst_ws.Cells.Clear()
-        _paste_all_robust(excel, src_ws, dst_ws)
+        with report.stage("paste"):
+            dst_ws.Cells.Clear()
+            report.details["paste_method"] = _paste_all_robust(excel, src_ws, dst_ws)
         notify(60, "Pegado completo. Aplicando ajustes...")
+        check_cancel(cancel)
 
         # Borrar primeras N filas
         if delete_first_rows and delete_first_rows > 0:
-            try:
-                dst_ws.Rows(f"1:{delete_first_rows}").Delete()
-            except Exception:
+            with report.stage("delete_rows"):
                 try:
-                    dst_ws.UsedRange.UnMerge()
                     dst_ws.Rows(f"1:{delete_first_rows}").Delete()
                 except Exception:
-                    pass
+                    try:
+                        dst_ws.UsedRange.UnMerge()
+                        dst_ws.Rows(f"1:{delete_first_rows}").Delete()
+                    except Exception:
+                        pass
 
-        # Reemplazo de fecha en encabezado
-        if header_date:
+        # Ajuste básico de anchos de columnas según origen (opcional)
+        with report.stage("column_widths"):
             try:
-                _update_header_date_in_cells(dst_ws, header_date, HEADER_SCAN_ROWS, HEADER_SCAN_COLS)
-                es_date = _iso_to_es_ddmmyyyy(header_date)
-                if es_date:
-                    _replace_date_in_shapes(dst_ws, es_date)
-                    _replace_date_in_page_headers(dst_ws, es_date)
+                used_src = src_ws.UsedRange
+                used_dst = dst_ws.UsedRange
+                cols = min(used_dst.Columns.Count, used_src.Columns.Count)
+                for c in range(1, cols + 1):
+                    dst_ws.Columns(c).ColumnWidth = src_ws.Columns(c).ColumnWidth
             except Exception:
                 pass
 
-        # Ajuste básico de anchos de columnas según origen (opcional)
-        try:
-            used_src = src_ws.UsedRange
-            used_dst = dst_ws.UsedRange
-            cols = min(used_dst.Columns.Count, used_src.Columns.Count)
-            for c in range(1, cols + 1):
-                dst_ws.Columns(c).ColumnWidth = src_ws.Columns(c).ColumnWidth
-        except Exception:
-            pass
-
         # === NUEVO: leer “Saldo para <VENDEDOR>” de Hoja1 y escribir a otras hojas
-        vendor_map = _collect_vendor_totals_from_sheet1(dst_ws)
+        check_cancel(cancel)
+        with report.stage("vendor_totals"):
+            vendor_map = _collect_vendor_totals_from_sheet1(dst_ws)
+        report.count("vendors_found", len(vendor_map))
+        # Coordenadas destino precalculadas por hash del maestro (si se puede leer sin Excel)
+        with report.stage("write_plan"):
+            plan, plan_hit = get_write_plan(master_xls_path)
+        report.count("write_plan_hits" if plan_hit else "write_plan_misses")
+        report.details["write_plan"] = (
+            {"source": plan.source, "cached": plan_hit, "entries": len(plan.entries), "build_ms": plan.build_ms}
+            if plan is not None else {"source": "scan"}
+        )
         # Solo los dos primeros valores; el tercero (saldo) lo calculan fórmulas en destino
-        _write_vendor_values_to_other_sheets(dst_wb, vendor_map)
+        check_cancel(cancel)
+        with report.stage("vendor_write"):
+            match_summary = _write_vendor_values_to_other_sheets(dst_wb, vendor_map, wb_index=dst_index, plan=plan)
+        report.details["vendor_match"] = match_summary
+        unmatched = list(match_summary["unmatched"])  # type: ignore[call-overload]
+        report.count("vendors_unmatched", len(unmatched))
+        if unmatched:
+            logger.warning("Vendors without target row: %s", ", ".join(unmatched))
         notify(80, "Actualizando hojas destino...")
-         # --- Actualiza el título de SUR y NORTE con la fecha seleccionada ---
-        if header_date:
-            try:
-                for sheet_name in ("SUR", "NORTE"):
-                    ws_title = _find_ws_by_name_norm(dst_wb, sheet_name)
-                    if ws_title is not None:
-                        _update_sheet_title_cobranza(ws_title, header_date, search_rows=6, search_cols=30)
-            except Exception:
-                pass
-
         excel.CutCopyMode = False
 
-        # Guardar con nombre único
+        # Por fecha: sólo reescritura de fecha/títulos y SaveAs. Las reglas
+        # buscan patrones genéricos, así que reaplicarlas pisa la fecha anterior.
         out_dir = tempfile.mkdtemp(prefix="cobranza_xls_")
         ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        base_name = f"maestro_copiado_{ts}.xls"
-        out_path = os.path.join(out_dir, base_name)
-        try:
-            notify(90, "Guardando archivo resultado...")
-            dst_wb.SaveAs(out_path, FileFormat=XL_XLS_FORMAT)
-        except Exception:
-            base_name = f"maestro_copiado_{ts}_{uuid.uuid4().hex[:8]}.xls"
+        multi = len(header_dates) > 1
+        outputs: List[Tuple[str | None, str]] = []
+        for i, header_date in enumerate(header_dates):
+            check_cancel(cancel)
+            # Fecha del encabezado (Hoja1) y títulos de SUR/NORTE en una sola pasada
+            if header_date:
+                with report.stage("text_rewrite"):
+                    rewriter = TextRewriter(_header_rules(header_date))
+                    targets = [SheetTarget(dst_ws, HEADER_SCAN_ROWS, HEADER_SCAN_COLS, rules=("header_date",))]
+                    for sheet_name in TITLE_SHEETS:
+                        ws_title = dst_index.get(sheet_name)
+                        if ws_title is not None:
+                            targets.append(SheetTarget(
+                                ws_title, TITLE_SCAN_ROWS, TITLE_SCAN_COLS,
+                                rules=("title",), page_headers=False,
+                            ))
+                    counts = rewriter.run(targets, page_setup_batch=session.print_batch)
+                if multi:
+                    report.details.setdefault("rewrites", {})[header_date] = counts
+                else:
+                    report.details["rewrites"] = counts
+
+            # Un único recálculo antes del primer guardado (las fórmulas de SUR/NORTE);
+            # después el cálculo vuelve a su modo original
+            session.finalize()
+
+            # Guardar con nombre único
+            tag = f"_{header_date}" if multi and header_date else ""
+            base_name = f"maestro_copiado_{ts}{tag}.xls"
             out_path = os.path.join(out_dir, base_name)
-            dst_wb.SaveAs(out_path, FileFormat=XL_XLS_FORMAT)
+            with report.stage("save"):
+                try:
+                    notify(90 + (9 * i) // len(header_dates), "Guardando archivo resultado...")
+                    com_call(dst_wb.SaveAs, out_path, FileFormat=XL_XLS_FORMAT)
+                except Exception:
+                    base_name = f"maestro_copiado_{ts}{tag}_{uuid.uuid4().hex[:8]}.xls"
+                    out_path = os.path.join(out_dir, base_name)
+                    dst_wb.SaveAs(out_path, FileFormat=XL_XLS_FORMAT)
+            outputs.append((header_date, out_path))
+        report.count("outputs", len(outputs))
+
+        check_cancel(cancel)
+        if after_save is not None:
+            # El origen ya no hace falta: se libera antes de la etapa siguiente
+            src_wb.Close(SaveChanges=False)
+            src_wb = None
+            dst_index.invalidate()
+            after_save(dst_wb, dst_index, session)
+            check_cancel(cancel)
+
+        # Histórico de totales por vendedor (sólo de trabajos completos): una
+        # instantánea por fecha generada
+        with report.stage("history"):
+            recorded = [
+                record_merge_totals(
+                    header_date, vendor_map,
+                    source_path=source_xls_path, source_name=source_name, master_path=master_xls_path,
+                )
+                for header_date in dict.fromkeys(header_dates)
+            ]
+        if any(recorded):
+            report.details["history"] = [item for item in recorded if item]
 
         notify(99, "Archivo listo.")
-        return out_path
+        return outputs
 
+    except JobCancelled:
+        cancelled = True
+        logger.info("Merge cancelled; closing workbooks without saving")
+        raise
     except Exception as e:
         raise ExcelCopyError(str(e))
     finally:
+        if session is not None:
+            session.restore()
         try:
             if src_wb is not None:
                 src_wb.Close(SaveChanges=False)
@@ -451,12 +617,16 @@ def copy_first_sheet_exact(
                 dst_wb.Close(SaveChanges=False)
         except Exception:
             pass
-        try:
-            if excel is not None:
-                excel.Quit()
-        except Exception:
-            pass
-        pythoncom.CoUninitialize()
+        if own_excel:
+            try:
+                if excel is not None:
+                    excel.Quit()
+            except Exception:
+                pass
+            co_uninitialize()
+        # Con los libros ya cerrados (Windows no borra archivos abiertos)
+        if cancelled and out_dir is not None:
+            shutil.rmtree(out_dir, ignore_errors=True)
 # --- Meses en español en MAYÚSCULAS (con SETIEMBRE como en Perú) ---
 _ES_MESES = {
     1: "ENERO", 2: "FEBRERO", 3: "MARZO", 4: "ABRIL",
@@ -474,59 +644,3 @@ def _es_title_from_iso(iso_date: str) -> str | None:
         return f"COBRANZA AL {dt.strftime('%d')} {mes} {dt.year}"
     except Exception:
         return None
-
-def _update_sheet_title_cobranza(ws, iso_date: str, search_rows: int = 6, search_cols: int = 20):
-    """
-    Busca en las primeras filas un texto que contenga 'COBRANZA AL' (en celdas y en shapes)
-    y lo reemplaza COMPLETO por el título target.
-    """
-    title = _es_title_from_iso(iso_date)
-    if not title:
-        return
-
-    # 1) En celdas (primeras filas/columnas)
-    try:
-        used = ws.UsedRange
-        rows = min(search_rows, used.Rows.Count)
-        cols = min(search_cols, used.Columns.Count)
-        for r in range(1, rows + 1):
-            for c in range(1, cols + 1):
-                cell = ws.Cells(r, c)
-                v = cell.Value
-                if isinstance(v, str) and "COBRANZA AL" in v.upper():
-                    cell.Value = title
-    except Exception:
-        pass
-
-    # 2) En shapes (cuadros de texto)
-    try:
-        for shp in ws.Shapes:
-            repl = False
-            # TextFrame2
-            try:
-                if shp.TextFrame2.HasText:
-                    t = shp.TextFrame2.TextRange.Text or ""
-                    if "COBRANZA AL" in t.upper():
-                        shp.TextFrame2.TextRange.Text = title
-                        repl = True
-            except Exception:
-                pass
-            if repl:
-                continue
-            # TextFrame clásico
-            try:
-                t = shp.TextFrame.Characters().Text or ""
-                if "COBRANZA AL" in t.upper():
-                    shp.TextFrame.Characters().Text = title
-            except Exception:
-                pass
-    except Exception:
-        pass
-
-def _find_ws_by_name_norm(wb, name: str):
-    tgt = _norm(name)
-    for i in range(1, wb.Worksheets.Count + 1):
-        ws = wb.Worksheets(i)
-        if _norm(ws.Name) == tgt:
-            return ws
-    return None
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+excel_session.py
+----------------
+Ajustes de rendimiento de Excel durante un trabajo:
+- ``Calculation`` en manual (cada escritura en el maestro ya no recalcula
+  las fórmulas de SUR/NORTE),
+- ``ScreenUpdating`` y ``EnableEvents`` desactivados,
+- ``PrintCommunication`` desactivado sólo mientras se configura PageSetup
+  (``print_batch``), reactivándolo antes de exportar,
+- un único ``Calculate`` antes de guardar/exportar (``finalize``),
+- restauración del estado original al salir, incluso si hay error.
+
+Se desactiva con COBRANZA_EXCEL_TUNING=0 (útil para comparar los tiempos
+por etapa del JobReport con y sin ajustes).
+"""
+from __future__ import annotations
+
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .job_report import JobReport
+
+XL_CALCULATION_MANUAL = -4135
+
+# (atributo, valor durante el trabajo) — Calculation requiere un libro abierto
+TUNED_ATTRS = (
+    ("ScreenUpdating", False),
+    ("EnableEvents", False),
+    ("Calculation", XL_CALCULATION_MANUAL),
+)
+
+
+def tuning_enabled() -> bool:
+    value = os.getenv("COBRANZA_EXCEL_TUNING")
+    if value is None:
+        return True
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+class ExcelSession:
+    """
+    Uso::
+
+        session = ExcelSession(excel, report).apply()   # con libros ya abiertos
+        try:
+            ... escrituras ...
+            session.finalize()                          # Calculate + restaura cálculo
+            wb.SaveAs(...)
+        finally:
+            session.restore()
+
+    También se puede usar como context manager (``with ExcelSession(...)``).
+    """
+
+    def __init__(self, excel, report: Optional[JobReport] = None, enabled: Optional[bool] = None):
+        self.excel = excel
+        self.report = report
+        self.enabled = tuning_enabled() if enabled is None else enabled
+        self._saved: Dict[str, Any] = {}
+        self._calculated = False
+
+    def apply(self) -> "ExcelSession":
+        if not self.enabled or self.excel is None:
+            self._record()
+            return self
+        for attr, value in TUNED_ATTRS:
+            try:
+                current = getattr(self.excel, attr)
+                if current != value:
+                    setattr(self.excel, attr, value)
+                    self._saved[attr] = current
+            except Exception:
+                pass  # p.ej. Calculation sin libros abiertos
+        self._record()
+        return self
+
+    def _record(self) -> None:
+        if self.report is not None:
+            self.report.details["excel_tuning"] = {
+                "enabled": self.enabled,
+                "applied": sorted(self._saved),
+            }
+
+    def _restore_attr(self, attr: str) -> None:
+        if attr not in self._saved:
+            return
+        try:
+            setattr(self.excel, attr, self._saved.pop(attr))
+        except Exception:
+            pass
+
+    def finalize(self) -> None:
+        """Un solo recálculo antes de guardar/exportar; el libro se guarda con su modo original."""
+        if self._calculated:
+            return
+        self._calculated = True
+        if "Calculation" not in self._saved:
+            return
+        stage = self.report.stage("calculate") if self.report is not None else _noop()
+        with stage:
+            try:
+                self.excel.Calculate()
+            except Exception:
+                pass
+            self._restore_attr("Calculation")
+
+    @contextmanager
+    def print_batch(self) -> Iterator[None]:
+        """Agrupa cambios de PageSetup sin comunicarse con la impresora en cada uno."""
+        toggled = False
+        if self.enabled and self.excel is not None:
+            try:
+                if self.excel.PrintCommunication:
+                    self.excel.PrintCommunication = False
+                    toggled = True
+            except Exception:
+                pass
+        try:
+            yield
+        finally:
+            if toggled:
+                try:
+                    self.excel.PrintCommunication = True
+                except Exception:
+                    pass
+
+    def restore(self) -> None:
+        for attr, _ in reversed(TUNED_ATTRS):
+            self._restore_attr(attr)
+
+    def __enter__(self) -> "ExcelSession":
+        return self.apply()
+
+    def __exit__(self, *exc_info) -> None:
+        self.restore()
+
+
+@contextmanager
+def _noop() -> Iterator[None]:
+    yield
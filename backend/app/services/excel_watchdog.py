@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+excel_watchdog.py
+-----------------
+Vigilancia de los Excel que lanza la app.
+
+Un diálogo invisible o un ``SaveAs`` trabado dejan la llamada COM bloqueada
+para siempre: el trabajo no termina y el ``EXCEL.EXE`` queda huérfano. Para
+evitarlo:
+
+- ``ExcelWatchdog.watch(pid)`` sigue un trabajo: el pid de su Excel y la
+  etapa en curso (las etapas de ``JobReport`` avisan vía
+  ``stage_observer``). Cada etapa tiene un plazo; si se excede, un hilo
+  supervisor mata ese Excel (la llamada COM bloqueada falla enseguida) y el
+  trabajo termina con ``ExcelStageTimeout``.
+- ``ExcelPidRegistry``: un archivo por Excel lanzado (pid, hora de creación
+  del proceso y proceso dueño). ``sweep()`` mata los registrados cuyo dueño
+  ya no existe (reinicio o caída de la app, trabajador del pool terminado) y
+  se ejecuta al arrancar.
+- ``ProcessTable``: listar / comprobar / matar procesos. ``SystemProcessTable``
+  usa la API de Windows (``/proc`` y señales en POSIX) y ``FakeProcessTable``
+  permite probar el supervisor en Linux sin Excel.
+
+Sólo se matan procesos que la app registró y que siguen siendo EXCEL.EXE
+con la misma hora de creación: Windows reutiliza los pids, y un Excel que
+el usuario abrió después con el pid de uno registrado nunca se toca.
+
+COBRANZA_WATCHDOG=0 lo desactiva.
+COBRANZA_STAGE_TIMEOUTS: plazos en segundos, p.ej. "open=90,save=60,default=300"
+  (``default`` rige las etapas sin plazo propio y el tiempo entre etapas).
+COBRANZA_WATCHDOG_POLL: cada cuántos segundos revisa los plazos (1).
+COBRANZA_EXCEL_PID_DIR: carpeta del registro (por defecto excel_pids junto a
+  la base de trabajos).
+"""
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .. import metrics
+from ..job_store import job_db_path, pid_alive
+from .job_report import stage_observer
+
+logger = logging.getLogger("cobranza.watchdog")
+
+EXCEL_IMAGE = "EXCEL.EXE"
+IDLE_STAGE = "idle"
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_KILL_WAIT = 5.0
+CREATE_TIME_TOLERANCE = 0.01  # s; la hora de creación se lee siempre igual para un mismo proceso
+DEFAULT_STAGE_TIMEOUTS: Dict[str, float] = {
+    "open": 120.0,
+    "paste": 180.0,
+    "save": 120.0,
+    "export_full_sheets": 90.0,
+    "block_export": 90.0,
+    "default": 300.0,
+}
+
+
+class ExcelStageTimeout(Exception):
+    """Una etapa excedió su plazo; el watchdog cerró el Excel del trabajo."""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"La etapa '{stage}' excedió {seconds:g} s; se cerró Excel.")
+        self.stage = stage
+        self.seconds = seconds
+
+    def __reduce__(self):
+        return (type(self), (self.stage, self.seconds))
+
+
+def parse_stage_timeouts(value: Optional[str]) -> Dict[str, float]:
+    """'open=90,save=60' -> plazos por etapa sobre los valores por defecto."""
+    timeouts = dict(DEFAULT_STAGE_TIMEOUTS)
+    for item in (value or "").split(","):
+        name, sep, raw = item.partition("=")
+        if not sep:
+            continue
+        try:
+            timeouts[name.strip()] = float(raw)
+        except ValueError:
+            logger.warning("Ignoring invalid stage timeout: %s", item.strip())
+    return timeouts
+
+
+# -------------------------------------------------------------------
+# Tabla de procesos
+# -------------------------------------------------------------------
+class ProcessTable(ABC):
+    """Lo mínimo que necesita el watchdog del sistema operativo."""
+
+    @abstractmethod
+    def excel_pids(self) -> Set[int]:
+        ...
+
+    @abstractmethod
+    def alive(self, pid: int) -> bool:
+        ...
+
+    @abstractmethod
+    def create_time(self, pid: int) -> Optional[float]:
+        """Hora de creación de ``pid`` (epoch, s) o None si no existe: distingue un pid reutilizado."""
+
+    @abstractmethod
+    def kill(self, pid: int, wait: float = DEFAULT_KILL_WAIT) -> bool:
+        """Termina ``pid`` y espera a que salga; True si ya no existe."""
+
+
+_FILETIME_EPOCH_OFFSET = 11644473600  # s entre 1601-01-01 y 1970-01-01
+
+
+def _boot_time() -> float:
+    with open("/proc/stat", encoding="utf-8") as fh:
+        for line in fh:
+            if line.startswith("btime "):
+                return float(line.split()[1])
+    raise ValueError("btime")
+
+
+class SystemProcessTable(ProcessTable):
+    def excel_pids(self) -> Set[int]:
+        if sys.platform == "win32":
+            try:
+                out = subprocess.run(
+                    ["tasklist", "/FO", "CSV", "/NH", "/FI", f"IMAGENAME eq {EXCEL_IMAGE}"],
+                    capture_output=True, text=True, timeout=15,
+                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+                ).stdout
+            except (OSError, subprocess.SubprocessError) as exc:
+                logger.warning("Could not list Excel processes: %s", exc)
+                return set()
+            # Sin coincidencias tasklist imprime un aviso, no filas CSV
+            return {
+                int(row[1]) for row in csv.reader(out.splitlines())
+                if len(row) > 1 and row[0].upper() == EXCEL_IMAGE and row[1].isdigit()
+            }
+        pids: Set[int] = set()
+        try:
+            entries = os.listdir("/proc")
+        except OSError:
+            return pids
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/comm", encoding="utf-8", errors="replace") as fh:
+                    if fh.read().strip().upper() == EXCEL_IMAGE:
+                        pids.add(int(entry))
+            except OSError:
+                continue
+        return pids
+
+    def alive(self, pid: int) -> bool:
+        return pid_alive(pid)
+
+    def create_time(self, pid: int) -> Optional[float]:
+        if pid <= 0:
+            return None
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+            kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+            handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+            if not handle:
+                return None
+            try:
+                creation, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+                if not kernel32.GetProcessTimes(
+                    handle, ctypes.byref(creation), ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user),
+                ):
+                    return None
+                # FILETIME: intervalos de 100 ns desde 1601-01-01
+                ticks = (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+                return ticks / 1e7 - _FILETIME_EPOCH_OFFSET
+            finally:
+                kernel32.CloseHandle(handle)
+        try:
+            with open(f"/proc/{pid}/stat", encoding="utf-8", errors="replace") as fh:
+                stat = fh.read()
+            # Campo 22 (starttime, en ticks desde el arranque); el nombre (campo 2) puede tener espacios
+            start_ticks = int(stat[stat.rindex(")") + 2:].split()[19])
+            return _boot_time() + start_ticks / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def kill(self, pid: int, wait: float = DEFAULT_KILL_WAIT) -> bool:
+        if sys.platform == "win32":
+            import ctypes
+
+            PROCESS_TERMINATE = 0x0001
+            SYNCHRONIZE = 0x00100000
+            kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+            handle = kernel32.OpenProcess(PROCESS_TERMINATE | SYNCHRONIZE, False, pid)
+            if not handle:
+                return not pid_alive(pid)
+            try:
+                kernel32.TerminateProcess(handle, 1)
+                # WAIT_OBJECT_0: el proceso terminó y el sistema lo liberó
+                return kernel32.WaitForSingleObject(handle, int(wait * 1000)) == 0
+            finally:
+                kernel32.CloseHandle(handle)
+        import signal
+
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            try:
+                # Recoge el zombi si es hijo nuestro
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    return True
+            except ChildProcessError:
+                pass
+            if not pid_alive(pid):
+                return True
+            time.sleep(0.05)
+        return False
+
+
+class FakeProcessTable(ProcessTable):
+    """
+    Procesos en memoria ({pid: nombre}) para probar el supervisor sin Excel.
+    Cada ``spawn`` recibe una hora de creación nueva (o ``created``), como un
+    pid reutilizado por el sistema.
+    """
+
+    def __init__(self, procs: Optional[Dict[int, str]] = None):
+        self.procs: Dict[int, str] = {}
+        self.created: Dict[int, float] = {}
+        self.killed: List[int] = []
+        self._lock = threading.Lock()
+        self._clock = 0.0
+        for pid, name in (procs or {}).items():
+            self.spawn(pid, name)
+
+    def spawn(self, pid: int, name: str = EXCEL_IMAGE, created: Optional[float] = None) -> int:
+        with self._lock:
+            self._clock += 1.0
+            self.procs[pid] = name
+            self.created[pid] = self._clock if created is None else created
+        return pid
+
+    def excel_pids(self) -> Set[int]:
+        with self._lock:
+            return {pid for pid, name in self.procs.items() if name.upper() == EXCEL_IMAGE}
+
+    def alive(self, pid: int) -> bool:
+        with self._lock:
+            return pid in self.procs
+
+    def create_time(self, pid: int) -> Optional[float]:
+        with self._lock:
+            return self.created.get(pid) if pid in self.procs else None
+
+    def kill(self, pid: int, wait: float = DEFAULT_KILL_WAIT) -> bool:
+        with self._lock:
+            if self.procs.pop(pid, None) is not None:
+                self.created.pop(pid, None)
+                self.killed.append(pid)
+        return True
+
+
+def excel_pid(excel) -> Optional[int]:
+    """Pid del EXCEL.EXE detrás de la instancia COM (por su ventana principal)."""
+    if sys.platform != "win32":
+        return None
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        pid = wintypes.DWORD()
+        ctypes.windll.user32.GetWindowThreadProcessId(int(excel.Hwnd), ctypes.byref(pid))
+        return int(pid.value) or None
+    except Exception as exc:
+        logger.warning("Could not resolve Excel pid: %s", exc)
+        return None
+
+
+# -------------------------------------------------------------------
+# Registro de pids
+# -------------------------------------------------------------------
+def excel_pid_dir() -> Path:
+    env_dir = os.getenv("COBRANZA_EXCEL_PID_DIR")
+    return Path(env_dir) if env_dir else job_db_path().parent / "excel_pids"
+
+
+class ExcelPidRegistry:
+    """
+    Un archivo ``<pid>.json`` por Excel lanzado: crear y borrar un archivo es
+    atómico, así que varios procesos (uvicorn, trabajadores del pool) lo
+    comparten sin bloqueos.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def register(self, pid: int, owner: Optional[int] = None, created: Optional[float] = None) -> None:
+        """``created``: hora de creación del proceso (``ProcessTable.create_time``)."""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            entry = {"pid": pid, "owner": owner or os.getpid(), "created": created, "started_at": time.time()}
+            (self.directory / f"{pid}.json").write_text(json.dumps(entry), encoding="utf-8")
+        except OSError as exc:
+            logger.warning("Could not register Excel pid %s: %s", pid, exc)
+
+    def unregister(self, pid: int) -> None:
+        try:
+            (self.directory / f"{pid}.json").unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def entries(self) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        try:
+            paths = list(self.directory.glob("*.json"))
+        except OSError:
+            return items
+        for path in paths:
+            try:
+                items.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                # Archivo a medio escribir o dañado: se descarta
+                path.unlink(missing_ok=True)
+        return items
+
+
+# -------------------------------------------------------------------
+# Supervisor
+# -------------------------------------------------------------------
+class WatchedJob:
+    """Excel de un trabajo y su etapa en curso (pila: las etapas pueden anidarse)."""
+
+    def __init__(self, pid: int, label: str, timeouts: Dict[str, float], clock: Callable[[], float]):
+        self.pid = pid
+        self.label = label
+        self._timeouts = timeouts
+        self._clock = clock
+        self._stack: List[Tuple[str, float, float]] = []
+        self._idle = self._frame(IDLE_STAGE)
+        self.expired: Optional[Tuple[str, float]] = None
+
+    def _frame(self, stage: str) -> Tuple[str, float, float]:
+        limit = self._timeouts.get(stage, self._timeouts.get("default", DEFAULT_STAGE_TIMEOUTS["default"]))
+        return stage, limit, self._clock() + limit
+
+    def on_stage(self, stage: str, entering: bool) -> None:
+        if entering:
+            self._stack.append(self._frame(stage))
+        elif self._stack:
+            self._stack.pop()
+            if not self._stack:
+                self._idle = self._frame(IDLE_STAGE)
+
+    @property
+    def current(self) -> Tuple[str, float, float]:
+        """(etapa, plazo en s, vencimiento)."""
+        return self._stack[-1] if self._stack else self._idle
+
+    def as_dict(self) -> Dict[str, Any]:
+        stage, limit, deadline = self.current
+        return {
+            "pid": self.pid, "label": self.label, "stage": stage, "timeout_s": limit,
+            "remaining_s": round(deadline - self._clock(), 1), "expired": self.expired is not None,
+        }
+
+
+def _same_process(recorded: Any, current: Optional[float]) -> bool:
+    if not isinstance(recorded, (int, float)) or current is None:
+        return False
+    return abs(float(recorded) - current) < CREATE_TIME_TOLERANCE
+
+
+class ExcelWatchdog:
+    def __init__(
+        self,
+        table: Optional[ProcessTable] = None,
+        registry: Optional[ExcelPidRegistry] = None,
+        timeouts: Optional[Dict[str, float]] = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.table = table if table is not None else SystemProcessTable()
+        self.registry = registry
+        self.timeouts = timeouts if timeouts is not None else dict(DEFAULT_STAGE_TIMEOUTS)
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._jobs: Dict[int, WatchedJob] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- registro de Excel lanzados ----------
+    def launched(self, pid: Optional[int]) -> None:
+        if pid and self.registry is not None:
+            self.registry.register(pid, created=self.table.create_time(pid))
+
+    def closed(self, pid: Optional[int]) -> None:
+        if pid and self.registry is not None:
+            self.registry.unregister(pid)
+
+    # ---------- trabajos ----------
+    @contextmanager
+    def watch(self, pid: Optional[int], label: str = "") -> Iterator[Optional[WatchedJob]]:
+        """
+        Vigila el bloque (un trabajo sobre el Excel ``pid``) en el hilo
+        actual. Devuelve el ``WatchedJob`` (``expired`` indica si se mató
+        Excel) o None si no hay pid.
+        """
+        if not pid:
+            yield None
+            return
+        job = WatchedJob(pid, label, self.timeouts, self.clock)
+        with self._lock:
+            self._jobs[id(job)] = job
+        self.start()
+        try:
+            with stage_observer(job.on_stage):
+                yield job
+        finally:
+            with self._lock:
+                self._jobs.pop(id(job), None)
+
+    def check(self) -> List[WatchedJob]:
+        """Una pasada del supervisor: mata los Excel con la etapa vencida."""
+        now = self.clock()
+        with self._lock:
+            due = [job for job in self._jobs.values() if job.expired is None and job.current[2] <= now]
+        for job in due:
+            stage, limit, _ = job.current
+            job.expired = (stage, limit)
+            logger.error(
+                "Excel pid=%s stuck in stage '%s' for more than %gs (%s); killing it",
+                job.pid, stage, limit, job.label or "job",
+            )
+            gone = self.table.kill(job.pid)
+            metrics.incr("watchdog.kills")
+            if gone:
+                self.closed(job.pid)
+            else:
+                logger.error("Excel pid=%s did not exit after kill", job.pid)
+        return due
+
+    def sweep(self) -> Dict[str, int]:
+        """
+        Mata los Excel registrados cuyo proceso dueño ya no existe, si el pid
+        sigue siendo el mismo proceso (misma hora de creación). Un pid que ya
+        es otro proceso, o sin hora registrada, sólo se olvida.
+        """
+        summary = {"killed": 0, "stale": 0}
+        if self.registry is None:
+            return summary
+        entries = self.registry.entries()
+        orphans = [e for e in entries if not self.table.alive(int(e.get("owner") or 0))]
+        if not orphans:
+            return summary
+        running = self.table.excel_pids()
+        for entry in orphans:
+            pid = int(entry.get("pid") or 0)
+            if pid in running and _same_process(entry.get("created"), self.table.create_time(pid)):
+                if self.table.kill(pid):
+                    summary["killed"] += 1
+                    self.registry.unregister(pid)
+            else:
+                # Ya terminó (o el pid es ahora de otro proceso): sólo se olvida
+                summary["stale"] += 1
+                self.registry.unregister(pid)
+        if summary["killed"]:
+            metrics.incr("watchdog.swept", summary["killed"])
+            logger.warning("Killed %d orphaned Excel process(es)", summary["killed"])
+        return summary
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [job.as_dict() for job in self._jobs.values()]
+
+    # ---------- hilo supervisor ----------
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="excel-watchdog", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as exc:
+                logger.warning("Watchdog pass failed: %s", exc)
+
+
+_watchdog: Optional[ExcelWatchdog] = None
+_watchdog_lock = threading.Lock()
+
+
+def watchdog_enabled() -> bool:
+    return os.getenv("COBRANZA_WATCHDOG", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def get_watchdog() -> Optional[ExcelWatchdog]:
+    """Watchdog del proceso (None si COBRANZA_WATCHDOG=0)."""
+    global _watchdog
+    if not watchdog_enabled():
+        return None
+    with _watchdog_lock:
+        if _watchdog is None:
+            try:
+                poll = float(os.getenv("COBRANZA_WATCHDOG_POLL", str(DEFAULT_POLL_INTERVAL)))
+            except ValueError:
+                poll = DEFAULT_POLL_INTERVAL
+            _watchdog = ExcelWatchdog(
+                registry=ExcelPidRegistry(excel_pid_dir()),
+                timeouts=parse_stage_timeouts(os.getenv("COBRANZA_STAGE_TIMEOUTS")),
+                poll_interval=poll,
+            )
+        return _watchdog
+
+
+def set_watchdog(watchdog: Optional[ExcelWatchdog]) -> Optional[ExcelWatchdog]:
+    """Reemplaza el watchdog (p.ej. con ``FakeProcessTable`` en pruebas); devuelve el anterior."""
+    global _watchdog
+    with _watchdog_lock:
+        previous, _watchdog = _watchdog, watchdog
+    return previous
+
+
+def sweep_orphan_excel() -> Dict[str, int]:
+    """Barrido de Excel huérfanos (al arrancar y al reemplazar un trabajador); nunca lanza."""
+    watchdog = get_watchdog()
+    if watchdog is None:
+        return {"killed": 0, "stale": 0}
+    try:
+        return watchdog.sweep()
+    except Exception as exc:
+        logger.warning("Orphaned Excel sweep failed: %s", exc)
+        return {"killed": 0, "stale": 0}
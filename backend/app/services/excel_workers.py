@@ -0,0 +1,804 @@
+# -*- coding: utf-8 -*-
+"""
+excel_workers.py
+----------------
+Ejecución de trabajos de Excel (merge / PDF) aislada en procesos.
+
+Cada proceso trabajador inicializa COM una sola vez, mantiene su propia
+instancia de Excel y recibe trabajos por un ``Pipe``. El proceso padre
+(uvicorn) aplica un timeout por trabajo: si el hijo se cuelga lo mata y lo
+reemplaza, y si se cae (crash de COM/Excel) lo detecta y lo vuelve a lanzar,
+sin bloquear la API.
+
+Cancelación: cada hijo recibe al nacer un ``multiprocessing.Event`` que el
+padre activa cuando el ``CancelToken`` del trabajo se cancela; el trabajo lo
+revisa entre etapas, cierra sus libros y el Excel del hijo vuelve al pool.
+Si no termina en COBRANZA_CANCEL_GRACE segundos (30) el hijo se mata y se
+reemplaza. Un trabajo cancelado mientras espera un trabajador libre no llega
+a enviarse.
+
+Cada ``ExcelEngine`` registra el pid de su Excel y ejecuta los trabajos bajo
+el watchdog (``excel_watchdog``): una etapa que excede su plazo mata ese
+Excel y el trabajo termina con ``ExcelStageTimeout``. Al reemplazar un
+trabajador se barren los Excel que dejó huérfanos.
+
+Protocolo (tuplas por el pipe):
+  padre -> hijo: ("job", job_id, kind, payload) | ("stop",)
+  hijo -> padre: ("ready", pid, info) | ("fatal", message)
+                 ("progress", job_id, pct, msg)
+                 ("metrics", job_id, delta)   (antes de ok/error; ver app.metrics)
+                 ("ok", job_id, result)
+                 ("error", job_id, exc | None, message, traceback)
+
+El motor del hijo se indica como ``"modulo:Clase"`` (p.ej. ``StubEngine``
+para probar el protocolo y el supervisor en Linux, sin Excel).
+
+Modo de ejecución: COBRANZA_EXEC_MODE=thread (por defecto, un Excel por
+trabajo en el hilo del job) | process (pool de COBRANZA_EXCEL_WORKERS procesos).
+"""
+from __future__ import annotations
+
+import importlib
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .. import metrics
+from .cancellation import CancelToken, JobCancelled, check_cancel
+from .com_retry import co_initialize, co_uninitialize, com_call
+from .excel_watchdog import ExcelStageTimeout, excel_pid, get_watchdog, sweep_orphan_excel
+from .job_report import JobReport
+
+logger = logging.getLogger("cobranza.workers")
+
+ProgressCb = Callable[[int, str], None]
+
+DEFAULT_ENGINE = f"{__name__}:ExcelEngine"
+DEFAULT_JOB_TIMEOUT = 600.0
+DEFAULT_START_TIMEOUT = 60.0
+DEFAULT_CANCEL_GRACE = 30.0
+POLL_INTERVAL = 0.25
+
+
+# -------------------------------------------------------------------
+# Excepciones
+# -------------------------------------------------------------------
+class ExcelWorkerError(Exception):
+    """Fallos del pool de procesos (no del trabajo en sí)."""
+
+
+class WorkerTimeout(ExcelWorkerError):
+    """El trabajo excedió su tiempo máximo; el proceso fue terminado."""
+
+
+class WorkerCrashed(ExcelWorkerError):
+    """El proceso trabajador murió durante el trabajo."""
+
+
+class WorkerCancelled(JobCancelled):
+    """El trabajo cancelado no se detuvo a tiempo; el proceso fue terminado."""
+
+
+class WorkerJobError(Exception):
+    """Error del trabajo cuya excepción original no se pudo transportar."""
+
+    def __init__(self, exc_type: str, message: str, tb: str = ""):
+        super().__init__(message)
+        self.exc_type = exc_type
+        self.remote_traceback = tb
+
+
+# -------------------------------------------------------------------
+# Trabajos (se ejecutan igual en modo hilo o dentro del proceso hijo)
+# -------------------------------------------------------------------
+def _job_merge(payload: Dict[str, Any], progress: Optional[ProgressCb], excel, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    from .excel_copy import copy_first_sheet_exact
+
+    report = JobReport()
+    out_path = copy_first_sheet_exact(
+        payload["source_xls_path"],
+        payload["master_xls_path"],
+        header_date=payload.get("header_date"),
+        delete_first_rows=payload["delete_first_rows"],
+        progress_cb=progress,
+        excel=excel,
+        report=report,
+        source_name=payload.get("source_name"),
+        cancel=cancel,
+    )
+    return {"out_path": out_path, "report": report.as_dict()}
+
+
+def _job_merge_dates(payload: Dict[str, Any], progress: Optional[ProgressCb], excel, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    from .excel_copy import copy_first_sheet_per_date
+
+    report = JobReport()
+    outputs = copy_first_sheet_per_date(
+        payload["source_xls_path"],
+        payload["master_xls_path"],
+        list(payload["header_dates"]),
+        delete_first_rows=payload["delete_first_rows"],
+        progress_cb=progress,
+        excel=excel,
+        report=report,
+        source_name=payload.get("source_name"),
+        cancel=cancel,
+    )
+    return {"outputs": [list(item) for item in outputs], "report": report.as_dict()}
+
+
+def _job_export_pdf(payload: Dict[str, Any], progress: Optional[ProgressCb], excel, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    from .pdf_export_service import export_vendor_pdfs
+
+    report = JobReport()
+    files = export_vendor_pdfs(
+        xls_path=Path(payload["xls_path"]),
+        out_dir=Path(payload["out_dir"]),
+        hojas_completas=tuple(payload["hojas_completas"]),
+        hoja_base=payload.get("hoja_base"),
+        orden_ids=payload.get("orden_ids"),
+        excluir_ids=payload.get("excluir_ids"),
+        pdf_date=payload.get("pdf_date"),
+        excel=excel,
+        report=report,
+        cancel=cancel,
+    )
+    return {"files": [str(p) for p in files], "report": report.as_dict()}
+
+
+def _job_merge_export(payload: Dict[str, Any], progress: Optional[ProgressCb], excel, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """Merge y exportación de PDFs sobre el mismo libro destino, sin reabrirlo."""
+    from .excel_copy import copy_first_sheet_exact
+    from .pdf_export_service import DEFAULT_FULL_SHEETS, export_vendor_pdfs_from_workbook
+
+    report = JobReport()
+    files: list[Path] = []
+
+    def merge_progress(pct: int, msg: str) -> None:
+        # El merge ocupa 0-70 %; la exportación el resto
+        if progress is not None:
+            progress(int(pct * 0.7), msg)
+
+    def export_pdfs(dst_wb, dst_index, session) -> None:
+        if progress is not None:
+            progress(72, "Exportando PDFs por vendedor...")
+        files.extend(export_vendor_pdfs_from_workbook(
+            dst_wb,
+            Path(payload["out_dir"]),
+            session,
+            hojas_completas=tuple(payload.get("hojas_completas") or DEFAULT_FULL_SHEETS),
+            hoja_base=payload.get("hoja_base"),
+            orden_ids=payload.get("orden_ids"),
+            excluir_ids=payload.get("excluir_ids"),
+            pdf_date=payload.get("pdf_date") or payload.get("header_date"),
+            report=report,
+            wb_index=dst_index,
+            cancel=cancel,
+        ))
+
+    out_path = copy_first_sheet_exact(
+        payload["source_xls_path"],
+        payload["master_xls_path"],
+        header_date=payload.get("header_date"),
+        delete_first_rows=payload["delete_first_rows"],
+        progress_cb=merge_progress,
+        excel=excel,
+        report=report,
+        after_save=export_pdfs,
+        source_name=payload.get("source_name"),
+        cancel=cancel,
+    )
+    return {"out_path": out_path, "files": [str(p) for p in files], "report": report.as_dict()}
+
+
+def _job_list_blocks(
+    payload: Dict[str, Any], progress: Optional[ProgressCb], excel, cancel: Optional[CancelToken] = None,
+) -> list[dict]:
+    from .pdf_export_service import list_vendor_blocks
+
+    return list_vendor_blocks(
+        xls_path=Path(payload["xls_path"]),
+        hojas_completas=tuple(payload["hojas_completas"]),
+        hoja_base=payload.get("hoja_base"),
+        excel=excel,
+    )
+
+
+def _job_scan_bench(payload: Dict[str, Any], progress: Optional[ProgressCb], excel, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    from .scan_bench import bench_workbook
+
+    wb = com_call(excel.Workbooks.Open, payload["xls_path"], UpdateLinks=0, ReadOnly=True)
+    try:
+        result = bench_workbook(wb, payload["chunks"], payload.get("repeat", 3), payload.get("memory", False))
+    finally:
+        wb.Close(SaveChanges=False)
+    result["file"] = payload["xls_path"]
+    return result
+
+
+def _job_verify_transfer(payload: Dict[str, Any], progress: Optional[ProgressCb], excel, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    from .excel_copy import verify_paste_transfer
+
+    return verify_paste_transfer(payload["xls_path"], excel=excel)
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], Optional[ProgressCb], Any, Optional[CancelToken]], Any]] = {
+    "merge": _job_merge,
+    "export_pdf": _job_export_pdf,
+    "merge_export": _job_merge_export,
+    "merge_dates": _job_merge_dates,
+    "list_blocks": _job_list_blocks,
+    "verify_transfer": _job_verify_transfer,
+    "scan_bench": _job_scan_bench,
+}
+
+
+# -------------------------------------------------------------------
+# Motores (lado hijo)
+# -------------------------------------------------------------------
+class ExcelEngine:
+    """Un Excel por proceso; COM se inicializa una vez al arrancar el hijo."""
+
+    def __init__(self) -> None:
+        self.excel = None
+        self.pid: Optional[int] = None
+        self._com_initialized = False
+        self._watchdog = get_watchdog()
+
+    def start(self) -> None:
+        from win32com.client import DispatchEx
+
+        # COM del hilo con el filtro de reintentos para un Excel ocupado
+        co_initialize()
+        self._com_initialized = True
+        self._dispatch = DispatchEx
+        self._launch()
+
+    def _launch(self) -> None:
+        if self._watchdog is not None:
+            self._watchdog.closed(self.pid)
+        self.excel = self._dispatch("Excel.Application")
+        self.excel.Visible = False
+        self.excel.DisplayAlerts = False
+        self.pid = excel_pid(self.excel)
+        if self._watchdog is not None:
+            self._watchdog.launched(self.pid)
+
+    def healthy(self) -> bool:
+        try:
+            _ = self.excel.Version  # type: ignore[union-attr]
+            return True
+        except Exception:
+            return False
+
+    def info(self) -> Dict[str, Any]:
+        return {"engine": "excel", "excel_pid": self.pid}
+
+    def run(self, kind: str, payload: Dict[str, Any], progress: ProgressCb, cancel: Optional[CancelToken] = None) -> Any:
+        if not self.healthy():
+            logger.warning("Excel instance not responding; relaunching.")
+            self._launch()
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        watch = self._watchdog.watch(self.pid, kind) if self._watchdog is not None else nullcontext()
+        with watch as watched:
+            try:
+                return handler(payload, progress, self.excel, cancel)
+            except Exception as exc:
+                if watched is not None and watched.expired is not None:
+                    # La llamada COM falló porque el watchdog mató Excel
+                    raise ExcelStageTimeout(*watched.expired) from exc
+                raise
+            finally:
+                # Ningún libro debe quedar abierto entre trabajos (si Excel sigue vivo)
+                if watched is None or watched.expired is None:
+                    try:
+                        while self.excel.Workbooks.Count:  # type: ignore[union-attr]
+                            self.excel.Workbooks(1).Close(SaveChanges=False)  # type: ignore[union-attr]
+                    except Exception:
+                        pass
+
+    def stop(self) -> None:
+        try:
+            if self.excel is not None:
+                com_call(self.excel.Quit)
+        except Exception:
+            pass
+        self.excel = None
+        if self._watchdog is not None:
+            self._watchdog.closed(self.pid)
+        self.pid = None
+        if self._com_initialized:
+            self._com_initialized = False
+            co_uninitialize()
+
+
+class StubEngine:
+    """
+    Motor sin Excel para probar protocolo y supervisor (Linux/CI):
+      echo  -> devuelve el payload        sleep -> duerme payload["seconds"] (cancelable)
+      fail  -> lanza ValueError           crash -> termina el proceso (exit 3)
+      merge -> copia source a un temporal y devuelve su ruta
+      merge_export -> como merge y además un PDF vacío en payload["out_dir"]
+      merge_dates  -> una copia de source por fecha de payload["header_dates"]
+      export_pdf   -> un PDF vacío en payload["out_dir"]
+      list_blocks  -> un bloque ficticio por archivo
+      scan_bench   -> el benchmark de row_iter con el lector BIFF
+    """
+
+    def start(self) -> None:
+        pass
+
+    def info(self) -> Dict[str, Any]:
+        return {"engine": "stub"}
+
+    def run(self, kind: str, payload: Dict[str, Any], progress: ProgressCb, cancel: Optional[CancelToken] = None) -> Any:
+        check_cancel(cancel)
+        progress(10, f"stub:{kind}")
+        if kind == "echo":
+            return payload
+        if kind == "sleep":
+            # Ignora la cancelación con payload["ignore_cancel"] (prueba del plazo de gracia)
+            deadline = time.monotonic() + float(payload.get("seconds", 1))
+            while time.monotonic() < deadline:
+                if not payload.get("ignore_cancel"):
+                    check_cancel(cancel)
+                time.sleep(0.05)
+            return "slept"
+        if kind == "fail":
+            raise ValueError(payload.get("message", "stub failure"))
+        if kind == "crash":
+            os._exit(3)
+        if kind in ("merge", "merge_export"):
+            import shutil
+            import tempfile
+
+            out = os.path.join(tempfile.mkdtemp(prefix="cobranza_stub_"), "maestro_copiado.xls")
+            report = JobReport()
+            with report.stage("paste"):
+                shutil.copyfile(payload["source_xls_path"], out)
+            result: Dict[str, Any] = {"out_path": out}
+            if kind == "merge_export":
+                pdf_dir = Path(payload["out_dir"])
+                pdf_dir.mkdir(parents=True, exist_ok=True)
+                pdf = pdf_dir / "COBRANZA_CONSOLIDADO.pdf"
+                with report.stage("block_export"):
+                    pdf.write_bytes(b"%PDF-1.4\n%%EOF\n")
+                result["files"] = [str(pdf)]
+            result["report"] = report.as_dict()
+            return result
+        if kind == "export_pdf":
+            pdf_dir = Path(payload["out_dir"])
+            pdf_dir.mkdir(parents=True, exist_ok=True)
+            pdf = pdf_dir / "COBRANZA_CONSOLIDADO.pdf"
+            report = JobReport()
+            with report.stage("block_export"):
+                pdf.write_bytes(b"%PDF-1.4\n%%EOF\n")
+            return {"files": [str(pdf)], "report": report.as_dict()}
+        if kind == "list_blocks":
+            name = Path(payload["xls_path"]).name
+            return [{"id": f"stub:{name}", "sheet_name": "Sheet1", "vendor_name": "STUB", "row_start": 1, "row_end": 2}]
+        if kind == "scan_bench":
+            from .scan_bench import bench_xls_file
+
+            return bench_xls_file(payload["xls_path"], payload["chunks"], payload.get("repeat", 3), payload.get("memory", False))
+        if kind == "merge_dates":
+            import shutil
+            import tempfile
+
+            out_dir = tempfile.mkdtemp(prefix="cobranza_stub_")
+            report = JobReport()
+            outputs = []
+            for iso in payload["header_dates"]:
+                out = os.path.join(out_dir, f"maestro_copiado_{iso}.xls")
+                with report.stage("save"):
+                    shutil.copyfile(payload["source_xls_path"], out)
+                outputs.append([iso, out])
+            return {"outputs": outputs, "report": report.as_dict()}
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+
+    def stop(self) -> None:
+        pass
+
+
+def _load_engine(spec: str):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _worker_main(conn, engine_spec: str, cancel_event=None) -> None:
+    """Bucle del proceso hijo."""
+    cancel = CancelToken(cancel_event) if cancel_event is not None else None
+    try:
+        engine = _load_engine(engine_spec)()
+        engine.start()
+    except Exception as exc:
+        try:
+            conn.send(("fatal", f"{type(exc).__name__}: {exc}"))
+        except Exception:
+            pass
+        return
+
+    conn.send(("ready", os.getpid(), engine.info()))
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            if not msg or msg[0] == "stop":
+                break
+            if msg[0] != "job":
+                continue
+            _, job_id, kind, payload = msg
+
+            def progress(pct: int, text: str, _job_id: str = job_id) -> None:
+                try:
+                    conn.send(("progress", _job_id, int(pct), str(text)))
+                except Exception:
+                    pass
+
+            try:
+                result = engine.run(kind, payload, progress, cancel=cancel)
+                conn.send(("metrics", job_id, metrics.drain()))
+                conn.send(("ok", job_id, result))
+            except Exception as exc:
+                tb = traceback.format_exc()
+                try:
+                    pickle.dumps(exc)
+                    transport: Optional[BaseException] = exc
+                except Exception:
+                    transport = None
+                conn.send(("metrics", job_id, metrics.drain()))
+                conn.send(("error", job_id, transport, f"{type(exc).__name__}: {exc}", tb))
+    finally:
+        engine.stop()
+
+
+# -------------------------------------------------------------------
+# Supervisor (lado padre)
+# -------------------------------------------------------------------
+class _WorkerHandle:
+    def __init__(self, process, conn, slot: int, cancel_event):
+        self.process = process
+        self.conn = conn
+        self.slot = slot
+        self.cancel_event = cancel_event
+        self.pid: Optional[int] = None
+        self.info: Dict[str, Any] = {}
+        self.jobs = 0
+
+
+class ExcelWorkerPool:
+    """
+    Pool de procesos trabajadores. ``run`` es bloqueante y se invoca desde el
+    hilo del job; mientras espera sólo hace ``poll`` del pipe.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        engine_spec: str = DEFAULT_ENGINE,
+        job_timeout: float = DEFAULT_JOB_TIMEOUT,
+        start_timeout: float = DEFAULT_START_TIMEOUT,
+        cancel_grace: float = DEFAULT_CANCEL_GRACE,
+    ):
+        self.size = max(1, int(size))
+        self.engine_spec = engine_spec
+        self.job_timeout = job_timeout
+        self.start_timeout = start_timeout
+        self.cancel_grace = cancel_grace
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_WorkerHandle]" = queue.Queue()
+        self._handles: Dict[int, _WorkerHandle] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.stats: Dict[str, int] = {
+            "jobs": 0, "errors": 0, "timeouts": 0, "crashes": 0, "restarts": 0, "cancelled": 0, "dropped": 0,
+        }
+
+    def _bump(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    # ---------- ciclo de vida ----------
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            for slot in range(self.size):
+                handle = self._spawn(slot)
+                self._handles[slot] = handle
+                self._idle.put(handle)
+            self._started = True
+
+    def _spawn(self, slot: int) -> _WorkerHandle:
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        cancel_event = self._ctx.Event()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.engine_spec, cancel_event),
+            name=f"cobranza-excel-{slot}",
+            daemon=True,
+        )
+        proc.start()
+        child_conn.close()
+        handle = _WorkerHandle(proc, parent_conn, slot, cancel_event)
+        if not parent_conn.poll(self.start_timeout):
+            self._kill(handle)
+            raise ExcelWorkerError(f"El trabajador {slot} no respondió al iniciar.")
+        try:
+            msg = parent_conn.recv()
+        except (EOFError, OSError):
+            msg = ("fatal", f"exit={proc.exitcode}")
+        if msg[0] != "ready":
+            self._kill(handle)
+            raise ExcelWorkerError(f"El trabajador {slot} no pudo iniciar: {msg[1]}")
+        handle.pid, handle.info = msg[1], msg[2]
+        logger.info("Excel worker %s ready pid=%s info=%s", slot, handle.pid, handle.info)
+        return handle
+
+    @staticmethod
+    def _kill(handle: _WorkerHandle) -> None:
+        try:
+            if handle.process.is_alive():
+                handle.process.kill()
+            handle.process.join(5)
+        except Exception:
+            pass
+        try:
+            handle.conn.close()
+        except Exception:
+            pass
+
+    def _replace(self, handle: _WorkerHandle) -> _WorkerHandle:
+        self._kill(handle)
+        # El Excel del trabajador muerto no muere con él
+        sweep_orphan_excel()
+        self._bump("restarts")
+        new_handle = self._spawn(handle.slot)
+        with self._lock:
+            self._handles[handle.slot] = new_handle
+        return new_handle
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            self._closed = True
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for handle in handles:
+            try:
+                handle.conn.send(("stop",))
+            except Exception:
+                pass
+        deadline = time.monotonic() + timeout
+        for handle in handles:
+            handle.process.join(max(0.0, deadline - time.monotonic()))
+            self._kill(handle)
+        if handles:
+            sweep_orphan_excel()
+
+    # ---------- ejecución ----------
+    def run(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        progress_cb: Optional[ProgressCb] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Any:
+        if self._closed:
+            raise ExcelWorkerError("El pool de trabajadores está cerrado.")
+        self.start()
+        handle = self._acquire(cancel)
+        try:
+            result = self._dispatch(handle, kind, payload, progress_cb, timeout or self.job_timeout, cancel)
+            handle.jobs += 1
+            return result
+        except (WorkerTimeout, WorkerCrashed, WorkerCancelled):
+            try:
+                handle = self._replace(handle)
+            except ExcelWorkerError as exc:
+                # El lugar vuelve a la cola con el proceso muerto: _acquire lo relanza
+                logger.error("Could not respawn Excel worker %s: %s", handle.slot, exc)
+            raise
+        finally:
+            handle.cancel_event.clear()
+            if not self._closed:
+                self._idle.put(handle)
+
+    def _revive(self, handle: _WorkerHandle) -> _WorkerHandle:
+        """Relanza un trabajador muerto al tomarlo (reemplazo fallido o caída estando libre)."""
+        if handle.process.is_alive():
+            return handle
+        try:
+            return self._replace(handle)
+        except ExcelWorkerError:
+            self._idle.put(handle)
+            raise
+
+    def _acquire(self, cancel: Optional[CancelToken]) -> _WorkerHandle:
+        """Espera un trabajador libre; un trabajo cancelado en la cola se descarta sin tocar Excel."""
+        if cancel is None:
+            return self._revive(self._idle.get())
+        handle: Optional[_WorkerHandle] = None
+        while handle is None or cancel.cancelled:
+            if cancel.cancelled:
+                if handle is not None:
+                    self._idle.put(handle)
+                self._bump("dropped")
+                raise JobCancelled("Trabajo cancelado antes de iniciar.")
+            try:
+                handle = self._idle.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return self._revive(handle)
+
+    def _dispatch(
+        self,
+        handle: _WorkerHandle,
+        kind: str,
+        payload: Dict[str, Any],
+        progress_cb: Optional[ProgressCb],
+        timeout: float,
+        cancel: Optional[CancelToken] = None,
+    ) -> Any:
+        job_id = uuid.uuid4().hex[:12]
+        self._bump("jobs")
+        try:
+            handle.conn.send(("job", job_id, kind, payload))
+        except (OSError, EOFError) as exc:
+            self._bump("crashes")
+            raise WorkerCrashed(f"No se pudo enviar el trabajo: {exc}") from exc
+
+        deadline = time.monotonic() + timeout
+        cancel_deadline: Optional[float] = None
+        while True:
+            if cancel_deadline is None and cancel is not None and cancel.cancelled:
+                # El hijo lo ve entre etapas; si no termina a tiempo se lo mata
+                handle.cancel_event.set()
+                cancel_deadline = time.monotonic() + self.cancel_grace
+            elif cancel_deadline is not None and time.monotonic() >= cancel_deadline:
+                self._bump("cancelled")
+                logger.warning("Excel worker %s ignored cancellation for %.0fs; killing it", handle.slot, self.cancel_grace)
+                raise WorkerCancelled("Trabajo cancelado (se detuvo el proceso de Excel).")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._bump("timeouts")
+                logger.error("Excel worker %s timed out after %.0fs (kind=%s)", handle.slot, timeout, kind)
+                raise WorkerTimeout(f"El trabajo excedió el tiempo máximo ({timeout:.0f} s).")
+            try:
+                ready = handle.conn.poll(min(POLL_INTERVAL, remaining))
+                msg = handle.conn.recv() if ready else None
+            except (EOFError, OSError):
+                self._bump("crashes")
+                raise WorkerCrashed("El proceso de Excel terminó inesperadamente.")
+            if msg is None:
+                if not handle.process.is_alive():
+                    self._bump("crashes")
+                    raise WorkerCrashed(
+                        f"El proceso de Excel terminó inesperadamente (exit={handle.process.exitcode})."
+                    )
+                continue
+
+            tag = msg[0]
+            if tag == "progress" and msg[1] == job_id:
+                if progress_cb is not None:
+                    try:
+                        progress_cb(msg[2], msg[3])
+                    except Exception:
+                        pass
+            elif tag == "metrics" and msg[1] == job_id:
+                metrics.merge(msg[2])
+            elif tag == "ok" and msg[1] == job_id:
+                return msg[2]
+            elif tag == "error" and msg[1] == job_id:
+                exc, message, tb = msg[2], msg[3], msg[4]
+                self._bump("cancelled" if isinstance(exc, JobCancelled) else "errors")
+                if isinstance(exc, BaseException):
+                    raise exc
+                raise WorkerJobError(message.split(":", 1)[0], message, tb)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = [
+                {"slot": h.slot, "pid": h.pid, "alive": h.process.is_alive(), "jobs": h.jobs, **h.info}
+                for h in self._handles.values()
+            ]
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "job_timeout": self.job_timeout,
+            "workers": workers,
+            **dict(self.stats),
+        }
+
+
+# -------------------------------------------------------------------
+# Punto de entrada para la app
+# -------------------------------------------------------------------
+_pool: Optional[ExcelWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def execution_mode() -> str:
+    mode = os.getenv("COBRANZA_EXEC_MODE", "thread").strip().lower()
+    return "process" if mode == "process" else "thread"
+
+
+def get_excel_pool() -> ExcelWorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExcelWorkerPool(
+                size=int(os.getenv("COBRANZA_EXCEL_WORKERS", "1")),
+                engine_spec=os.getenv("COBRANZA_EXCEL_ENGINE", DEFAULT_ENGINE),
+                job_timeout=float(os.getenv("COBRANZA_JOB_TIMEOUT", str(DEFAULT_JOB_TIMEOUT))),
+                cancel_grace=float(os.getenv("COBRANZA_CANCEL_GRACE", str(DEFAULT_CANCEL_GRACE))),
+            )
+        return _pool
+
+
+def shutdown_excel_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def pool_status() -> Optional[Dict[str, Any]]:
+    with _pool_lock:
+        pool = _pool
+    return pool.status() if pool is not None else None
+
+
+@contextmanager
+def dedicated_engine(engine_spec: Optional[str] = None) -> Iterator[Any]:
+    """
+    Motor propio en el hilo actual (modo ``thread``): un solo Excel para una
+    serie de trabajos (``engine.run(kind, payload, progress, cancel=...)``), cerrado al salir.
+    """
+    engine = _load_engine(engine_spec or os.getenv("COBRANZA_EXCEL_ENGINE", DEFAULT_ENGINE))()
+    engine.start()
+    try:
+        yield engine
+    finally:
+        engine.stop()
+
+
+def _ignore_progress(pct: int, text: str) -> None:
+    pass
+
+
+def run_excel_job(
+    kind: str,
+    payload: Dict[str, Any],
+    progress_cb: Optional[ProgressCb] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Any:
+    """
+    Ejecuta un trabajo de Excel según el modo configurado: en el hilo actual
+    con un Excel propio (``thread``, vía ``dedicated_engine``: vigilado por el
+    watchdog como los del pool) o en el pool de procesos (``process``).
+    Con ``cancel`` el trabajo puede cancelarse (``JobCancelled``).
+    """
+    if execution_mode() == "process":
+        return get_excel_pool().run(kind, payload, progress_cb, cancel=cancel)
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    check_cancel(cancel)
+    with dedicated_engine() as engine:
+        # Los motores llaman a progress sin comprobar None (como en el pool)
+        return engine.run(kind, payload, progress_cb or _ignore_progress, cancel=cancel)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+job_report.py
+-------------
+Reporte de un trabajo de Excel: tiempos por etapa (ms), contadores y
+detalles. Es un dataclass simple para poder devolverse desde el proceso
+trabajador (pickle) y serializarse a JSON en /progress.
+
+``stage_observer(callback)`` permite seguir, en el hilo actual, qué etapa
+se está ejecutando (``callback(etapa, True)`` al entrar y ``False`` al
+salir) sin pasar nada a cada función; lo usa el watchdog de Excel.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+StageCallback = Callable[[str, bool], None]
+
+_observer = threading.local()
+
+
+@contextmanager
+def stage_observer(callback: StageCallback) -> Iterator[None]:
+    """Durante el bloque, las etapas de cualquier ``JobReport`` de este hilo avisan a ``callback``."""
+    previous: Optional[StageCallback] = getattr(_observer, "callback", None)
+    _observer.callback = callback
+    try:
+        yield
+    finally:
+        _observer.callback = previous
+
+
+def _notify(name: str, entering: bool) -> None:
+    callback: Optional[StageCallback] = getattr(_observer, "callback", None)
+    if callback is not None:
+        try:
+            callback(name, entering)
+        except Exception:
+            pass
+
+
+@dataclass
+class JobReport:
+    stages: Dict[str, float] = field(default_factory=dict)
+    counters: Dict[str, int] = field(default_factory=dict)
+    details: Dict[str, Any] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Acumula en ``stages[name]`` los ms que tarda el bloque."""
+        started = time.perf_counter()
+        _notify(name, True)
+        try:
+            yield
+        finally:
+            _notify(name, False)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stages[name] = round(self.stages.get(name, 0.0) + elapsed, 2)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "stages_ms": dict(self.stages),
+            "total_ms": round(sum(self.stages.values()), 2),
+            "counters": dict(self.counters),
+            "details": dict(self.details),
+        }
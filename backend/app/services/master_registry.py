@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+master_registry.py
+------------------
+Registro de libros maestro: cada maestro se sube una vez, se guarda por
+hash de contenido (SHA-256) y se pre-analiza sin Excel (``xls_reader``):
+
+- índice de hojas (posición, nombre, filas/columnas con datos),
+- filas destino de vendedores (columna B de las hojas 2..n, en el orden de
+  escritura: SUR, NORTE, SURQUILLO y luego el resto),
+- celdas de título "COBRANZA AL ..." y de fecha de encabezado,
+- texto de los cuadros de texto (TXO) y cuáles son títulos.
+
+Los merges lo referencian por ``master_id`` (sin volver a subirlo). El
+maestro por defecto se puede cambiar en caliente: se guarda en el índice y
+se relee cuando cambia el archivo, sin reiniciar.
+
+Almacenamiento: COBRANZA_MASTER_DIR (por defecto app/data/masters, o
+``masters`` junto al ejecutable) con
+``index.json`` y un ``<id>.xls`` por maestro.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from ..paths import app_path, resolve_default_master
+from .excel_copy import (
+    DATE_RE,
+    HEADER_SCAN_COLS,
+    HEADER_SCAN_ROWS,
+    TARGET_NAME_COL,
+    TARGET_SHEET_ORDER,
+    TITLE_RE,
+    TITLE_SCAN_COLS,
+    TITLE_SCAN_ROWS,
+    TITLE_SHEETS,
+)
+from .vendor_matcher import norm_name
+from .xls_reader import XlsBook, XlsFile, XlsReadError, open_xls
+
+logger = logging.getLogger("cobranza.masters")
+
+METADATA_VERSION = 1
+ID_LENGTH = 16
+_CHUNK = 1024 * 1024
+
+
+class MasterNotFound(KeyError):
+    """No hay un maestro registrado con ese id."""
+
+
+@dataclass
+class MasterInfo:
+    id: str
+    sha256: str
+    name: str
+    size: int
+    uploaded_at: str
+    file: str                                   # nombre dentro del directorio del registro
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, Any]:
+        """Sin metadatos completos (para listados)."""
+        meta = self.metadata
+        return {
+            "id": self.id,
+            "name": self.name,
+            "size": self.size,
+            "uploaded_at": self.uploaded_at,
+            "sheets": [s["name"] for s in meta.get("sheets", [])],
+            "targets": len(meta.get("targets", [])),
+            "parsed": meta.get("parsed", False),
+        }
+
+
+def masters_dir() -> Path:
+    env_dir = os.getenv("COBRANZA_MASTER_DIR")
+    if env_dir:
+        return Path(env_dir)
+    if getattr(sys, "frozen", False):
+        # _MEIPASS es temporal: el registro vive junto al ejecutable
+        return Path(sys.executable).resolve().parent / "masters"
+    return app_path("data", "masters")
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def target_sheet_order(book: XlsBook | XlsFile) -> List[int]:
+    """Posiciones (1-based) de las hojas destino en el orden del merge."""
+    names = book.sheet_names
+    by_norm: Dict[str, int] = {}
+    for position, name in enumerate(names, start=1):
+        by_norm.setdefault(norm_name(name), position)
+    order: List[int] = []
+    for name in TARGET_SHEET_ORDER:
+        position = by_norm.get(norm_name(name))
+        if position is not None and position >= 2 and position not in order:
+            order.append(position)
+    order.extend(p for p in range(2, len(names) + 1) if p not in order)
+    return order
+
+
+def vendor_target_rows(book: XlsBook | XlsFile) -> List[Dict[str, Any]]:
+    """Celdas de texto de la columna B de las hojas destino, en el orden del merge."""
+    targets: List[Dict[str, Any]] = []
+    for position in target_sheet_order(book):
+        sheet = book.sheet(position)
+        for r in range(1, sheet.nrows + 1):
+            raw = sheet.value(r, TARGET_NAME_COL)
+            if isinstance(raw, str) and raw.strip():
+                targets.append({
+                    "sheet": sheet.name, "position": position, "row": r,
+                    "name": raw, "name_norm": norm_name(raw),
+                })
+    return targets
+
+
+def analyze_master(book: XlsBook | XlsFile) -> Dict[str, Any]:
+    """Metadatos del maestro a partir del libro leído con ``xls_reader``."""
+    sheets = [{"position": s.index, "name": s.name, "nrows": s.nrows, "ncols": s.ncols} for s in book.sheets]
+    targets = vendor_target_rows(book)
+
+    titles: List[Dict[str, Any]] = []
+    title_norms = {norm_name(n) for n in TITLE_SHEETS}
+    for sheet in book.sheets:
+        if norm_name(sheet.name) not in title_norms:
+            continue
+        for (r, c), value in sorted(sheet.cells.items()):
+            if r <= TITLE_SCAN_ROWS and c <= TITLE_SCAN_COLS and isinstance(value, str) and TITLE_RE.search(value):
+                titles.append({"sheet": sheet.name, "row": r, "col": c, "text": value})
+
+    header_dates: List[Dict[str, Any]] = []
+    if book.sheets:
+        first = book.sheets[0]
+        for (r, c), value in sorted(first.cells.items()):
+            if r <= HEADER_SCAN_ROWS and c <= HEADER_SCAN_COLS and isinstance(value, str) and DATE_RE.search(value):
+                header_dates.append({"sheet": first.name, "row": r, "col": c, "text": value})
+
+    shapes = [
+        {"sheet": sheet.name, "index": i, "text": text, "title": bool(TITLE_RE.search(text))}
+        for sheet in book.sheets
+        for i, text in enumerate(sheet.shapes)
+    ]
+    return {
+        "version": METADATA_VERSION,
+        "parsed": True,
+        "sheets": sheets,
+        "targets": targets,
+        "titles": titles,
+        "header_dates": header_dates,
+        "shapes": shapes,
+    }
+
+
+def _analyze_path(path: Path) -> Dict[str, Any]:
+    try:
+        with open_xls(path) as book:
+            return analyze_master(book)
+    except (XlsReadError, OSError, ValueError) as exc:
+        # Se registra igual: el merge con Excel sigue funcionando
+        logger.warning("Master pre-parse failed for %s: %s", path.name, exc)
+        return {"version": METADATA_VERSION, "parsed": False, "error": str(exc)}
+
+
+class MasterRegistry:
+    INDEX_NAME = "index.json"
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root) if root is not None else masters_dir()
+        self._lock = threading.RLock()
+        self._masters: Dict[str, MasterInfo] = {}
+        self._default_id: Optional[str] = None
+        self._index_mtime: Optional[float] = None
+
+    # ---------------- índice ----------------
+    @property
+    def index_path(self) -> Path:
+        return self.root / self.INDEX_NAME
+
+    def _refresh(self) -> None:
+        """Relee ``index.json`` si cambió (otro proceso o edición manual)."""
+        try:
+            mtime = self.index_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._index_mtime:
+            return
+        masters: Dict[str, MasterInfo] = {}
+        default_id = None
+        if mtime is not None:
+            try:
+                data = json.loads(self.index_path.read_text(encoding="utf-8"))
+                masters = {m["id"]: MasterInfo(**m) for m in data.get("masters", [])}
+                default_id = data.get("default_id")
+            except (ValueError, TypeError, KeyError) as exc:
+                logger.error("Invalid master index %s: %s", self.index_path, exc)
+        self._masters, self._default_id, self._index_mtime = masters, default_id, mtime
+
+    def _save(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        data = {
+            "default_id": self._default_id,
+            "masters": [asdict(m) for m in self._masters.values()],
+        }
+        fd, tmp = tempfile.mkstemp(prefix="index_", suffix=".json", dir=self.root)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.index_path)
+        self._index_mtime = self.index_path.stat().st_mtime
+
+    # ---------------- consultas ----------------
+    def list(self) -> List[MasterInfo]:
+        with self._lock:
+            self._refresh()
+            return sorted(self._masters.values(), key=lambda m: m.uploaded_at)
+
+    def get(self, master_id: str) -> MasterInfo:
+        with self._lock:
+            self._refresh()
+            info = self._masters.get(master_id)
+            if info is None:
+                raise MasterNotFound(master_id)
+            if info.metadata.get("version") != METADATA_VERSION:
+                # Metadatos de una versión anterior del análisis: se recalculan
+                info.metadata = _analyze_path(self.root / info.file)
+                self._save()
+            return info
+
+    def path_for(self, master_id: str) -> Path:
+        path = self.root / self.get(master_id).file
+        if not path.is_file():
+            raise MasterNotFound(master_id)
+        return path
+
+    def contains(self, path: str) -> bool:
+        """True si ``path`` es un archivo del registro (no debe borrarse como temporal)."""
+        try:
+            return Path(path).resolve().parent == self.root.resolve()
+        except OSError:
+            return False
+
+    def metadata_for_sha(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Metadatos ya analizados del maestro con ese contenido (si está registrado)."""
+        try:
+            info = self.get(sha256[:ID_LENGTH])
+        except MasterNotFound:
+            return None
+        if info.sha256 != sha256 or not info.metadata.get("parsed"):
+            return None
+        return info.metadata
+
+    def metadata_for_path(self, path: str) -> Optional[Dict[str, Any]]:
+        """Metadatos ya analizados si ``path`` es un maestro del registro."""
+        if not self.contains(path):
+            return None
+        name = Path(path).name
+        with self._lock:
+            self._refresh()
+            for info in self._masters.values():
+                if info.file == name:
+                    meta = self.get(info.id).metadata
+                    return meta if meta.get("parsed") else None
+        return None
+
+    # ---------------- altas / bajas ----------------
+    def add_file(self, path: str, name: Optional[str] = None) -> MasterInfo:
+        """Registra una copia de ``path``; si el contenido ya existe devuelve el registrado."""
+        src = Path(path)
+        sha = sha256_file(src)
+        master_id = sha[:ID_LENGTH]
+        with self._lock:
+            self._refresh()
+            existing = self._masters.get(master_id)
+            if existing is not None and (self.root / existing.file).is_file():
+                return existing
+            self.root.mkdir(parents=True, exist_ok=True)
+            suffix = src.suffix.lower() or ".xls"
+            file_name = f"{master_id}{suffix}"
+            tmp = self.root / f".{file_name}.tmp"
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, self.root / file_name)
+            info = MasterInfo(
+                id=master_id,
+                sha256=sha,
+                name=os.path.basename(name or src.name),
+                size=(self.root / file_name).stat().st_size,
+                uploaded_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                file=file_name,
+                metadata=_analyze_path(self.root / file_name),
+            )
+            self._masters[master_id] = info
+            self._save()
+            logger.info("Master registered: %s (%s)", info.name, master_id)
+            return info
+
+    def add_stream(self, fh: BinaryIO, name: str) -> MasterInfo:
+        fd, tmp = tempfile.mkstemp(prefix="master_", suffix=Path(name).suffix or ".xls")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(fh, out, _CHUNK)
+            return self.add_file(tmp, name)
+        finally:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def remove(self, master_id: str) -> None:
+        with self._lock:
+            self._refresh()
+            info = self._masters.pop(master_id, None)
+            if info is None:
+                raise MasterNotFound(master_id)
+            if self._default_id == master_id:
+                self._default_id = None
+            self._save()
+            try:
+                (self.root / info.file).unlink()
+            except OSError:
+                pass
+
+    # ---------------- maestro por defecto ----------------
+    @property
+    def default_id(self) -> Optional[str]:
+        with self._lock:
+            self._refresh()
+            return self._default_id
+
+    def set_default(self, master_id: Optional[str]) -> None:
+        """Cambia el maestro por defecto (None = el incluido en app/data)."""
+        with self._lock:
+            self._refresh()
+            if master_id is not None and master_id not in self._masters:
+                raise MasterNotFound(master_id)
+            self._default_id = master_id
+            self._save()
+            logger.info("Default master set to %s", master_id or "bundled")
+
+    def default_path(self) -> Path:
+        """Maestro por defecto vigente: el elegido en el registro o el incluido."""
+        master_id = self.default_id
+        if master_id is not None:
+            try:
+                return self.path_for(master_id)
+            except MasterNotFound:
+                logger.warning("Default master %s missing; using bundled master.", master_id)
+        return resolve_default_master()
+
+
+_registry: Optional[MasterRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MasterRegistry:
+    """Registro compartido; se recrea si cambia COBRANZA_MASTER_DIR."""
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.root != masters_dir():
+            _registry = MasterRegistry()
+        return _registry
@@ -6,16 +6,29 @@ Exporta un PDF por vendedor preservando el estilo de impresión del Excel.
 """
 
 from __future__ import annotations
+from bisect import bisect_right
+from itertools import accumulate, zip_longest
 from pathlib import Path
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Sequence
 import re
-import time
 import unicodedata
+import zipfile
 from datetime import datetime
 
-import pythoncom
-import win32com.client as win32  # si no estaba
-from pypdf import PdfReader, PdfWriter
+from .cancellation import CancelToken, JobCancelled, check_cancel
+from .com_retry import co_initialize, co_uninitialize, com_call
+from .excel_session import ExcelSession
+from .job_report import JobReport
+from .row_iter import iter_row_chunks, sheet_bounds
+from .workbook_index import WorkbookIndex
+
+
+def _win32():
+    """Importa pywin32 bajo demanda (no se carga COM hasta el primer uso)."""
+    import pythoncom
+    import win32com.client as win32
+    return pythoncom, win32
+
 
 def _col_to_index(col: str) -> int:
     """Convierte letras de columna (por ej. 'AA') a índice numérico (1-based)."""
@@ -44,6 +57,8 @@ def _merge_pdf_files(pdf_paths: List[Path], output_path: Path) -> Optional[Path]
     """
     Une los PDFs en el orden recibido y devuelve la ruta del consolidado.
     """
+    from pypdf import PdfReader, PdfWriter
+
     writer = PdfWriter()
     for pdf_file in pdf_paths:
         reader = PdfReader(str(pdf_file))
@@ -149,6 +164,8 @@ def aplicar_layout_modelo(
 # ------------------------
 RE_VENDEDOR = re.compile(r"\bVendedor\b[:\s]*", re.IGNORECASE)
 RE_SALDO_PARA = re.compile(r"\bSaldo\s*para\b[:\s]*(.+?)\s*$", re.IGNORECASE)
+# Subcadenas que toda coincidencia de RE_VENDEDOR / RE_SALDO_PARA contiene dentro de una celda
+BLOCK_LABEL_NEEDLES = ("vendedor", "saldo")
 
 def _sanitize(name: str) -> str:
     placeholder_upper = "__TILDE_N_UPPER__"
@@ -191,6 +208,7 @@ def _make_block_id(sheet_name: str, row_start: int, row_end: int, vendor_name: s
     return f"{sheet_name}|{row_start}-{row_end}|{vendor_name}"
 
 SALDOS_BLOCK_ID = "__SALDOS_COBRANZA__"
+DEFAULT_FULL_SHEETS: Tuple[str, ...] = ("SUR", "NORTE", "IMPORTE CUENTA SALDO")
 
 # ------------------------
 # Lectura de celdas (rápida)
@@ -203,75 +221,138 @@ def _get_used_range(ws) -> Tuple[int, int, int, int]:
     c2 = c1 + ur.Columns.Count - 1
     return r1, c1, r2, c2
 
-def _cells(ws, r1: int, c1: int, r2: int, c2: int):
-    # Devuelve una matriz (lista de listas) con los valores de celdas
-    return ws.Range(ws.Cells(r1, c1), ws.Cells(r2, c2)).Value
+
+def _resolve_sheets(
+    wb_index: WorkbookIndex,
+    hojas_completas: Tuple[str, ...],
+    hoja_base: Optional[str],
+) -> Tuple[set[str], Optional[str]]:
+    """(nombres de hojas completas, nombre real de la hoja base o None)."""
+    hojas_completas_set = {alias.strip() for alias in hojas_completas}
+    if not hoja_base:
+        return hojas_completas_set, None
+    entry = wb_index.entry(hoja_base)
+    if entry is None:
+        raise ValueError(f"No existe la hoja solicitada: {hoja_base}")
+    return hojas_completas_set, entry.name
 
 # ------------------------
 # Detección de bloques por vendedor
 # ------------------------
-def _find_vendor_blocks(ws) -> List[Dict]:
+def _label_rows(rows: Sequence[Sequence[object]]) -> List[int]:
+    """
+    Índices (0-based) de las filas que pueden llevar un rótulo "Vendedor" o
+    "Saldo para". Sólo las celdas de texto pueden contenerlos (números y
+    fechas no), y la palabra completa cae siempre dentro de una celda: por
+    columna se une el texto en un solo string y se busca la subcadena con
+    ``str.find`` (sin ``str()`` ni regex por celda). Filtro conservador: las
+    regex se aplican después sobre estas filas y el resultado no cambia.
+    """
+    hits: set[int] = set()
+    for column in zip_longest(*rows):
+        texts = [v if isinstance(v, str) else "" for v in column]
+        blob = "\x00".join(texts)
+        folded = blob.casefold()  # como re.IGNORECASE (p.ej. 'ſ' -> 's')
+        if len(folded) != len(blob):
+            # El plegado cambió longitudes (p.ej. 'ß'): por celda
+            for i, text in enumerate(texts):
+                if text:
+                    low = text.casefold()
+                    if any(n in low for n in BLOCK_LABEL_NEEDLES):
+                        hits.add(i)
+            continue
+        starts = list(accumulate((len(t) + 1 for t in texts), initial=0))
+        for needle in BLOCK_LABEL_NEEDLES:
+            pos = folded.find(needle)
+            while pos != -1:
+                hits.add(bisect_right(starts, pos) - 1)
+                pos = folded.find(needle, pos + 1)
+    return sorted(hits)
+
+
+class _BlockScanner:
+    """
+    Bloques "Vendedor ..." → "Saldo para ..." alimentado por bloques de filas
+    (``feed``); el estado pasa de un bloque al siguiente.
+    """
+
+    def __init__(self) -> None:
+        self.blocks: List[Dict] = []
+        self.current_start: Optional[int] = None
+        self.current_vendor: Optional[str] = None
+
+    def feed(self, rows: Sequence[object], first_row: int) -> None:
+        rows = [row if isinstance(row, (list, tuple)) else [row] for row in rows]
+        # Las demás filas no pueden coincidir con ninguna regex: no cambian el estado
+        for k in _label_rows(rows):
+            i = first_row + k
+            row_texts = [str(x) if x is not None else "" for x in rows[k]]
+            joined = " ".join(row_texts).strip()
+
+            if self.current_start is None:
+                vendor_match = RE_VENDEDOR.search(joined)
+                if vendor_match:
+                    after = joined[vendor_match.end():].strip()
+                    self.current_vendor = after if after else joined
+                    self.current_start = i
+            else:
+                saldo_match = RE_SALDO_PARA.search(joined)
+                if saldo_match:
+                    saldo_vendor = saldo_match.group(1).strip()
+                    vendor_name = (self.current_vendor or saldo_vendor or joined).strip()
+                    self.blocks.append({
+                        "vendor_name": vendor_name,
+                        "row_start": self.current_start,
+                        "row_end": i,
+                        "header_row": 1
+                    })
+                    self.current_start = None
+                    self.current_vendor = None
+
+    def finish(self, last_row: int) -> List[Dict]:
+        if self.current_start is not None:
+            vendor_name = (self.current_vendor or f"Vendedor_{self.current_start}").strip()
+            self.blocks.append({
+                "vendor_name": vendor_name,
+                "row_start": self.current_start,
+                "row_end": last_row,
+                "header_row": 1
+            })
+            self.current_start = None
+            self.current_vendor = None
+        return self.blocks
+
+
+def _blocks_from_rows(rows: Sequence[object], r1: int, r2: int) -> List[Dict]:
+    """Bloques sobre la matriz ``rows`` cuya primera fila es la ``r1`` de la hoja."""
+    scanner = _BlockScanner()
+    scanner.feed(rows, r1)
+    return scanner.finish(r2)
+
+
+def _find_vendor_blocks(
+    ws,
+    bounds: Optional[Tuple[int, int, int, int]] = None,
+    chunk: Optional[int] = None,
+) -> List[Dict]:
     """
     Encuentra bloques:
       - inicio: fila con "Vendedor ..."
       - fin: fila con "Saldo para <lo que sea>" (incluida)
     Retorna: lista de dict con {vendor_name, row_start, row_end}
+    ``ws``: hoja COM o del lector BIFF (ver ``row_iter``), leída por bloques de ``chunk`` filas.
+    ``bounds``: límites del UsedRange ya conocidos (WorkbookIndex).
     """
-    r1, c1, r2, c2 = _get_used_range(ws)
+    r1, c1, r2, c2 = bounds or sheet_bounds(ws)
     if r2 < r1 or c2 < c1:
         return []
-    data = _cells(ws, r1, c1, r2, c2)
-    if data is None:
-        return []
-    if not isinstance(data, (list, tuple)):
-        data = [data]
-
-    header_row = 1
-
-    blocks: List[Dict] = []
-    current_start: Optional[int] = None
-    current_vendor: Optional[str] = None
-
-    for i, row in enumerate(data, start=r1):
-        row_values = row if isinstance(row, (list, tuple)) else [row]
-        row_texts = [str(x) if x is not None else "" for x in row_values]
-        joined = " ".join(row_texts).strip()
-        if not joined and current_start is None:
-            continue
-
-        if current_start is None:
-            vendor_match = RE_VENDEDOR.search(joined)
-            if vendor_match:
-                after = joined[vendor_match.end():].strip()
-                current_vendor = after if after else joined
-                current_start = i
-        else:
-            saldo_match = RE_SALDO_PARA.search(joined)
-            if saldo_match:
-                saldo_vendor = saldo_match.group(1).strip()
-                vendor_name = (current_vendor or saldo_vendor or joined).strip()
-                blocks.append({
-                    "vendor_name": vendor_name,
-                    "row_start": current_start,
-                    "row_end": i,
-                    "header_row": header_row
-                })
-                current_start = None
-                current_vendor = None
-
-    if current_start is not None:
-        vendor_name = (current_vendor or f"Vendedor_{current_start}").strip()
-        blocks.append({
-            "vendor_name": vendor_name,
-            "row_start": current_start,
-            "row_end": r2,
-            "header_row": header_row
-        })
-
-    return blocks
+    scanner = _BlockScanner()
+    for first_row, rows in iter_row_chunks(ws, cols=(c1, c2), start=r1, end=r2, chunk=chunk):
+        scanner.feed(rows, first_row)
+    return scanner.finish(r2)
 
 def _scan_vendor_blocks(
-    wb,
+    wb_index: WorkbookIndex,
     hojas_completas_set: set[str],
     target_sheet_name: Optional[str],
 ) -> Tuple[List[Dict], Dict[str, Optional[Tuple[int, int]]]]:
@@ -282,8 +363,8 @@ def _scan_vendor_blocks(
     blocks_out: List[Dict] = []
     header_rows_map: Dict[str, Optional[Tuple[int, int]]] = {}
 
-    for ws in wb.Worksheets:
-        name = str(ws.Name)
+    for entry in wb_index:
+        name = entry.name
         name_clean = name.strip()
 
         if name_clean in hojas_completas_set:
@@ -291,7 +372,7 @@ def _scan_vendor_blocks(
         if target_sheet_name and name != target_sheet_name:
             continue
 
-        blocks = _find_vendor_blocks(ws)
+        blocks = _find_vendor_blocks(entry.ws, wb_index.used_bounds(entry))
         if not blocks:
             continue
 
@@ -331,40 +412,37 @@ def list_vendor_blocks(
     hojas_completas: Tuple[str, ...] = ("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
     hoja_base: Optional[str] = None,
     include_saldos: bool = True,
+    excel=None,
 ) -> List[Dict]:
     """
     Devuelve la lista de bloques detectados (sin exportar PDFs).
     Cada item incluye: id, vendor_name, row_start, row_end, sheet_name.
+    ``excel``: instancia ya abierta a reutilizar (no se cierra al terminar).
     """
+    own_excel = excel is None
     initialized = False
-    try:
-        pythoncom.CoInitialize()
-        initialized = True
-    except pythoncom.com_error as exc:
-        raise RuntimeError(f'No se pudo inicializar COM: {exc}') from exc
+    if own_excel:
+        pythoncom, win32 = _win32()
+        try:
+            co_initialize()
+            initialized = True
+        except pythoncom.com_error as exc:
+            raise RuntimeError(f'No se pudo inicializar COM: {exc}') from exc
 
-    excel = None
     wb = None
     try:
-        excel = win32.DispatchEx("Excel.Application")
-        excel.Visible = False
-        excel.DisplayAlerts = False
+        if own_excel:
+            excel = win32.DispatchEx("Excel.Application")
+            excel.Visible = False
+            excel.DisplayAlerts = False
         try:
-            wb = excel.Workbooks.Open(str(xls_path))
+            wb = com_call(excel.Workbooks.Open, str(xls_path))
         except Exception as exc:
             raise RuntimeError(f"No se pudo abrir el archivo de Excel: {exc}") from exc
 
-        hojas_completas_set = {alias.strip() for alias in hojas_completas}
-        hoja_lookup = {ws.Name.strip().lower(): ws.Name for ws in wb.Worksheets}
-
-        hoja_base_normalized: Optional[str] = None
-        if hoja_base:
-            hoja_base_normalized = hoja_base.strip().lower()
-            if hoja_base_normalized not in hoja_lookup:
-                raise ValueError(f"No existe la hoja solicitada: {hoja_base}")
-
-        target_sheet_name = hoja_lookup.get(hoja_base_normalized) if hoja_base_normalized else None
-        blocks, _ = _scan_vendor_blocks(wb, hojas_completas_set, target_sheet_name)
+        wb_index = WorkbookIndex(wb)
+        hojas_completas_set, target_sheet_name = _resolve_sheets(wb_index, hojas_completas, hoja_base)
+        blocks, _ = _scan_vendor_blocks(wb_index, hojas_completas_set, target_sheet_name)
         if include_saldos:
             blocks = [
                 {
@@ -379,138 +457,143 @@ def list_vendor_blocks(
     finally:
         if wb is not None:
             wb.Close(SaveChanges=False)
-        if excel is not None:
-            time.sleep(0.2)
-            excel.Quit()
+        if own_excel and excel is not None:
+            # Sin pausa fija: si Excel sigue ocupado, el filtro/com_call reintentan
+            com_call(excel.Quit)
         if initialized:
-            pythoncom.CoUninitialize()
+            co_uninitialize()
 
 
 # ------------------------
 # Exportación
 # ------------------------
-def export_vendor_pdfs(
-    xls_path: Path,
+def _export_workbook_blocks(
+    wb,
     out_dir: Path,
-    hojas_completas: Tuple[str, ...] = ("SUR", "NORTE", "IMPORTE CUENTA SALDO"),
-    hoja_base: Optional[str] = None,
-    orden_ids: Optional[List[str]] = None,
-    excluir_ids: Optional[List[str]] = None,
-    pdf_date: Optional[str] = None,
-) -> List[Path]:
+    hojas_completas: Tuple[str, ...],
+    hoja_base: Optional[str],
+    orden_ids: Optional[List[str]],
+    date_tag: Optional[str],
+    session: ExcelSession,
+    report: JobReport,
+    wb_index: Optional[WorkbookIndex] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Tuple[List[Path], Dict[str, Path], List[str]]:
     """
-    xls_path: ruta del Excel origen.
-    out_dir: carpeta donde guardar los PDFs.
-    hojas_completas: hojas que se exportan tal cual.
-    hoja_base: si se especifica, solo procesa esa hoja para bloques de vendedor;
-               si es None, intenta procesar todas las hojas no incluidas en hojas_completas.
-    orden_ids: orden preferido (IDs de bloques) para el consolidado y numeracion.
-    excluir_ids: IDs de bloques a excluir del consolidado (no afecta los PDFs individuales).
-    pdf_date: fecha ISO (YYYY-MM-DD) para agregar al nombre de archivos.
+    Exporta hojas completas y bloques de vendedor de un libro ya abierto.
+    Devuelve (PDFs generados, PDF por ID de bloque, orden de IDs para el consolidado).
+    ``cancel`` se revisa antes de cada hoja y de cada bloque; al cancelar se
+    borran los PDFs ya generados.
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
-    date_tag = _date_tag_from_iso(pdf_date)
-
-    initialized = False
+    generated: List[Path] = []
     try:
-        pythoncom.CoInitialize()
-        initialized = True
-    except pythoncom.com_error as exc:
-        raise RuntimeError(f'No se pudo inicializar COM: {exc}') from exc
+        return _export_blocks(
+            wb, out_dir, hojas_completas, hoja_base, orden_ids, date_tag, session, report, wb_index, cancel, generated
+        )
+    except JobCancelled:
+        for p in generated:
+            p.unlink(missing_ok=True)
+        raise
 
-    excel = None
-    wb = None
-    generated: List[Path] = []
-    pdf_by_id: Dict[str, Path] = {}
 
-    try:
-        excel = win32.DispatchEx("Excel.Application")
-        excel.Visible = False
-        excel.DisplayAlerts = False
+def _export_blocks(
+    wb,
+    out_dir: Path,
+    hojas_completas: Tuple[str, ...],
+    hoja_base: Optional[str],
+    orden_ids: Optional[List[str]],
+    date_tag: Optional[str],
+    session: ExcelSession,
+    report: JobReport,
+    wb_index: Optional[WorkbookIndex],
+    cancel: Optional[CancelToken],
+    generated: List[Path],
+) -> Tuple[List[Path], Dict[str, Path], List[str]]:
+    pdf_by_id: Dict[str, Path] = {}
 
-        try:
-            wb = excel.Workbooks.Open(str(xls_path))
-        except Exception as exc:
-            raise RuntimeError(f"No se pudo abrir el archivo de Excel: {exc}") from exc
+    wb_index = wb_index if wb_index is not None else WorkbookIndex(wb)
+    hojas_completas_set, target_sheet_name = _resolve_sheets(wb_index, hojas_completas, hoja_base)
 
-        hojas_completas_set = {alias.strip() for alias in hojas_completas}
-        hoja_lookup = {ws.Name.strip().lower(): ws.Name for ws in wb.Worksheets}
-
-        hoja_base_normalized: Optional[str] = None
-        if hoja_base:
-            hoja_base_normalized = hoja_base.strip().lower()
-            if hoja_base_normalized not in hoja_lookup:
-                raise ValueError(f"No existe la hoja solicitada: {hoja_base}")
-
-        target_sheet_name = hoja_lookup.get(hoja_base_normalized) if hoja_base_normalized else None
-
-        for ws in wb.Worksheets:
-            name = str(ws.Name)
-            name_clean = name.strip()
-
-            if name_clean in hojas_completas_set:
-                pdf_base = f"COBRANZA_{_sanitize(name_clean)}"
-                pdf_name = f"{_with_date_suffix(pdf_base, date_tag)}.pdf"
-                pdf_path = out_dir / pdf_name
-                ws.ExportAsFixedFormat(Type=0, Filename=str(pdf_path), Quality=0, IncludeDocProperties=True, IgnorePrintAreas=False, OpenAfterPublish=False)
-                generated.append(pdf_path)
-
-        blocks, header_rows_map = _scan_vendor_blocks(wb, hojas_completas_set, target_sheet_name)
-        block_ids = [blk["id"] for blk in blocks]
-        if orden_ids:
-            ordered_block_ids = _apply_order(orden_ids, block_ids)
-        else:
-            ordered_block_ids = list(block_ids)
-        seq_map = {bid: idx + 1 for idx, bid in enumerate(ordered_block_ids)}
-
-        available_ids_for_merge = [SALDOS_BLOCK_ID] + block_ids
-        if orden_ids:
-            ordered_ids_for_merge = _apply_order(orden_ids, available_ids_for_merge)
-        else:
-            ordered_ids_for_merge = list(available_ids_for_merge)
+    for entry in wb_index:
+        ws = entry.ws
+        name_clean = entry.name.strip()
 
-        for blk in blocks:
-            ws = wb.Worksheets(blk["sheet_name"])
-            header_rows = header_rows_map.get(blk["sheet_name"])
-            vendor_name_raw = blk["vendor_name"].strip()
-            vendor_display = _strip_leading_code(vendor_name_raw)
-            vendor = _sanitize(vendor_display) or "SIN_NOMBRE"
-            row_start = blk["row_start"]
-            row_end = blk["row_end"]
-            seq = seq_map.get(blk["id"], 0)
-
-            tmp = wb.Worksheets.Add(After=ws)
-            tmp_base = f"_tmp_{vendor[:20] or 'VEN'}"
-            tmp_name = tmp_base
-            suffix = 1
-            while True:
-                try:
-                    tmp.Name = tmp_name
-                    break
-                except Exception:
-                    tmp_name = f"{tmp_base[:18]}_{suffix}"
-                    suffix += 1
+        if name_clean in hojas_completas_set:
+            check_cancel(cancel)
+            pdf_base = f"COBRANZA_{_sanitize(name_clean)}"
+            pdf_name = f"{_with_date_suffix(pdf_base, date_tag)}.pdf"
+            pdf_path = out_dir / pdf_name
+            with report.stage("export_full_sheets"):
+                com_call(ws.ExportAsFixedFormat, Type=0, Filename=str(pdf_path), Quality=0, IncludeDocProperties=True, IgnorePrintAreas=False, OpenAfterPublish=False)
+            generated.append(pdf_path)
+
+    with report.stage("scan_blocks"):
+        blocks, header_rows_map = _scan_vendor_blocks(wb_index, hojas_completas_set, target_sheet_name)
+    report.count("vendor_blocks", len(blocks))
+    block_ids = [blk["id"] for blk in blocks]
+    if orden_ids:
+        ordered_block_ids = _apply_order(orden_ids, block_ids)
+    else:
+        ordered_block_ids = list(block_ids)
+    seq_map = {bid: idx + 1 for idx, bid in enumerate(ordered_block_ids)}
 
+    available_ids_for_merge = [SALDOS_BLOCK_ID] + block_ids
+    if orden_ids:
+        ordered_ids_for_merge = _apply_order(orden_ids, available_ids_for_merge)
+    else:
+        ordered_ids_for_merge = list(available_ids_for_merge)
+
+    for blk in blocks:
+        check_cancel(cancel)
+        ws = wb_index.get(blk["sheet_name"])
+        header_rows = header_rows_map.get(blk["sheet_name"])
+        vendor_name_raw = blk["vendor_name"].strip()
+        vendor_display = _strip_leading_code(vendor_name_raw)
+        vendor = _sanitize(vendor_display) or "SIN_NOMBRE"
+        row_start = blk["row_start"]
+        row_end = blk["row_end"]
+        seq = seq_map.get(blk["id"], 0)
+
+        tmp = wb.Worksheets.Add(After=ws)
+        tmp_base = f"_tmp_{vendor[:20] or 'VEN'}"
+        tmp_name = tmp_base
+        suffix = 1
+        while True:
             try:
+                tmp.Name = tmp_name
+                break
+            except Exception:
+                tmp_name = f"{tmp_base[:18]}_{suffix}"
+                suffix += 1
+
+        try:
+            # PageSetup en lote: PrintCommunication se reactiva antes de exportar
+            with report.stage("block_layout"), session.print_batch():
                 aplicar_layout_modelo(ws, tmp, row_start, row_end, header_rows=header_rows)
-                prefix = f"{seq:06d} " if seq else ""
-                pdf_base = f"COBRANZA_{prefix}{vendor}"
-                pdf_name = f"{_with_date_suffix(pdf_base, date_tag)}.pdf"
-                pdf_path = out_dir / pdf_name
-                tmp.ExportAsFixedFormat(Type=0, Filename=str(pdf_path), Quality=0, IncludeDocProperties=True, IgnorePrintAreas=False, OpenAfterPublish=False)
-                generated.append(pdf_path)
-                pdf_by_id[blk["id"]] = pdf_path
-            finally:
-                tmp.Delete()
-    finally:
-        if wb is not None:
-            wb.Close(SaveChanges=False)
-        if excel is not None:
-            time.sleep(0.2)
-            excel.Quit()
-        if initialized:
-            pythoncom.CoUninitialize()
+            prefix = f"{seq:06d} " if seq else ""
+            pdf_base = f"COBRANZA_{prefix}{vendor}"
+            pdf_name = f"{_with_date_suffix(pdf_base, date_tag)}.pdf"
+            pdf_path = out_dir / pdf_name
+            with report.stage("block_export"):
+                com_call(tmp.ExportAsFixedFormat, Type=0, Filename=str(pdf_path), Quality=0, IncludeDocProperties=True, IgnorePrintAreas=False, OpenAfterPublish=False)
+            generated.append(pdf_path)
+            pdf_by_id[blk["id"]] = pdf_path
+        finally:
+            tmp.Delete()
 
+    return generated, pdf_by_id, ordered_ids_for_merge
+
+
+def _merge_outputs(
+    out_dir: Path,
+    generated: List[Path],
+    pdf_by_id: Dict[str, Path],
+    ordered_ids_for_merge: List[str],
+    excluir_ids: Optional[List[str]],
+    date_tag: Optional[str],
+    report: JobReport,
+) -> List[Path]:
+    """Une SALDOS COBRANZA y el consolidado (sólo pypdf, Excel ya no interviene)."""
     # Merging especial: SALDOS COBRANZA (IMPORTE CUENTA SALDO + NORTE + SUR)
     saldos_components = [
         "COBRANZA_IMPORTE CUENTA SALDO",
@@ -529,7 +612,8 @@ def export_vendor_pdfs(
         saldos_base = "SALDOS COBRANZA"
         saldos_name = f"{_with_date_suffix(saldos_base, date_tag)}.pdf"
         saldos_path = out_dir / saldos_name
-        merged_saldos = _merge_pdf_files(saldos_paths, saldos_path)
+        with report.stage("merge_pdfs"):
+            merged_saldos = _merge_pdf_files(saldos_paths, saldos_path)
         if merged_saldos:
             generated = [p for p in generated if p not in saldos_paths]
             generated.append(merged_saldos)
@@ -553,8 +637,121 @@ def export_vendor_pdfs(
     merged_path = None
     if merge_candidates:
         consolidated_path = out_dir / consolidated_name
-        merged_path = _merge_pdf_files(merge_candidates, consolidated_path)
+        with report.stage("merge_pdfs"):
+            merged_path = _merge_pdf_files(merge_candidates, consolidated_path)
     if merged_path and merged_path not in generated:
         generated.append(merged_path)
 
     return generated
+
+
+def export_vendor_pdfs_from_workbook(
+    wb,
+    out_dir: Path,
+    session: ExcelSession,
+    hojas_completas: Tuple[str, ...] = DEFAULT_FULL_SHEETS,
+    hoja_base: Optional[str] = None,
+    orden_ids: Optional[List[str]] = None,
+    excluir_ids: Optional[List[str]] = None,
+    pdf_date: Optional[str] = None,
+    report: Optional[JobReport] = None,
+    wb_index: Optional[WorkbookIndex] = None,
+    cancel: Optional[CancelToken] = None,
+) -> List[Path]:
+    """
+    Igual que ``export_vendor_pdfs`` pero sobre un libro ya abierto (p.ej. el
+    destino recién guardado por el merge): no abre ni cierra el libro ni Excel.
+    ``session`` debe estar aplicada; se finaliza aquí (no-op si ya lo estaba).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    date_tag = _date_tag_from_iso(pdf_date)
+    report = report if report is not None else JobReport()
+    session.finalize()
+    generated, pdf_by_id, ordered_ids_for_merge = _export_workbook_blocks(
+        wb, out_dir, hojas_completas, hoja_base, orden_ids, date_tag, session, report, wb_index, cancel
+    )
+    return _merge_outputs(out_dir, generated, pdf_by_id, ordered_ids_for_merge, excluir_ids, date_tag, report)
+
+
+def export_vendor_pdfs(
+    xls_path: Path,
+    out_dir: Path,
+    hojas_completas: Tuple[str, ...] = DEFAULT_FULL_SHEETS,
+    hoja_base: Optional[str] = None,
+    orden_ids: Optional[List[str]] = None,
+    excluir_ids: Optional[List[str]] = None,
+    pdf_date: Optional[str] = None,
+    excel=None,
+    report: Optional[JobReport] = None,
+    cancel: Optional[CancelToken] = None,
+) -> List[Path]:
+    """
+    xls_path: ruta del Excel origen.
+    out_dir: carpeta donde guardar los PDFs.
+    hojas_completas: hojas que se exportan tal cual.
+    hoja_base: si se especifica, solo procesa esa hoja para bloques de vendedor;
+               si es None, intenta procesar todas las hojas no incluidas en hojas_completas.
+    orden_ids: orden preferido (IDs de bloques) para el consolidado y numeracion.
+    excluir_ids: IDs de bloques a excluir del consolidado (no afecta los PDFs individuales).
+    pdf_date: fecha ISO (YYYY-MM-DD) para agregar al nombre de archivos.
+    excel: instancia de Excel ya abierta a reutilizar (no se cierra al terminar).
+    report: acumula tiempos por etapa (ms) y detalles del trabajo.
+    cancel: token revisado entre bloques; al cancelar se cierra el libro sin
+            guardar, se borran los PDFs generados y se lanza ``JobCancelled``.
+    """
+    check_cancel(cancel)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    date_tag = _date_tag_from_iso(pdf_date)
+    report = report if report is not None else JobReport()
+
+    own_excel = excel is None
+    initialized = False
+    if own_excel:
+        pythoncom, win32 = _win32()
+        try:
+            co_initialize()
+            initialized = True
+        except pythoncom.com_error as exc:
+            raise RuntimeError(f'No se pudo inicializar COM: {exc}') from exc
+
+    wb = None
+    session: Optional[ExcelSession] = None
+
+    try:
+        if own_excel:
+            with report.stage("excel_start"):
+                excel = win32.DispatchEx("Excel.Application")
+                excel.Visible = False
+                excel.DisplayAlerts = False
+
+        with report.stage("open"):
+            try:
+                wb = com_call(excel.Workbooks.Open, str(xls_path))
+            except Exception as exc:
+                raise RuntimeError(f"No se pudo abrir el archivo de Excel: {exc}") from exc
+        session = ExcelSession(excel, report).apply()
+        # Las hojas completas y bloques se imprimen con valores al día
+        session.finalize()
+
+        generated, pdf_by_id, ordered_ids_for_merge = _export_workbook_blocks(
+            wb, out_dir, hojas_completas, hoja_base, orden_ids, date_tag, session, report, cancel=cancel
+        )
+    finally:
+        if session is not None:
+            session.restore()
+        if wb is not None:
+            wb.Close(SaveChanges=False)
+        if own_excel and excel is not None:
+            # Sin pausa fija: si Excel sigue ocupado, el filtro/com_call reintentan
+            com_call(excel.Quit)
+        if initialized:
+            co_uninitialize()
+
+    return _merge_outputs(out_dir, generated, pdf_by_id, ordered_ids_for_merge, excluir_ids, date_tag, report)
+
+
+def zip_pdfs(files: List[Path], target) -> None:
+    """Empaqueta los PDFs (sólo nombre base) en ``target``: ruta o archivo binario."""
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for p in files:
+            zf.write(p, arcname=p.name)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+preflight.py
+------------
+Validación previa del merge sin abrir Excel: lee origen y maestro con el
+lector BIFF (``xls_reader``), busca las filas "Saldo para ..." de la hoja 1
+del origen, las resuelve con los alias contra la columna B de las hojas
+destino del maestro y devuelve vendedores encontrados, sin destino
+(``unmatched``) y esperados que faltan en el origen (``missing``), con totales.
+
+El origen se abre con ``open_xls`` (mmap) y su hoja 1 se recorre por
+bloques de filas (``row_iter``) sin cargarla entera.
+Con un maestro del registro (``master_registry``) se usan sus filas destino
+ya analizadas y no se vuelve a leer el maestro.
+
+Pensado para fallar en milisegundos ante un archivo equivocado antes de
+gastar 20-30 s de Excel en el merge.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional
+
+from .excel_copy import TARGET_NAME_COL, vendor_totals_from_rows
+from .master_registry import get_registry
+from .vendor_matcher import VendorMatcher, get_matcher, norm_name
+from .row_iter import iter_rows
+from .xls_reader import XlsBook, XlsFile, XlsReadError, open_xls
+
+
+def _target_rows(master: XlsBook | XlsFile) -> Dict[str, List[str]]:
+    """Nombre normalizado de col B (hojas 2..n) -> hojas donde aparece."""
+    targets: Dict[str, List[str]] = {}
+    for position in range(2, len(master.sheet_names) + 1):
+        sheet = master.sheet(position)
+        for r in range(1, sheet.nrows + 1):
+            raw = sheet.value(r, TARGET_NAME_COL)
+            if isinstance(raw, str) and raw.strip():
+                sheets = targets.setdefault(norm_name(raw), [])
+                if sheet.name not in sheets:
+                    sheets.append(sheet.name)
+    return targets
+
+
+def _cached_target_rows(master_path: str) -> Optional[Dict[str, List[str]]]:
+    meta = get_registry().metadata_for_path(master_path)
+    if meta is None:
+        return None
+    targets: Dict[str, List[str]] = {}
+    for t in meta["targets"]:
+        sheets = targets.setdefault(t["name_norm"], [])
+        if t["sheet"] not in sheets:
+            sheets.append(t["sheet"])
+    return targets
+
+
+def _sum(values: List[Optional[float]]) -> float:
+    return round(sum(v for v in values if v is not None), 2)
+
+
+def preflight_merge(
+    source_path: str,
+    master_path: str,
+    matcher: Optional[VendorMatcher] = None,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    matcher = matcher or get_matcher()
+    result: Dict[str, Any] = {
+        "ok": False,
+        "parsed": False,
+        "found": [],
+        "unmatched": [],
+        "missing": [],
+        "totals": {"vendors": 0, "importe": 0.0, "a_cuenta": 0.0, "saldo": 0.0},
+        "errors": [],
+        "alias_version": matcher.version,
+    }
+
+    targets = _cached_target_rows(master_path)
+    source_sheet: Optional[str] = None
+    totals: Dict[str, Any] = {}
+    try:
+        # Del origen sólo se recorre la hoja 1, por bloques de filas (memoria acotada)
+        with open_xls(source_path) as source:
+            if source.sheet_names:
+                first = source.stream_sheet(1)
+                source_sheet = first.name
+                totals = vendor_totals_from_rows(iter_rows(first), first.ncols)
+        if targets is None:
+            with open_xls(master_path) as master:
+                targets = _target_rows(master)
+    except (XlsReadError, OSError) as exc:
+        # Sin veredicto: el merge con Excel decidirá (p.ej. HTML guardado como .xls)
+        result["errors"].append(f"No se pudo leer sin Excel: {exc}")
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+    result["parsed"] = True
+
+    if source_sheet is None:
+        result["errors"].append("El archivo de origen no tiene hojas.")
+    else:
+        result["source_sheet"] = source_sheet
+
+        mapped: Dict[str, str] = {key: matcher.map_source(key) for key in totals}
+        index = matcher.index_for(targets.keys())
+
+        matched_targets = set()
+        for key, (v1, v2, v3) in totals.items():
+            target = mapped[key]
+            hit = index.match(target)
+            entry = {
+                "vendor": key,
+                "target": target,
+                "importe": v1,
+                "a_cuenta": v2,
+                "saldo": v3,
+                "sheets": targets.get(hit[0], []) if hit else [],
+            }
+            if hit is None:
+                result["unmatched"].append(entry)
+            else:
+                matched_targets.add(hit[0])
+                if hit[0] != target:
+                    entry["matched_as"] = hit[0]
+                result["found"].append(entry)
+
+        # Vendedores conocidos (destinos de alias) presentes en el maestro pero no en el origen
+        expected = set(matcher.alias_norm.values()) & set(targets)
+        result["missing"] = sorted(expected - matched_targets)
+
+        result["totals"] = {
+            "vendors": len(totals),
+            "importe": _sum([v[0] for v in totals.values()]),
+            "a_cuenta": _sum([v[1] for v in totals.values()]),
+            "saldo": _sum([v[2] for v in totals.values()]),
+        }
+        if not totals:
+            result["errors"].append("No se encontraron filas 'Saldo para ...' en la primera hoja del origen.")
+        if result["unmatched"]:
+            result["errors"].append(
+                "Vendedores sin fila destino en el maestro: "
+                + ", ".join(e["vendor"] for e in result["unmatched"])
+            )
+
+    result["ok"] = result["parsed"] and not result["errors"]
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
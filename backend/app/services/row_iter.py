@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+row_iter.py
+-----------
+Recorrido de una hoja por filas, en bloques, sin traer el UsedRange entero:
+
+    for r, row in iter_rows(ws, cols=(1, 12), start=1, chunk=2000): ...
+
+``sheet`` puede ser una hoja COM (o un objeto falso con la misma API:
+``UsedRange``, ``Range``, ``Cells``), una ``XlsSheet`` ya interpretada o una
+``XlsSheetStream`` (lector BIFF sin cargar la hoja). Cada bloque es una
+lectura ``Range(...).Value`` en COM; como es un generador, quien recorre
+puede cortar en cuanto encuentra lo que busca y no se leen más bloques.
+
+Las filas son tuplas con las columnas ``cols`` (1-based, inclusivas);
+``iter_row_chunks`` entrega los bloques (primera fila, filas) tal cual para
+los escáneres que trabajan por columnas.
+
+COBRANZA_ROW_CHUNK: filas por bloque (por defecto 2000).
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Iterator, List, Optional, Tuple
+
+from .xls_reader import XlsSheet, XlsSheetStream
+
+DEFAULT_ROW_CHUNK = 2000
+
+Bounds = Tuple[int, int, int, int]
+Row = Tuple[Any, ...]
+
+
+def row_chunk_size() -> int:
+    try:
+        return max(1, int(os.getenv("COBRANZA_ROW_CHUNK", str(DEFAULT_ROW_CHUNK))))
+    except ValueError:
+        return DEFAULT_ROW_CHUNK
+
+
+def sheet_bounds(sheet) -> Bounds:
+    """(fila1, col1, fila2, col2) con datos: UsedRange en COM, celdas con valor en BIFF."""
+    if isinstance(sheet, (XlsSheet, XlsSheetStream)):
+        return 1, 1, sheet.nrows, sheet.ncols
+    ur = sheet.UsedRange
+    r1 = ur.Row
+    c1 = ur.Column
+    return r1, c1, r1 + ur.Rows.Count - 1, c1 + ur.Columns.Count - 1
+
+
+def _com_chunks(ws, c1: int, c2: int, start: int, end: int, chunk: int) -> Iterator[Tuple[int, List[Row]]]:
+    for first in range(start, end + 1, chunk):
+        last = min(end, first + chunk - 1)
+        data = ws.Range(ws.Cells(first, c1), ws.Cells(last, c2)).Value
+        if not isinstance(data, tuple):
+            data = ((data,),)  # una sola celda
+        yield first, [row if isinstance(row, tuple) else (row,) for row in data]
+
+
+def _xls_chunks(sheet: XlsSheet, c1: int, c2: int, start: int, end: int, chunk: int) -> Iterator[Tuple[int, List[Row]]]:
+    for first in range(start, end + 1, chunk):
+        last = min(end, first + chunk - 1)
+        yield first, [tuple(sheet.row_values(r, c1, c2)) for r in range(first, last + 1)]
+
+
+def iter_row_chunks(
+    sheet,
+    cols: Optional[Tuple[int, int]] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    chunk: Optional[int] = None,
+) -> Iterator[Tuple[int, List[Row]]]:
+    """
+    Bloques (primera fila, filas) de ``start`` a ``end`` (por defecto los
+    límites con datos de la hoja) con ``chunk`` filas como máximo.
+    """
+    chunk = max(1, chunk or row_chunk_size())
+    if cols is None or start is None or end is None:
+        r1, c1, r2, c2 = sheet_bounds(sheet)
+        cols = cols or (c1, c2)
+        start = r1 if start is None else start
+        end = r2 if end is None else end
+    c1, c2 = cols
+    if end < start or c2 < c1:
+        return iter(())
+    if isinstance(sheet, XlsSheet):
+        return _xls_chunks(sheet, c1, c2, start, end, chunk)
+    if isinstance(sheet, XlsSheetStream):
+        return sheet.iter_row_chunks(c1, c2, start, end, chunk)
+    return _com_chunks(sheet, c1, c2, start, end, chunk)
+
+
+def iter_rows(
+    sheet,
+    cols: Optional[Tuple[int, int]] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    chunk: Optional[int] = None,
+) -> Iterator[Tuple[int, Row]]:
+    """(fila, valores) de cada fila, leyendo la hoja por bloques."""
+    for first, rows in iter_row_chunks(sheet, cols, start, end, chunk):
+        yield from enumerate(rows, start=first)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+scan_bench.py
+-------------
+Medición del tamaño de bloque de ``row_iter`` con los dos escáneres de
+hoja: totales "Saldo para ..." (hoja 1) y bloques de vendedor (todas las
+hojas). Sirve igual sobre hojas COM (trabajo ``scan_bench`` en Excel) que
+sobre el lector BIFF (``bench_xls_file``, sin Excel).
+"""
+from __future__ import annotations
+
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from .excel_copy import vendor_totals_from_rows
+from .pdf_export_service import _find_vendor_blocks
+from .row_iter import iter_rows, row_chunk_size, sheet_bounds
+from .xls_reader import open_xls
+
+
+def _timed(fn, memory: bool) -> tuple[Any, float, Optional[int]]:
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+        if memory:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_sheets(
+    sheets: Sequence[Any],
+    chunks: Sequence[int],
+    repeat: int = 3,
+    memory: bool = False,
+) -> List[Dict[str, Any]]:
+    """Por tamaño de bloque: mejor tiempo (ms) de cada escáner sobre ``sheets``."""
+    chunks = list(chunks) or [row_chunk_size()]
+    bounds = [sheet_bounds(ws) for ws in sheets]
+    results: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        def totals() -> int:
+            if not sheets:
+                return 0
+            _r1, _c1, r2, c2 = bounds[0]
+            if r2 < 1 or c2 < 1:
+                return 0
+            rows = iter_rows(sheets[0], cols=(1, c2), start=1, end=r2, chunk=chunk)
+            return len(vendor_totals_from_rows(rows, c2))
+
+        def blocks() -> int:
+            return sum(len(_find_vendor_blocks(ws, b, chunk=chunk)) for ws, b in zip(sheets, bounds))
+
+        entry: Dict[str, Any] = {"chunk": chunk}
+        for name, fn in (("totals", totals), ("blocks", blocks)):
+            best = None
+            for _ in range(max(1, repeat)):
+                found, ms, peak = _timed(fn, memory)
+                if best is None or ms < best[1]:
+                    best = (found, ms, peak)
+            assert best is not None
+            entry[name] = {"found": best[0], "best_ms": round(best[1], 2)}
+            if memory:
+                entry[name]["peak_kb"] = round((best[2] or 0) / 1024, 1)
+        # Lecturas por bloque del escáner de bloques (llamadas a Range.Value en COM)
+        entry["fetches"] = sum(-(-(b[2] - b[0] + 1) // chunk) for b in bounds if b[2] >= b[0] and b[3] >= b[1])
+        results.append(entry)
+    return results
+
+
+def bench_workbook(
+    wb,
+    chunks: Sequence[int],
+    repeat: int = 3,
+    memory: bool = False,
+) -> Dict[str, Any]:
+    """Benchmark sobre un libro abierto en Excel (lecturas COM por bloque)."""
+    from .workbook_index import WorkbookIndex
+
+    sheets = [entry.ws for entry in WorkbookIndex(wb)]
+    return {
+        "reader": "com",
+        "sheets": len(sheets),
+        "rows": sum(max(0, b[2] - b[0] + 1) for b in map(sheet_bounds, sheets)),
+        "results": bench_sheets(sheets, chunks, repeat, memory),
+    }
+
+
+def bench_xls_file(
+    path: str | Path,
+    chunks: Sequence[int],
+    repeat: int = 3,
+    memory: bool = False,
+) -> Dict[str, Any]:
+    """Benchmark con el lector BIFF (hojas en streaming, sin Excel)."""
+    with open_xls(path) as book:
+        sheets = [book.stream_sheet(i) for i in range(1, len(book.sheet_names) + 1)]
+        rows = sum(ws.nrows for ws in sheets)
+        return {
+            "file": str(path),
+            "reader": "biff",
+            "sheets": len(sheets),
+            "rows": rows,
+            "results": bench_sheets(sheets, chunks, repeat, memory),
+        }
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+sheet_transfer.py
+-----------------
+Traspaso de una hoja a otra SIN portapapeles.
+
+El portapapeles de Windows es único para toda la sesión: dos merges que
+hacen ``Copy()`` + ``Paste`` a la vez se pisan entre sí. Aquí se toma una
+"foto" del UsedRange de origen y se aplica al destino con operaciones de
+rango completas:
+
+- ``Range.Value(11)`` (xlRangeValueXMLSpreadsheet): una sola lectura y una
+  sola escritura que llevan valores/fórmulas (R1C1, relativas como en
+  Copy), formatos numéricos, fuentes, rellenos, bordes, alineación y celdas
+  combinadas,
+- anchos de columna aplicados por tramos de columnas con el mismo ancho.
+
+Para el camino con portapapeles (último recurso) se ofrece ``clipboard_lock``,
+un mutex con nombre del sistema que serializa el uso entre hilos y procesos.
+El pegado no espera un tiempo fijo tras ``Copy()``: se reintenta con espera
+exponencial corta mientras el portapapeles o Excel no están listos.
+
+``compare_sheets`` / ``verify_direct_transfer`` comparan celda a celda
+(valores, fórmulas, formatos, fuentes, rellenos, bordes, combinadas y
+anchos) el resultado directo contra el del portapapeles.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .com_retry import CLIPBRD_E_CANT_OPEN, XL_E_METHOD_FAILED, RetryPolicy, default_policy
+
+XL_RANGE_VALUE_XML = 11
+XL_PASTE_ALL = -4104
+XL_NONE = -4142
+
+# COM: DISPATCH_PROPERTYGET / DISPATCH_PROPERTYPUT
+_PROPERTYGET = 2
+_PROPERTYPUT = 4
+
+CLIPBOARD_MUTEX_NAME = "Local\\CobranzaClipboard"
+CLIPBOARD_LOCK_TIMEOUT = 60.0
+
+# Atributos comparados por celda en la verificación
+FONT_ATTRS = ("Name", "Size", "Bold", "Italic", "Underline", "Color")
+ALIGN_ATTRS = ("HorizontalAlignment", "VerticalAlignment", "WrapText")
+BORDER_EDGES = (7, 8, 9, 10)  # xlEdgeLeft, xlEdgeTop, xlEdgeBottom, xlEdgeRight
+
+_local_clipboard_lock = threading.Lock()
+
+
+# -------------------------------------------------------------------
+# Utilidades COM
+# -------------------------------------------------------------------
+def _range_xml(rng) -> str:
+    """``rng.Value(11)``: la propiedad con argumento no es accesible vía dispatch dinámico."""
+    ole = rng._oleobj_
+    dispid = ole.GetIDsOfNames("Value")
+    return ole.Invoke(dispid, 0, _PROPERTYGET, True, XL_RANGE_VALUE_XML)
+
+
+def _set_range_xml(rng, xml: str) -> None:
+    ole = rng._oleobj_
+    dispid = ole.GetIDsOfNames("Value")
+    ole.Invoke(dispid, 0, _PROPERTYPUT, False, XL_RANGE_VALUE_XML, xml)
+
+
+def _as_grid(value: Any) -> Tuple[Tuple[Any, ...], ...]:
+    """Value/Formula de una sola celda devuelve un escalar; de un rango, tuplas."""
+    if isinstance(value, tuple):
+        return tuple(row if isinstance(row, tuple) else (row,) for row in value)
+    return ((value,),)
+
+
+def _block(ws, rows: int, cols: int):
+    return ws.Range(ws.Cells(1, 1), ws.Cells(rows, cols))
+
+
+# -------------------------------------------------------------------
+# Foto del origen y aplicación en bloque
+# -------------------------------------------------------------------
+@dataclass
+class SheetSnapshot:
+    rows: int
+    cols: int
+    xml: str
+    column_widths: List[float] = field(default_factory=list)
+
+
+def take_snapshot(src_ws) -> SheetSnapshot:
+    used = src_ws.UsedRange
+    rows = int(used.Rows.Count)
+    cols = int(used.Columns.Count)
+    first_col = int(used.Column)
+    widths = [float(src_ws.Columns(first_col + i).ColumnWidth) for i in range(cols)]
+    return SheetSnapshot(rows=rows, cols=cols, xml=_range_xml(used), column_widths=widths)
+
+
+def _width_runs(widths: List[float]) -> Iterator[Tuple[int, int, float]]:
+    """Tramos (col_ini, col_fin, ancho) 1-based de columnas consecutivas con igual ancho."""
+    start = 0
+    for i in range(1, len(widths) + 1):
+        if i == len(widths) or widths[i] != widths[start]:
+            yield start + 1, i, widths[start]
+            start = i
+
+
+def apply_snapshot(dst_ws, snap: SheetSnapshot) -> None:
+    """Escribe la foto a partir de A1 (igual que ``Copy(Destination=A1)``)."""
+    _set_range_xml(_block(dst_ws, snap.rows, snap.cols), snap.xml)
+    for c1, c2, width in _width_runs(snap.column_widths):
+        dst_ws.Range(dst_ws.Columns(c1), dst_ws.Columns(c2)).ColumnWidth = width
+
+
+def transfer_sheet_direct(src_ws, dst_ws) -> SheetSnapshot:
+    """Copia el UsedRange de ``src_ws`` en ``dst_ws`` sin tocar el portapapeles."""
+    snap = take_snapshot(src_ws)
+    apply_snapshot(dst_ws, snap)
+    return snap
+
+
+# -------------------------------------------------------------------
+# Portapapeles (serializado)
+# -------------------------------------------------------------------
+@contextmanager
+def clipboard_lock(timeout: float = CLIPBOARD_LOCK_TIMEOUT) -> Iterator[None]:
+    """
+    Mutex con nombre de Windows (compartido por hilos y procesos trabajadores);
+    fuera de Windows / sin pywin32 se reduce a un lock del proceso.
+    """
+    try:
+        import win32api
+        import win32event
+    except Exception:
+        if not _local_clipboard_lock.acquire(timeout=timeout):
+            raise RuntimeError("Portapapeles ocupado por otro trabajo.")
+        try:
+            yield
+        finally:
+            _local_clipboard_lock.release()
+        return
+
+    handle = win32event.CreateMutex(None, False, CLIPBOARD_MUTEX_NAME)
+    try:
+        rc = win32event.WaitForSingleObject(handle, int(timeout * 1000))
+        if rc not in (win32event.WAIT_OBJECT_0, win32event.WAIT_ABANDONED):
+            raise RuntimeError("Portapapeles ocupado por otro trabajo.")
+        try:
+            yield
+        finally:
+            win32event.ReleaseMutex(handle)
+    finally:
+        win32api.CloseHandle(handle)
+
+
+PASTE_RETRY_TOTAL_MS = 2000.0
+
+
+def _paste_policy() -> RetryPolicy:
+    """Reintentos del pegado: además de Excel ocupado, portapapeles aún no disponible (plazo corto)."""
+    return replace(default_policy(), total_ms=PASTE_RETRY_TOTAL_MS).with_transient(
+        (CLIPBRD_E_CANT_OPEN, XL_E_METHOD_FAILED)
+    )
+
+
+def paste_via_clipboard(excel, src_ws, dst_ws) -> str:
+    """Worksheet.Paste y, si falla, PasteSpecial(xlPasteAll); con el portapapeles bloqueado."""
+    last = ""
+    policy = _paste_policy()
+    with clipboard_lock():
+        try:
+            excel.CutCopyMode = False
+            src_ws.UsedRange.Copy()
+            policy.call(dst_ws.Paste, Destination=dst_ws.Range("A1"))
+            return "Worksheet.Paste"
+        except Exception as e2:
+            last = f"Worksheet.Paste -> {e2}"
+
+        try:
+            excel.CutCopyMode = False
+            src_ws.UsedRange.Copy()
+            policy.call(dst_ws.Range("A1").PasteSpecial, Paste=XL_PASTE_ALL)
+            return "Range.PasteSpecial(xlPasteAll)"
+        except Exception as e3:
+            last += f" | PasteSpecial(xlPasteAll) -> {e3}"
+        finally:
+            try:
+                excel.CutCopyMode = False
+            except Exception:
+                pass
+    raise RuntimeError(last)
+
+
+# -------------------------------------------------------------------
+# Verificación
+# -------------------------------------------------------------------
+def _cell_format(cell) -> Dict[str, Any]:
+    fmt: Dict[str, Any] = {"NumberFormat": cell.NumberFormat}
+    font = cell.Font
+    for attr in FONT_ATTRS:
+        fmt[f"Font.{attr}"] = getattr(font, attr)
+    interior = cell.Interior
+    fmt["Interior.Pattern"] = interior.Pattern
+    if interior.Pattern != XL_NONE:
+        fmt["Interior.Color"] = interior.Color
+    for attr in ALIGN_ATTRS:
+        fmt[attr] = getattr(cell, attr)
+    for edge in BORDER_EDGES:
+        border = cell.Borders(edge)
+        style = border.LineStyle
+        fmt[f"Border{edge}.LineStyle"] = style
+        if style != XL_NONE:
+            fmt[f"Border{edge}.Weight"] = border.Weight
+            fmt[f"Border{edge}.Color"] = border.Color
+    fmt["MergeArea"] = cell.MergeArea.Address if cell.MergeCells else None
+    return fmt
+
+
+def compare_sheets(expected_ws, actual_ws, rows: int, cols: int, max_diffs: int = 50) -> List[str]:
+    """
+    Diferencias (texto) entre dos hojas en el bloque A1:(rows, cols).
+    Valores y fórmulas se leen en bloque; formatos celda por celda.
+    """
+    diffs: List[str] = []
+
+    def add(msg: str) -> bool:
+        diffs.append(msg)
+        return len(diffs) >= max_diffs
+
+    exp_block = _block(expected_ws, rows, cols)
+    act_block = _block(actual_ws, rows, cols)
+    for label, prop in (("valor", "Value2"), ("fórmula", "FormulaR1C1")):
+        exp_grid = _as_grid(getattr(exp_block, prop))
+        act_grid = _as_grid(getattr(act_block, prop))
+        for r in range(rows):
+            for c in range(cols):
+                if exp_grid[r][c] != act_grid[r][c]:
+                    if add(f"R{r + 1}C{c + 1} {label}: {exp_grid[r][c]!r} != {act_grid[r][c]!r}"):
+                        return diffs
+
+    for c in range(1, cols + 1):
+        exp_w = expected_ws.Columns(c).ColumnWidth
+        act_w = actual_ws.Columns(c).ColumnWidth
+        if abs(float(exp_w) - float(act_w)) > 0.01:
+            if add(f"C{c} ancho: {exp_w} != {act_w}"):
+                return diffs
+
+    for r in range(1, rows + 1):
+        for c in range(1, cols + 1):
+            exp_fmt = _cell_format(expected_ws.Cells(r, c))
+            act_fmt = _cell_format(actual_ws.Cells(r, c))
+            for key, exp_val in exp_fmt.items():
+                if act_fmt.get(key) != exp_val:
+                    if add(f"R{r}C{c} {key}: {exp_val!r} != {act_fmt.get(key)!r}"):
+                        return diffs
+    return diffs
+
+
+def verify_direct_transfer(excel, src_ws, max_diffs: int = 50) -> Dict[str, Any]:
+    """
+    Copia ``src_ws`` a un libro temporal por ambos caminos (portapapeles y
+    directo) y compara el resultado. No guarda nada.
+    """
+    wb = excel.Workbooks.Add()
+    try:
+        while wb.Worksheets.Count < 2:
+            wb.Worksheets.Add(After=wb.Worksheets(wb.Worksheets.Count))
+        by_clipboard = wb.Worksheets(1)
+        direct = wb.Worksheets(2)
+
+        started = time.perf_counter()
+        clipboard_method = paste_via_clipboard(excel, src_ws, by_clipboard)
+        clipboard_ms = (time.perf_counter() - started) * 1000
+        # El pegado no trae anchos: igualarlos como hace el merge tras pegar
+        used = src_ws.UsedRange
+        for i in range(int(used.Columns.Count)):
+            by_clipboard.Columns(i + 1).ColumnWidth = src_ws.Columns(int(used.Column) + i).ColumnWidth
+
+        started = time.perf_counter()
+        snap = transfer_sheet_direct(src_ws, direct)
+        direct_ms = (time.perf_counter() - started) * 1000
+
+        diffs = compare_sheets(by_clipboard, direct, snap.rows, snap.cols, max_diffs=max_diffs)
+        return {
+            "ok": not diffs,
+            "rows": snap.rows,
+            "cols": snap.cols,
+            "clipboard_method": clipboard_method,
+            "clipboard_ms": round(clipboard_ms, 2),
+            "direct_ms": round(direct_ms, 2),
+            "differences": diffs,
+        }
+    finally:
+        try:
+            wb.Close(SaveChanges=False)
+        except Exception:
+            pass
+
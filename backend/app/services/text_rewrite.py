@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+text_rewrite.py
+---------------
+Motor único de reemplazo de textos (fechas de encabezado, títulos) en hojas
+de Excel.
+
+Por cada hoja objetivo:
+- lee la región de encabezado en bloque (una sola llamada a ``Range.Value``)
+  y escribe sólo las celdas que cambian, agrupadas en tramos contiguos por fila,
+- recorre ``Shapes`` una sola vez (TextFrame2 y, si no aplica, TextFrame),
+- lee los seis encabezados/pies de ``PageSetup`` una sola vez y escribe sólo
+  los que cambian (opcionalmente dentro de un lote sin PrintCommunication).
+
+Cada regla lleva su contador de reemplazos, total y por tipo de destino.
+"""
+from __future__ import annotations
+
+import re
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .workbook_index import parse_address_bounds
+
+PAGE_HEADER_ATTRS = (
+    "LeftHeader", "CenterHeader", "RightHeader",
+    "LeftFooter", "CenterFooter", "RightFooter",
+)
+TARGET_KINDS = ("cells", "shapes", "headers")
+
+
+@dataclass(frozen=True)
+class RewriteRule:
+    """
+    ``pattern`` -> ``replacement``.
+    Con ``whole=True`` el texto completo se sustituye por ``replacement``
+    cuando el patrón aparece (p.ej. el título "COBRANZA AL ...").
+    ``kinds`` limita dónde aplica la regla (celdas, shapes, encabezados).
+    """
+
+    name: str
+    pattern: "re.Pattern[str]"
+    replacement: str
+    whole: bool = False
+    kinds: Tuple[str, ...] = TARGET_KINDS
+
+    def apply(self, text: str) -> Tuple[str, int]:
+        if self.whole:
+            if self.pattern.search(text):
+                return self.replacement, 1
+            return text, 0
+        return self.pattern.subn(self.replacement, text)
+
+
+@dataclass
+class SheetTarget:
+    """Hoja a procesar: región de encabezado (filas x columnas desde A1) y reglas."""
+
+    ws: Any
+    rows: int
+    cols: int
+    rules: Optional[Sequence[str]] = None  # nombres de reglas; None = todas
+    shapes: bool = True
+    page_headers: bool = True
+
+
+@dataclass
+class TextRewriter:
+    rules: List[RewriteRule]
+    counts: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        for rule in self.rules:
+            self.counts.setdefault(rule.name, {"total": 0, **{k: 0 for k in TARGET_KINDS}})
+
+    # ---------------- texto ----------------
+    def _rules_for(self, names: Optional[Sequence[str]], kind: str) -> List[RewriteRule]:
+        return [r for r in self.rules if kind in r.kinds and (names is None or r.name in names)]
+
+    def rewrite_text(self, text: Any, rules: Iterable[RewriteRule], kind: str) -> Optional[str]:
+        """Texto nuevo si alguna regla cambió algo; None si no hay cambios."""
+        if not isinstance(text, str) or not text:
+            return None
+        new = text
+        for rule in rules:
+            new, n = rule.apply(new)
+            if n:
+                self.counts[rule.name][kind] += n
+                self.counts[rule.name]["total"] += n
+        return new if new != text else None
+
+    # ---------------- destinos ----------------
+    def _rewrite_cells(self, target: SheetTarget) -> None:
+        rules = self._rules_for(target.rules, "cells")
+        if not rules:
+            return
+        bounds = parse_address_bounds(str(target.ws.UsedRange.Address))
+        if bounds is None:
+            return
+        rows = min(target.rows, bounds[2])
+        cols = min(target.cols, bounds[3])
+        if rows < 1 or cols < 1:
+            return
+        ws = target.ws
+        data = ws.Range(ws.Cells(1, 1), ws.Cells(rows, cols)).Value
+        if not isinstance(data, tuple):
+            data = ((data,),)
+
+        for r, row in enumerate(data, start=1):
+            run_start: Optional[int] = None
+            run_values: List[str] = []
+            for c, value in enumerate(row, start=1):
+                new = self.rewrite_text(value, rules, "cells")
+                if new is not None:
+                    if run_start is None:
+                        run_start = c
+                    run_values.append(new)
+                    continue
+                if run_start is not None:
+                    _write_run(ws, r, run_start, run_values)
+                    run_start, run_values = None, []
+            if run_start is not None:
+                _write_run(ws, r, run_start, run_values)
+
+    def _rewrite_shapes(self, target: SheetTarget) -> None:
+        rules = self._rules_for(target.rules, "shapes")
+        if not rules:
+            return
+        try:
+            shapes = list(target.ws.Shapes)
+        except Exception:
+            return
+        for shp in shapes:
+            # TextFrame2 (Office 2010+) y, si no tiene texto, TextFrame clásico
+            try:
+                tr = shp.TextFrame2.TextRange if shp.TextFrame2.HasText else None
+            except Exception:
+                tr = None
+            try:
+                if tr is not None:
+                    new = self.rewrite_text(tr.Text, rules, "shapes")
+                    if new is not None:
+                        tr.Text = new
+                    continue
+                chars = shp.TextFrame.Characters()
+                new = self.rewrite_text(chars.Text, rules, "shapes")
+                if new is not None:
+                    chars.Text = new
+            except Exception:
+                pass
+
+    def _rewrite_page_headers(
+        self,
+        target: SheetTarget,
+        batch: Optional[Callable[[], ContextManager[Any]]],
+    ) -> None:
+        rules = self._rules_for(target.rules, "headers")
+        if not rules:
+            return
+        try:
+            ps = target.ws.PageSetup
+            current = {attr: getattr(ps, attr, "") for attr in PAGE_HEADER_ATTRS}
+        except Exception:
+            return
+        changes = {}
+        for attr, text in current.items():
+            new = self.rewrite_text(text, rules, "headers")
+            if new is not None:
+                changes[attr] = new
+        if not changes:
+            return
+        with (batch() if batch is not None else nullcontext()):
+            for attr, new in changes.items():
+                try:
+                    setattr(ps, attr, new)
+                except Exception:
+                    pass
+
+    def rewrite_sheet(
+        self,
+        target: SheetTarget,
+        page_setup_batch: Optional[Callable[[], ContextManager[Any]]] = None,
+    ) -> None:
+        try:
+            self._rewrite_cells(target)
+        except Exception:
+            pass
+        if target.shapes:
+            self._rewrite_shapes(target)
+        if target.page_headers:
+            self._rewrite_page_headers(target, page_setup_batch)
+
+    def run(
+        self,
+        targets: Iterable[SheetTarget],
+        page_setup_batch: Optional[Callable[[], ContextManager[Any]]] = None,
+    ) -> Dict[str, Dict[str, int]]:
+        for target in targets:
+            self.rewrite_sheet(target, page_setup_batch)
+        return self.counts
+
+
+def _write_run(ws, row: int, col_start: int, values: List[str]) -> None:
+    """Escribe celdas contiguas de una fila en una sola asignación."""
+    try:
+        if len(values) == 1:
+            ws.Cells(row, col_start).Value = values[0]
+        else:
+            rng = ws.Range(ws.Cells(row, col_start), ws.Cells(row, col_start + len(values) - 1))
+            rng.Value = (tuple(values),)
+    except Exception:
+        # Celdas combinadas u hoja protegida: intento celda a celda
+        for offset, value in enumerate(values):
+            try:
+                ws.Cells(row, col_start + offset).Value = value
+            except Exception:
+                pass
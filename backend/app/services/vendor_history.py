@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+vendor_history.py
+-----------------
+Histórico de totales por vendedor (Importe, A cuenta, Saldo) para consultar
+tendencias sin reabrir los .xls antiguos.
+
+Cada merge agrega sus totales a la instantánea de la fecha de encabezado
+(o la del día si el merge no cambia la fecha). Varios orígenes de la misma
+fecha (p.ej. las sucursales de un lote) se suman a la misma instantánea;
+volver a hacer el merge de un origen reemplaza sólo los vendedores que trae.
+
+Almacenamiento: SQLite (``COBRANZA_HISTORY_DB``; por defecto
+app/data/history.sqlite3, o junto al ejecutable) en modo WAL, así que los
+procesos trabajadores escriben mientras la API consulta:
+
+- ``snapshots``: una fila por fecha (último origen registrado, hash del
+  origen y del maestro, vendedores de la fecha),
+- ``vendor_totals``: clave primaria (vendor, as_of) sin rowid, es decir las
+  filas de un vendedor quedan contiguas y ordenadas por fecha; un índice
+  por (as_of, vendor) cubre los rangos de fechas de todos los vendedores.
+
+El vendedor se guarda ya normalizado y con los alias aplicados (el mismo
+destino que usa el merge), así un cambio de nombre en el origen no parte la
+serie.
+
+COBRANZA_HISTORY=0 desactiva el registro (las consultas siguen disponibles).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from .. import metrics
+from ..paths import app_path
+from .vendor_matcher import VendorMatcher, get_matcher, norm_name
+
+logger = logging.getLogger("cobranza.history")
+
+SCHEMA_VERSION = 1
+BUSY_TIMEOUT_MS = 10_000
+
+Totals = Tuple[Optional[float], Optional[float], Optional[float]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    as_of         TEXT PRIMARY KEY,
+    recorded_at   TEXT NOT NULL,
+    source_name   TEXT,
+    source_sha256 TEXT,
+    master_sha256 TEXT,
+    vendors       INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vendor_totals (
+    vendor        TEXT NOT NULL,
+    as_of         TEXT NOT NULL,
+    source_vendor TEXT NOT NULL,
+    importe       REAL,
+    a_cuenta      REAL,
+    saldo         REAL,
+    PRIMARY KEY (vendor, as_of)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS vendor_totals_as_of ON vendor_totals (as_of, vendor);
+"""
+
+# dd-mm-yy / dd-mm-yyyy en nombres como "COBRANZA 24-01-26.XLS"
+_NAME_DATE_RE = re.compile(r"(?<!\d)(\d{1,2})[-_.](\d{1,2})[-_.](\d{2}|\d{4})(?!\d)")
+
+
+class HistoryError(ValueError):
+    """Parámetros de consulta o de registro inválidos (fechas)."""
+
+
+def history_enabled() -> bool:
+    return os.getenv("COBRANZA_HISTORY", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def history_db_path() -> Path:
+    env_path = os.getenv("COBRANZA_HISTORY_DB")
+    if env_path:
+        return Path(env_path)
+    if getattr(sys, "frozen", False):
+        # _MEIPASS es temporal: la base vive junto al ejecutable
+        return Path(sys.executable).resolve().parent / "history.sqlite3"
+    return app_path("data", "history.sqlite3")
+
+
+def _iso(value: Optional[str], field: str) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HistoryError(f"{field} debe ser una fecha YYYY-MM-DD: {value!r}")
+
+
+def date_from_filename(name: str) -> Optional[str]:
+    """'COBRANZA 24-01-26.XLS' -> '2026-01-24' (None si el nombre no trae fecha)."""
+    m = _NAME_DATE_RE.search(os.path.basename(name))
+    if not m:
+        return None
+    day, month, year = (int(g) for g in m.groups())
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class VendorRow:
+    vendor: str
+    as_of: str
+    source_vendor: str  # rótulo del origen normalizado, antes de aplicar alias
+    importe: Optional[float]
+    a_cuenta: Optional[float]
+    saldo: Optional[float]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "vendor": self.vendor,
+            "date": self.as_of,
+            "source_vendor": self.source_vendor,
+            "importe": self.importe,
+            "a_cuenta": self.a_cuenta,
+            "saldo": self.saldo,
+        }
+
+
+class VendorHistory:
+    """Acceso a la base del histórico; una conexión por operación (hilos y procesos)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._ready = False
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        self._ensure_schema()
+        with closing(sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)) as conn:
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            yield conn
+
+    def _ensure_schema(self) -> None:
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with closing(sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                conn.commit()
+            self._ready = True
+
+    # ------------------------------------------------------------------
+    def record(
+        self,
+        as_of: str,
+        vendor_map: Mapping[str, Totals],
+        *,
+        source_name: Optional[str] = None,
+        source_sha256: Optional[str] = None,
+        master_sha256: Optional[str] = None,
+        matcher: Optional[VendorMatcher] = None,
+    ) -> int:
+        """
+        Agrega los totales de un merge a la instantánea de ``as_of``: los
+        vendedores de ``vendor_map`` reemplazan sus filas de esa fecha y los
+        demás (otros orígenes del mismo día) se conservan. ``vendor_map``:
+        {vendedor: (importe, a_cuenta, saldo)} tal como sale de
+        ``vendor_totals_from_rows``. Devuelve los vendedores guardados.
+        """
+        as_of = _iso(as_of, "as_of")
+        if as_of is None:
+            raise HistoryError("Se requiere la fecha de la instantánea.")
+        matcher = matcher or get_matcher()
+        rows: Dict[str, Tuple[Any, ...]] = {}
+        for key, (v1, v2, v3) in vendor_map.items():
+            source_key = norm_name(key)
+            vendor = matcher.map_source(source_key)
+            # Si dos orígenes van al mismo destino gana el último, como en el merge
+            rows[vendor] = (vendor, as_of, source_key, v1, v2, v3)
+
+        started = time.perf_counter()
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO vendor_totals (vendor, as_of, source_vendor, importe, a_cuenta, saldo)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows.values(),
+            )
+            vendors = conn.execute("SELECT COUNT(*) FROM vendor_totals WHERE as_of = ?", (as_of,)).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots"
+                " (as_of, recorded_at, source_name, source_sha256, master_sha256, vendors)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    as_of,
+                    datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    source_name,
+                    source_sha256,
+                    master_sha256,
+                    vendors,
+                ),
+            )
+        metrics.incr("history.snapshots")
+        metrics.observe("history.record_ms", (time.perf_counter() - started) * 1000)
+        return len(rows)
+
+    def delete_snapshot(self, as_of: str) -> bool:
+        as_of = _iso(as_of, "as_of")
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM vendor_totals WHERE as_of = ?", (as_of,))
+            return conn.execute("DELETE FROM snapshots WHERE as_of = ?", (as_of,)).rowcount > 0
+
+    # ------------------------------------------------------------------
+    def snapshots(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        where, params = _date_filter("as_of", start, end)
+        sql = (
+            "SELECT as_of, recorded_at, source_name, source_sha256, master_sha256, vendors"
+            f" FROM snapshots{where} ORDER BY as_of"
+        )
+        with self._connect() as conn:
+            return [
+                {
+                    "date": r[0], "recorded_at": r[1], "source_name": r[2],
+                    "source_sha256": r[3], "master_sha256": r[4], "vendors": r[5],
+                }
+                for r in conn.execute(sql, params)
+            ]
+
+    def vendors(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Por vendedor: primera/última fecha, instantáneas y los totales de la última."""
+        where, params = _date_filter("as_of", start, end)
+        sql = (
+            "SELECT vendor, MIN(as_of), MAX(as_of), COUNT(*)"
+            f" FROM vendor_totals{where} GROUP BY vendor ORDER BY vendor"
+        )
+        with self._connect() as conn:
+            summary = [
+                {"vendor": r[0], "first_date": r[1], "last_date": r[2], "snapshots": r[3]}
+                for r in conn.execute(sql, params)
+            ]
+            for item in summary:
+                # Búsqueda puntual por clave primaria (vendor, as_of)
+                last = conn.execute(
+                    "SELECT importe, a_cuenta, saldo FROM vendor_totals WHERE vendor = ? AND as_of = ?",
+                    (item["vendor"], item["last_date"]),
+                ).fetchone()
+                item["last"] = {"importe": last[0], "a_cuenta": last[1], "saldo": last[2]}
+        return summary
+
+    def totals(
+        self,
+        vendors: Optional[Sequence[str]] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[VendorRow]:
+        """Filas de ``vendors`` (todos si se omite) entre ``start`` y ``end`` inclusive, por vendedor y fecha."""
+        where, params = _date_filter("as_of", start, end)
+        if vendors:
+            # Como al registrar: normalizado y con alias (también vale el nombre destino)
+            matcher = get_matcher()
+            keys = sorted(
+                {norm_name(v) for v in vendors if v and v.strip()}
+                | {matcher.map_source(norm_name(v)) for v in vendors if v and v.strip()}
+            )
+            marks = ", ".join("?" for _ in keys)
+            where = f"{where} AND vendor IN ({marks})" if where else f" WHERE vendor IN ({marks})"
+            params.extend(keys)
+        sql = (
+            "SELECT vendor, as_of, source_vendor, importe, a_cuenta, saldo"
+            f" FROM vendor_totals{where} ORDER BY vendor, as_of"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(max(0, int(limit)))
+        with self._connect() as conn:
+            return [VendorRow(*r) for r in conn.execute(sql, params)]
+
+
+def _date_filter(column: str, start: Optional[str], end: Optional[str]) -> Tuple[str, List[Any]]:
+    start = _iso(start, "start")
+    end = _iso(end, "end")
+    if start and end and start > end:
+        raise HistoryError("start no puede ser posterior a end.")
+    clauses: List[str] = []
+    params: List[Any] = []
+    if start:
+        clauses.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def series_by_vendor(rows: Iterable[VendorRow]) -> Dict[str, List[Dict[str, Any]]]:
+    """{vendedor: [{date, importe, a_cuenta, saldo}, ...]} (las filas ya vienen ordenadas)."""
+    series: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        series.setdefault(row.vendor, []).append(
+            {"date": row.as_of, "importe": row.importe, "a_cuenta": row.a_cuenta, "saldo": row.saldo}
+        )
+    return series
+
+
+_history: Optional[VendorHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_history() -> VendorHistory:
+    """Histórico compartido del proceso (se recrea si cambia COBRANZA_HISTORY_DB)."""
+    global _history
+    path = history_db_path()
+    with _history_lock:
+        if _history is None or _history.path != path:
+            _history = VendorHistory(path)
+        return _history
+
+
+def record_merge_totals(
+    as_of: Optional[str],
+    vendor_map: Mapping[str, Totals],
+    *,
+    source_path: Optional[str] = None,
+    source_name: Optional[str] = None,
+    master_path: Optional[str] = None,
+    matcher: Optional[VendorMatcher] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Registro desde el merge: nunca lanza (un fallo del histórico no debe
+    romper el merge). Sin ``as_of`` usa la fecha del día. Devuelve un resumen
+    para el reporte del trabajo, o None si el histórico está desactivado.
+    """
+    if not history_enabled() or not vendor_map:
+        return None
+    from .master_registry import sha256_file
+
+    as_of = as_of or date.today().isoformat()
+    try:
+        count = get_history().record(
+            as_of,
+            vendor_map,
+            source_name=source_name or (os.path.basename(source_path) if source_path else None),
+            source_sha256=sha256_file(Path(source_path)) if source_path else None,
+            master_sha256=sha256_file(Path(master_path)) if master_path else None,
+            matcher=matcher,
+        )
+    except Exception as exc:
+        metrics.incr("history.errors")
+        logger.warning("Could not record vendor history for %s: %s", as_of, exc)
+        return {"date": as_of, "error": str(exc)}
+    return {"date": as_of, "vendors": count}
+
+
+def import_source_file(
+    path: str,
+    as_of: Optional[str] = None,
+    *,
+    name: Optional[str] = None,
+    history: Optional[VendorHistory] = None,
+) -> Dict[str, Any]:
+    """
+    Carga al histórico un origen antiguo sin Excel: lee la hoja 1 con el
+    lector BIFF (como el preflight). La fecha es ``as_of`` o la del nombre
+    del archivo ("COBRANZA 24-01-26.XLS"). Lanza ``HistoryError`` si no hay
+    fecha y ``XlsReadError``/``OSError`` si el archivo no se puede leer.
+    """
+    # Import diferido: excel_copy importa este módulo
+    from .excel_copy import vendor_totals_from_rows
+    from .master_registry import sha256_file
+    from .row_iter import iter_rows
+    from .xls_reader import open_xls
+
+    name = name or os.path.basename(path)
+    as_of = _iso(as_of, "date") or date_from_filename(name)
+    if as_of is None:
+        raise HistoryError(f"No se pudo deducir la fecha de {name!r}; indíquela con --date.")
+    totals: Dict[str, Totals] = {}
+    with open_xls(path) as book:
+        if book.sheet_names:
+            first = book.stream_sheet(1)
+            totals = vendor_totals_from_rows(iter_rows(first), first.ncols)
+    if not totals:
+        raise HistoryError(f"{name}: no hay filas 'Saldo para ...' en la primera hoja.")
+    count = (history or get_history()).record(
+        as_of, totals, source_name=name, source_sha256=sha256_file(Path(path)),
+    )
+    return {"date": as_of, "vendors": count}
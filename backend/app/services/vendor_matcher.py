@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+vendor_matcher.py
+-----------------
+Emparejamiento de vendedores ("Saldo para <VENDEDOR>" -> fila de la hoja
+destino), compilado una sola vez por versión de la configuración de alias:
+
+- tablas de alias y destinos ya normalizadas (sin acentos, mayúsculas,
+  espacios colapsados),
+- índice de trigramas para emparejamiento tolerante opcional (acentos,
+  espacios de más, abreviaturas como "SURQ" -> "SURQUILLO") con umbral
+  configurable; con umbral 1.0 (por defecto) sólo hay coincidencia exacta,
+- registro de coincidencias difusas y vendedores sin destino.
+
+Configuración (JSON) en COBRANZA_ALIAS_FILE o ``app/data/vendor_aliases.json``::
+
+    {
+      "aliases": {"OFICINA (VES)": "OFICINA", ...},
+      "threshold": 0.85
+    }
+
+(también se acepta directamente el diccionario de alias). El archivo se
+recarga en caliente cuando cambia su fecha de modificación; sin archivo se
+usa ``DEFAULT_ALIAS_MAP``. COBRANZA_VENDOR_MATCH_THRESHOLD pisa el umbral.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("cobranza.vendors")
+
+# Alias de "Saldo para ..." -> cómo aparece el vendedor en col B de la pestaña destino
+DEFAULT_ALIAS_MAP = {
+    "OFICINA (VES)": "OFICINA",
+    "MANUEL CARRASCO": "MANUEL",
+    "PITER HUAYTA": "PITER",
+    "BEATRIZ ROJAS": "BEATRIZ",
+    "LEONEL MEZA": "LEONEL",
+    "CAÑETE - (MANUEL)": "CAÑETE",
+    "CIUDAD - (ROSA)": "CIUDAD",
+    "LURIN - (ROSA)": "LURIN",
+    "MANCHAY - (ROSA)": "MANCHAY",
+    "UNICACHI SUR - (ROSA)": "UNICACHI",
+    "SURQ/SURCO - (OSCAR)": "SURQ/SURCO",      # va a pestaña SURQUILLO
+    "SAN LUIS (OSCAR)": "SAN LUIS",
+    "CAQUETA (ROSA)": "CAQUETA",
+    "SURQUILLO (OSCAR)": "SURQUILLO",
+    "SURCO (OSCAR)": "SURCO",  # texto en col B
+    "NORTE - ROSA": "NORTE",
+    "RAUL ARROYO": "RAUL",
+}
+
+DEFAULT_THRESHOLD = 1.0          # 1.0 = sólo coincidencia exacta (nombres fijos del sistema)
+MIN_PREFIX_LEN = 3               # abreviatura mínima aceptada ("SURQ" -> "SURQUILLO")
+RELOAD_CHECK_SECONDS = 2.0       # frecuencia máxima de stat() del archivo de alias
+
+_TOKEN_SPLIT_RE = re.compile(r"[^A-Z0-9Ñ]+")
+
+
+@lru_cache(maxsize=4096)
+def norm_name(s: str) -> str:
+    """Normaliza: quita acentos, mayúsculas, colapsa espacios."""
+    t = unicodedata.normalize("NFD", s)
+    t = "".join(ch for ch in t if unicodedata.category(ch) != "Mn")
+    t = " ".join(t.split())
+    return t.upper()
+
+
+def _tokens(norm_text: str) -> Tuple[str, ...]:
+    return tuple(t for t in _TOKEN_SPLIT_RE.split(norm_text) if t)
+
+
+def _trigrams(norm_text: str) -> FrozenSet[str]:
+    compact = " ".join(_tokens(norm_text))
+    padded = f"  {compact} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _token_score(a: Tuple[str, ...], b: Tuple[str, ...]) -> float:
+    """Fracción de tokens emparejados (iguales o uno prefijo del otro)."""
+    if not a or not b:
+        return 0.0
+    remaining = list(b)
+    matched = 0
+    for tok in a:
+        for i, other in enumerate(remaining):
+            short, long_ = (tok, other) if len(tok) <= len(other) else (other, tok)
+            if short == long_ or (len(short) >= MIN_PREFIX_LEN and long_.startswith(short)):
+                matched += 1
+                del remaining[i]
+                break
+    return matched / max(len(a), len(b))
+
+
+def similarity(a_norm: str, b_norm: str) -> float:
+    """Puntaje 0..1 entre dos nombres ya normalizados."""
+    if a_norm == b_norm:
+        return 1.0
+    ta, tb = _tokens(a_norm), _tokens(b_norm)
+    if ta == tb:
+        return 1.0  # sólo difieren en puntuación/espacios
+    ga, gb = _trigrams(a_norm), _trigrams(b_norm)
+    dice = 2 * len(ga & gb) / (len(ga) + len(gb)) if ga and gb else 0.0
+    return max(dice, _token_score(ta, tb))
+
+
+class TargetIndex:
+    """Claves destino de un trabajo con índice invertido de trigramas."""
+
+    def __init__(self, keys: Iterable[str], threshold: float):
+        self.keys: Tuple[str, ...] = tuple(dict.fromkeys(keys))
+        self.exact: Set[str] = set(self.keys)
+        self.threshold = threshold
+        self._postings: Dict[str, List[int]] = {}
+        self._prefixes: Dict[str, List[int]] = {}
+        self._memo: Dict[str, Optional[Tuple[str, float]]] = {}
+        if threshold < 1.0:
+            for i, key in enumerate(self.keys):
+                for gram in _trigrams(key):
+                    self._postings.setdefault(gram, []).append(i)
+                for tok in _tokens(key):
+                    self._prefixes.setdefault(tok[:MIN_PREFIX_LEN], []).append(i)
+
+    def match(self, cell_norm: str) -> Optional[Tuple[str, float]]:
+        """(clave, puntaje) de la mejor coincidencia >= umbral, o None."""
+        if cell_norm in self.exact:
+            return cell_norm, 1.0
+        if self.threshold >= 1.0 or not cell_norm:
+            return None
+        if cell_norm in self._memo:
+            return self._memo[cell_norm]
+
+        candidates: Set[int] = set()
+        for gram in _trigrams(cell_norm):
+            candidates.update(self._postings.get(gram, ()))
+        # Abreviaturas cortas comparten pocos trigramas: candidatos también por prefijo de token
+        for tok in _tokens(cell_norm):
+            candidates.update(self._prefixes.get(tok[:MIN_PREFIX_LEN], ()))
+
+        best: Optional[Tuple[str, float]] = None
+        for i in candidates:
+            score = similarity(cell_norm, self.keys[i])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (self.keys[i], score)
+        self._memo[cell_norm] = best
+        return best
+
+
+class VendorMatcher:
+    """Tablas compiladas para una versión concreta de la configuración de alias."""
+
+    def __init__(self, aliases: Dict[str, str], threshold: float = DEFAULT_THRESHOLD, version: str = "builtin"):
+        self.version = version
+        self.threshold = max(0.0, min(1.0, float(threshold)))
+        self.alias_norm: Dict[str, str] = {norm_name(k): norm_name(v) for k, v in aliases.items()}
+        self._indexes: Dict[FrozenSet[str], TargetIndex] = {}
+        self._lock = threading.Lock()
+
+    def map_source(self, vendor_key_norm: str) -> str:
+        """Alias de origen -> nombre normalizado en la hoja destino."""
+        return self.alias_norm.get(vendor_key_norm, vendor_key_norm)
+
+    def index_for(self, keys: Iterable[str]) -> TargetIndex:
+        """Índice de destinos (reutilizado mientras el conjunto de vendedores no cambie)."""
+        frozen = frozenset(keys)
+        with self._lock:
+            index = self._indexes.get(frozen)
+            if index is None:
+                if len(self._indexes) >= 32:
+                    self._indexes.clear()
+                index = self._indexes[frozen] = TargetIndex(sorted(frozen), self.threshold)
+            return index
+
+
+# -------------------------------------------------------------------
+# Carga / recarga en caliente
+# -------------------------------------------------------------------
+def alias_file_path() -> Path:
+    env_path = os.getenv("COBRANZA_ALIAS_FILE")
+    if env_path:
+        return Path(env_path)
+    return Path(__file__).resolve().parent.parent / "data" / "vendor_aliases.json"
+
+
+def _threshold_override() -> Optional[float]:
+    raw = os.getenv("COBRANZA_VENDOR_MATCH_THRESHOLD")
+    if not raw:
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def _load(path: Path, version: str) -> VendorMatcher:
+    aliases: Dict[str, str] = DEFAULT_ALIAS_MAP
+    threshold = DEFAULT_THRESHOLD
+    if version != "builtin":
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if isinstance(data, dict) and isinstance(data.get("aliases"), dict):
+                aliases = {str(k): str(v) for k, v in data["aliases"].items()}
+                threshold = float(data.get("threshold", DEFAULT_THRESHOLD))
+            elif isinstance(data, dict):
+                aliases = {str(k): str(v) for k, v in data.items()}
+            else:
+                raise ValueError("se esperaba un objeto JSON")
+            logger.info("Vendor aliases loaded from %s (%d entries)", path, len(aliases))
+        except Exception as exc:
+            logger.warning("Invalid vendor alias file %s, using built-in aliases: %s", path, exc)
+            aliases, threshold = DEFAULT_ALIAS_MAP, DEFAULT_THRESHOLD
+    override = _threshold_override()
+    if override is not None:
+        threshold = override
+    return VendorMatcher(aliases, threshold=threshold, version=version)
+
+
+_cache_lock = threading.Lock()
+_cached: Optional[VendorMatcher] = None
+_cached_key: Optional[Tuple[str, str, Optional[float]]] = None
+_last_check = 0.0
+
+
+def _version_of(path: Path) -> str:
+    try:
+        st = path.stat()
+    except OSError:
+        return "builtin"
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def get_matcher(force_check: bool = False) -> VendorMatcher:
+    """Matcher compilado vigente; se recompila si el archivo de alias cambió."""
+    global _cached, _cached_key, _last_check
+    now = time.monotonic()
+    with _cache_lock:
+        if _cached is not None and not force_check and now - _last_check < RELOAD_CHECK_SECONDS:
+            return _cached
+        _last_check = now
+        path = alias_file_path()
+        key = (str(path), _version_of(path), _threshold_override())
+        if _cached is None or key != _cached_key:
+            _cached = _load(path, key[1])
+            _cached_key = key
+        return _cached
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+workbook_index.py
+-----------------
+Índice de hojas de un libro abierto, construido una sola vez:
+- handles COM de cada hoja por nombre normalizado y por posición,
+- límites del UsedRange (una sola llamada a ``Address`` por hoja, bajo
+  demanda y cacheados hasta ``invalidate``).
+
+Lo comparten la etapa de merge (hojas destino de vendedores, títulos) y
+la exportación a PDF (hojas completas, hoja base, bloques), de modo que
+buscar una hoja es un acceso a diccionario y no un recorrido de
+``Worksheets(i)`` normalizando nombres en cada consulta.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .vendor_matcher import norm_name
+
+Bounds = Tuple[int, int, int, int]  # (row_start, col_start, row_end, col_end)
+
+_A1_CELL_RE = re.compile(r"\$?([A-Z]+)\$?(\d+)")
+
+
+def col_to_index(col: str) -> int:
+    """Convierte letras de columna (por ej. 'AA') a índice numérico (1-based)."""
+    value = 0
+    for ch in col.strip().upper():
+        if not ch.isalpha():
+            break
+        value = value * 26 + (ord(ch) - 64)
+    return value
+
+
+def parse_address_bounds(address: str) -> Optional[Bounds]:
+    """'$A$1:$H$200' -> (1, 1, 200, 8); '$B$3' -> (3, 2, 3, 2)."""
+    matches = _A1_CELL_RE.findall(address or "")
+    if not matches:
+        return None
+    (c1, r1), (c2, r2) = matches[0], matches[-1]
+    return int(r1), col_to_index(c1), int(r2), col_to_index(c2)
+
+
+@dataclass
+class SheetEntry:
+    position: int
+    name: str
+    name_norm: str
+    ws: Any
+    bounds: Optional[Bounds] = None
+
+
+class WorkbookIndex:
+    def __init__(self, wb):
+        self.wb = wb
+        self._entries: List[SheetEntry] = []
+        self._by_name: Dict[str, SheetEntry] = {}
+        self._by_norm: Dict[str, SheetEntry] = {}
+        # Un recorrido: una lectura de Name por hoja
+        for position, ws in enumerate(wb.Worksheets, start=1):
+            name = str(ws.Name)
+            entry = SheetEntry(position=position, name=name, name_norm=norm_name(name), ws=ws)
+            self._entries.append(entry)
+            self._by_name[name] = entry
+            self._by_norm.setdefault(entry.name_norm, entry)
+
+    def __iter__(self) -> Iterator[SheetEntry]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entry(self, name: str) -> Optional[SheetEntry]:
+        hit = self._by_name.get(name)
+        return hit if hit is not None else self._by_norm.get(norm_name(name))
+
+    def get(self, name: str):
+        """Handle COM de la hoja (nombre sin distinguir mayúsculas/acentos/espacios) o None."""
+        entry = self.entry(name)
+        return entry.ws if entry is not None else None
+
+    def at(self, position: int) -> SheetEntry:
+        """Hoja por posición 1-based (como ``Worksheets(i)``)."""
+        return self._entries[position - 1]
+
+    def used_bounds(self, entry: SheetEntry) -> Bounds:
+        if entry.bounds is None:
+            parsed = parse_address_bounds(str(entry.ws.UsedRange.Address))
+            entry.bounds = parsed if parsed is not None else (1, 1, 0, 0)
+        return entry.bounds
+
+    def invalidate(self, entry: Optional[SheetEntry] = None) -> None:
+        """Descarta límites cacheados tras modificar la hoja (o todas)."""
+        for e in (entry,) if entry is not None else self._entries:
+            e.bounds = None
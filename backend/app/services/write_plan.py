@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+write_plan.py
+-------------
+Plan de escritura de totales por vendedor, precalculado por maestro.
+
+El merge escribe Importe / A cuenta en la fila cuya columna B nombra al
+vendedor (hojas SUR → NORTE → SURQUILLO → resto). Recorrer esa columna celda
+a celda por COM en cada merge es lo más lento de la etapa, y el maestro casi
+nunca cambia: el plan guarda las coordenadas (hoja, fila, texto de col B) y
+se cachea por hash SHA-256 del contenido del maestro.
+
+Origen del plan: los metadatos del registro de maestros si ese contenido
+está registrado, o si no una lectura BIFF (``xls_reader``) sin Excel. Si el
+maestro no se puede leer sin Excel, no hay plan y el merge recorre la hoja
+como antes.
+
+COBRANZA_WRITE_PLAN=0 desactiva el plan (siempre se recorre la hoja).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .. import metrics
+from .xls_reader import XlsReadError, open_xls
+
+logger = logging.getLogger("cobranza.excel")
+
+PLAN_CACHE_SIZE = 8
+
+
+@dataclass(frozen=True)
+class PlanEntry:
+    sheet: str
+    row: int
+    name: str  # texto de la columna B tal cual
+
+
+@dataclass(frozen=True)
+class WritePlan:
+    sha256: str
+    entries: Tuple[PlanEntry, ...]
+    source: str  # registry | biff
+    build_ms: float
+
+
+_cache: "OrderedDict[str, WritePlan]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def write_plan_enabled() -> bool:
+    return os.getenv("COBRANZA_WRITE_PLAN", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _build(master_path: str, sha: str) -> Optional[WritePlan]:
+    # Import diferido: master_registry importa constantes de excel_copy
+    from .master_registry import get_registry, vendor_target_rows
+
+    started = time.perf_counter()
+    rows = None
+    source = "registry"
+    meta = get_registry().metadata_for_sha(sha)
+    if meta is not None:
+        rows = meta.get("targets")
+    if rows is None:
+        source = "biff"
+        try:
+            with open_xls(master_path) as book:
+                rows = vendor_target_rows(book)
+        except (XlsReadError, OSError, ValueError) as exc:
+            logger.info("No write plan for %s: %s", os.path.basename(master_path), exc)
+            return None
+    entries = tuple(PlanEntry(t["sheet"], int(t["row"]), t["name"]) for t in rows)
+    build_ms = round((time.perf_counter() - started) * 1000, 3)
+    metrics.observe("write_plan.build_ms", build_ms)
+    return WritePlan(sha256=sha, entries=entries, source=source, build_ms=build_ms)
+
+
+def get_write_plan(master_path: str) -> Tuple[Optional[WritePlan], bool]:
+    """(plan, hit_de_cache) del maestro; plan None si no se pudo construir."""
+    if not write_plan_enabled():
+        return None, False
+    from .master_registry import sha256_file
+
+    sha = sha256_file(Path(master_path))
+    with _cache_lock:
+        plan = _cache.get(sha)
+        if plan is not None:
+            _cache.move_to_end(sha)
+    if plan is not None:
+        metrics.incr("write_plan.hit")
+        return plan, True
+
+    metrics.incr("write_plan.miss")
+    plan = _build(master_path, sha)
+    if plan is None:
+        metrics.incr("write_plan.unavailable")
+        return None, False
+    with _cache_lock:
+        _cache[sha] = plan
+        while len(_cache) > PLAN_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return plan, False
+
+
+def clear_write_plans() -> None:
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,752 @@
+# -*- coding: utf-8 -*-
+"""
+xls_reader.py
+-------------
+Lector mínimo de .xls (OLE2 / BIFF8) en Python puro, sin COM ni Excel.
+
+Sólo lee lo que necesitan las validaciones previas: nombres de hojas,
+valores de celdas (texto, números, booleanos y resultados de fórmulas) y el
+texto de los cuadros de texto (registros TXO), sin su posición.
+No interpreta formatos ni fechas (las fechas quedan como número de serie).
+
+Uso::
+
+    book = read_xls("COBRANZA.XLS")
+    ws = book.sheet(1)                  # por posición (1-based) o nombre
+    ws.value(8, 1)                      # fila/columna 1-based, como Cells(r, c)
+    for r, row in ws.iter_rows(): ...
+
+Archivos grandes (consolidados de 30+ MB): ``open_xls`` mapea el archivo en
+memoria (``mmap``) y recorre la FAT sin copiar los sectores; cada hoja se
+interpreta sólo cuando se pide y ``iter_cells`` la recorre sin guardarla::
+
+    with open_xls("CONSOLIDADO.XLS") as book:
+        ws = book.sheet(1)              # sólo esta hoja queda en memoria
+        for r, c, value in book.iter_cells("SUR"): ...
+        stream = book.stream_sheet("SUR")   # filas por bloques (ver row_iter)
+
+La memoria queda acotada por las hojas pedidas y la tabla de cadenas (SST).
+
+Tolerante a archivos generados por otros sistemas (tamaño no múltiplo del
+sector, FAT corta o mini stream vacío), como los que exporta el ERP. Un
+archivo truncado o dañado (registros más cortos de lo que declaran, o
+celdas fuera de los límites de BIFF8: 65536 filas x 256 columnas) lanza
+``XlsReadError``, nunca ``struct.error``/``IndexError``.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+OLE_SIGNATURE = b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1"
+
+# Identificadores de sector especiales (FAT)
+_ENDOFCHAIN = 0xFFFFFFFE
+_FREESECT = 0xFFFFFFFF
+_MAX_REGULAR_SID = 0xFFFFFFFA
+
+# Registros BIFF
+REC_BOF = 0x0809
+REC_EOF = 0x000A
+REC_BOUNDSHEET = 0x0085
+REC_SST = 0x00FC
+REC_CONTINUE = 0x003C
+REC_DIMENSION = 0x0200
+REC_NUMBER = 0x0203
+REC_LABEL = 0x0204
+REC_BOOLERR = 0x0205
+REC_STRING = 0x0207
+REC_RK = 0x027E
+REC_MULRK = 0x00BD
+REC_LABELSST = 0x00FD
+REC_FORMULA = 0x0006
+REC_RSTRING = 0x00D6
+REC_TXO = 0x01B6
+
+BIFF8_VERSION = 0x0600
+BIFF8_MAX_ROWS = 65536
+BIFF8_MAX_COLS = 256
+
+# Registros de celda: empiezan con fila y columna (2 bytes cada una)
+_CELL_RECORDS = frozenset(
+    {REC_LABELSST, REC_NUMBER, REC_RK, REC_MULRK, REC_LABEL, REC_RSTRING, REC_BOOLERR, REC_FORMULA}
+)
+
+CellValue = Union[str, float, bool, None]
+
+
+class XlsReadError(Exception):
+    """El archivo no es un .xls BIFF8 legible."""
+
+
+# Lo que lanza la decodificación de un registro más corto de lo esperado
+_DECODE_ERRORS = (struct.error, IndexError)
+
+
+def _damaged(what: str, pos: int) -> XlsReadError:
+    return XlsReadError(f"Archivo dañado o truncado ({what} en la posición {pos}).")
+
+
+# -------------------------------------------------------------------
+# OLE2 (Compound File Binary)
+# -------------------------------------------------------------------
+class _BytesStream:
+    """Stream ya en memoria (mini stream o ``bytes`` recibidos)."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.size = len(data)
+
+    def read(self, pos: int, n: int) -> bytes:
+        return self.data[pos:pos + n]
+
+
+class _SectorStream:
+    """
+    Stream sobre los sectores del archivo (``bytes`` o ``mmap``) sin unirlos:
+    la cadena de la FAT se agrupa en tramos contiguos y cada lectura copia
+    sólo el rango pedido.
+    """
+
+    def __init__(self, data, sector_size: int, sids: List[int], size: int):
+        self.data = data
+        self.extents: List[Tuple[int, int, int]] = []  # (pos lógica, offset en archivo, largo)
+        logical = 0
+        for sid in sids:
+            offset = (sid + 1) * sector_size
+            if self.extents:
+                lstart, fstart, length = self.extents[-1]
+                if fstart + length == offset:
+                    self.extents[-1] = (lstart, fstart, length + sector_size)
+                    logical += sector_size
+                    continue
+            self.extents.append((logical, offset, sector_size))
+            logical += sector_size
+        self.size = min(size, logical)
+        self._starts = [e[0] for e in self.extents]
+
+    def read(self, pos: int, n: int) -> bytes:
+        n = min(n, self.size - pos)
+        if n <= 0:
+            return b""
+        i = bisect_right(self._starts, pos) - 1
+        parts: List[bytes] = []
+        while n > 0 and i < len(self.extents):
+            lstart, fstart, length = self.extents[i]
+            off = pos - lstart
+            take = min(n, length - off)
+            piece = self.data[fstart + off:fstart + off + take]
+            if len(piece) < take:
+                piece += b"\0" * (take - len(piece))  # archivo truncado
+            parts.append(piece)
+            pos += take
+            n -= take
+            i += 1
+        return parts[0] if len(parts) == 1 else b"".join(parts)
+
+
+class _OleFile:
+    def __init__(self, data):
+        """``data``: contenido del archivo como ``bytes`` o ``mmap`` (sólo lectura)."""
+        if len(data) < 512 or data[:8] != OLE_SIGNATURE:
+            raise XlsReadError("No es un archivo OLE2 (.xls de Excel 97-2003).")
+        self.data = data
+        sector_shift, mini_shift = struct.unpack_from("<HH", data, 0x1E)
+        if sector_shift not in (9, 12) or mini_shift != 6:
+            raise _damaged("cabecera OLE2", 0x1E)
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_shift
+        (num_fat, first_dir, _sig, self.mini_cutoff, first_minifat, num_minifat,
+         first_difat, num_difat) = struct.unpack_from("<iIIIIiIi", data, 0x2C)
+        try:
+            self.fat = self._read_fat(num_fat, first_difat, num_difat)
+            self.entries = self._read_directory(first_dir)
+        except _DECODE_ERRORS as exc:
+            raise _damaged("directorio OLE2", 0) from exc
+        self._first_minifat = first_minifat if num_minifat > 0 else _ENDOFCHAIN
+        self._minifat: Optional[List[int]] = None
+        self._ministream: Optional[bytes] = None
+
+    def _sector(self, sid: int) -> bytes:
+        start = (sid + 1) * self.sector_size
+        chunk = self.data[start:start + self.sector_size]
+        if len(chunk) < self.sector_size:
+            chunk = chunk + b"\0" * (self.sector_size - len(chunk))  # archivo truncado
+        return chunk
+
+    def _read_fat(self, num_fat: int, first_difat: int, num_difat: int) -> List[int]:
+        difat = list(struct.unpack_from("<109I", self.data, 0x4C))
+        sid = first_difat
+        per_sector = self.sector_size // 4 - 1
+        seen = 0
+        while sid < _MAX_REGULAR_SID and seen < max(num_difat, 0) + 1:
+            sector = self._sector(sid)
+            values = struct.unpack(f"<{per_sector + 1}I", sector)
+            difat.extend(values[:per_sector])
+            sid = values[per_sector]
+            seen += 1
+        fat_sids = [s for s in difat if s < _MAX_REGULAR_SID][: max(num_fat, 0) or None]
+        fat: List[int] = []
+        for s in fat_sids:
+            fat.extend(struct.unpack(f"<{self.sector_size // 4}I", self._sector(s)))
+        return fat
+
+    def _chain(self, start: int, table: List[int]) -> Iterator[int]:
+        sid = start
+        seen = set()
+        while sid < _MAX_REGULAR_SID and sid < len(table) and sid not in seen:
+            seen.add(sid)
+            yield sid
+            sid = table[sid]
+
+    def _chain_bytes(self, start: int) -> bytes:
+        return b"".join(self._sector(sid) for sid in self._chain(start, self.fat))
+
+    def _read_directory(self, first_dir: int) -> List[Dict[str, Any]]:
+        raw = self._chain_bytes(first_dir)
+        entries = []
+        for off in range(0, len(raw) - 127, 128):
+            name_len = struct.unpack_from("<H", raw, off + 0x40)[0]
+            name = raw[off:off + max(0, name_len - 2)].decode("utf-16-le", errors="replace")
+            etype = raw[off + 0x42]
+            start, size = struct.unpack_from("<II", raw, off + 0x74)
+            entries.append({"name": name, "type": etype, "start": start, "size": size})
+        return entries
+
+    def _mini(self) -> Tuple[List[int], bytes]:
+        """Mini FAT y mini stream (sólo si algún stream pedido es pequeño)."""
+        if self._minifat is None:
+            self._minifat, self._ministream = [], b""
+            root = self.entries[0] if self.entries else None
+            if root is not None and self._first_minifat < _MAX_REGULAR_SID:
+                raw = self._chain_bytes(self._first_minifat)
+                self._minifat = list(struct.unpack(f"<{len(raw) // 4}I", raw[: len(raw) // 4 * 4]))
+                if root["start"] < _MAX_REGULAR_SID:
+                    self._ministream = self._chain_bytes(root["start"])[: root["size"]]
+        return self._minifat, self._ministream or b""
+
+    def open_stream(self, *names: str) -> Union[_BytesStream, _SectorStream]:
+        wanted = {n.lower() for n in names}
+        for entry in self.entries:
+            if entry["type"] == 2 and entry["name"].lower() in wanted:
+                size = entry["size"]
+                if size < self.mini_cutoff:
+                    minifat, ministream = self._mini()
+                    if ministream:
+                        out = bytearray()
+                        for sid in self._chain(entry["start"], minifat):
+                            off = sid * self.mini_sector_size
+                            out += ministream[off:off + self.mini_sector_size]
+                        return _BytesStream(bytes(out[:size]))
+                sids = list(self._chain(entry["start"], self.fat))
+                return _SectorStream(self.data, self.sector_size, sids, size)
+        raise XlsReadError("El archivo no contiene un libro de Excel (stream 'Workbook').")
+
+    def stream(self, *names: str) -> bytes:
+        """Stream completo en memoria."""
+        st = self.open_stream(*names)
+        return st.read(0, st.size)
+
+
+# -------------------------------------------------------------------
+# BIFF8
+# -------------------------------------------------------------------
+_READ_WINDOW = 1 << 16
+
+Stream = Union[_BytesStream, _SectorStream]
+
+
+def _iter_records(stream: Stream, pos: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """(posición, tipo, datos) de cada registro a partir de ``pos``, leyendo por ventanas."""
+    end = stream.size
+    buf = b""
+    buf_start = pos
+    while pos + 4 <= end:
+        off = pos - buf_start
+        if off + 4 > len(buf):
+            buf, buf_start, off = stream.read(pos, _READ_WINDOW), pos, 0
+            if len(buf) < 4:
+                break
+        rtype, length = struct.unpack_from("<HH", buf, off)
+        if off + 4 + length > len(buf):
+            buf, buf_start, off = stream.read(pos, max(_READ_WINDOW, 4 + length)), pos, 0
+        yield pos, rtype, buf[off + 4:off + 4 + length]
+        pos += 4 + length
+
+
+def _rk_value(rk: int) -> float:
+    if rk & 0x02:
+        value = float(rk >> 2 if not rk & 0x80000000 else (rk >> 2) - (1 << 30))
+    else:
+        value = struct.unpack("<d", struct.pack("<Q", (rk & 0xFFFFFFFC) << 32))[0]
+    return value / 100 if rk & 0x01 else value
+
+
+def _short_string(data: bytes, pos: int, len_size: int = 1) -> Tuple[str, int]:
+    """Cadena BIFF8 sin formato (longitud de 1 o 2 bytes + flags). Devuelve (texto, nueva pos)."""
+    if len_size == 1:
+        cch = data[pos]
+    else:
+        cch = struct.unpack_from("<H", data, pos)[0]
+    pos += len_size
+    flags = data[pos]
+    pos += 1
+    if flags & 0x08:
+        pos += 2  # cRun
+    if flags & 0x04:
+        pos += 4  # cbExtRst
+    if flags & 0x01:
+        text = data[pos:pos + 2 * cch].decode("utf-16-le", errors="replace")
+        pos += 2 * cch
+    else:
+        text = data[pos:pos + cch].decode("latin-1")
+        pos += cch
+    return text, pos
+
+
+class _ContinueReader:
+    """Lee datos repartidos entre un registro y sus CONTINUE (necesario para el SST)."""
+
+    def __init__(self, chunks: List[bytes]):
+        self.chunks = chunks
+        self.idx = 0
+        self.pos = 0
+
+    def _ensure(self) -> None:
+        while self.idx < len(self.chunks) and self.pos >= len(self.chunks[self.idx]):
+            self.idx += 1
+            self.pos = 0
+
+    def read(self, n: int) -> bytes:
+        out = bytearray()
+        while n > 0:
+            self._ensure()
+            if self.idx >= len(self.chunks):
+                break
+            chunk = self.chunks[self.idx]
+            take = min(n, len(chunk) - self.pos)
+            out += chunk[self.pos:self.pos + take]
+            self.pos += take
+            n -= take
+        return bytes(out)
+
+    def skip(self, n: int) -> None:
+        self.read(n)
+
+    def read_chars(self, cch: int, high_byte: bool) -> str:
+        """Caracteres de una cadena; en cada CONTINUE se repite el byte de flags."""
+        parts: List[str] = []
+        while cch > 0:
+            if self.idx < len(self.chunks) and self.pos >= len(self.chunks[self.idx]):
+                self.idx += 1
+                self.pos = 0
+                if self.idx >= len(self.chunks):
+                    break
+                high_byte = bool(self.chunks[self.idx][0] & 0x01)
+                self.pos = 1
+            if self.idx >= len(self.chunks):
+                break
+            chunk = self.chunks[self.idx]
+            width = 2 if high_byte else 1
+            avail = (len(chunk) - self.pos) // width
+            take = min(cch, avail)
+            raw = chunk[self.pos:self.pos + take * width]
+            parts.append(raw.decode("utf-16-le", errors="replace") if high_byte else raw.decode("latin-1"))
+            self.pos += take * width
+            cch -= take
+            if take == 0:
+                self.pos = len(chunk)  # byte suelto al final del registro
+        return "".join(parts)
+
+
+def _parse_sst(chunks: List[bytes]) -> List[str]:
+    try:
+        return _read_sst(_ContinueReader(chunks))
+    except _DECODE_ERRORS as exc:
+        raise _damaged("tabla de cadenas (SST)", 0) from exc
+
+
+def _read_sst(reader: _ContinueReader) -> List[str]:
+    header = reader.read(8)
+    if len(header) < 8:
+        return []
+    unique = struct.unpack_from("<I", header, 4)[0]
+    strings: List[str] = []
+    for _ in range(unique):
+        head = reader.read(3)
+        if len(head) < 3:
+            break
+        cch = struct.unpack_from("<H", head, 0)[0]
+        flags = head[2]
+        runs = struct.unpack("<H", reader.read(2))[0] if flags & 0x08 else 0
+        ext = struct.unpack("<i", reader.read(4))[0] if flags & 0x04 else 0
+        strings.append(reader.read_chars(cch, bool(flags & 0x01)))
+        if runs:
+            reader.skip(4 * runs)
+        if ext > 0:
+            reader.skip(ext)
+    return strings
+
+
+@dataclass
+class XlsSheet:
+    name: str
+    index: int                              # posición 1-based
+    cells: Dict[Tuple[int, int], CellValue] = field(default_factory=dict)
+    nrows: int = 0                          # última fila con datos (1-based)
+    ncols: int = 0                          # última columna con datos (1-based)
+    shapes: List[str] = field(default_factory=list)  # texto de cuadros de texto, en orden
+
+    def value(self, row: int, col: int) -> CellValue:
+        return self.cells.get((row, col))
+
+    def row_values(self, row: int, first_col: int = 1, last_col: Optional[int] = None) -> List[CellValue]:
+        last = self.ncols if last_col is None else last_col
+        return [self.cells.get((row, c)) for c in range(first_col, last + 1)]
+
+    def iter_rows(self, first_row: int = 1) -> Iterator[Tuple[int, List[CellValue]]]:
+        for r in range(first_row, self.nrows + 1):
+            yield r, self.row_values(r)
+
+
+@dataclass
+class XlsBook:
+    sheets: List[XlsSheet]
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return [s.name for s in self.sheets]
+
+    def sheet(self, key: Union[int, str]) -> XlsSheet:
+        if isinstance(key, int):
+            return self.sheets[key - 1]
+        for s in self.sheets:
+            if s.name == key:
+                return s
+        raise KeyError(key)
+
+
+def _set(sheet: XlsSheet, row0: int, col0: int, value: CellValue) -> None:
+    if value is None or value == "":
+        return
+    r, c = row0 + 1, col0 + 1
+    sheet.cells[(r, c)] = value
+    if r > sheet.nrows:
+        sheet.nrows = r
+    if c > sheet.ncols:
+        sheet.ncols = c
+
+
+def _txo_text(cch: int, chunks: List[bytes]) -> str:
+    """Texto de un TXO: va en los CONTINUE siguientes (byte de flags + caracteres)."""
+    if not cch or not chunks or not chunks[0]:
+        return ""
+    reader = _ContinueReader(chunks)
+    reader.pos = 1
+    return reader.read_chars(cch, bool(chunks[0][0] & 0x01))
+
+
+def _iter_sheet_cells(
+    stream: Stream,
+    offset: int,
+    sst: List[str],
+    shapes: Optional[List[str]] = None,
+) -> Iterator[Tuple[int, int, CellValue]]:
+    """(fila0, col0, valor) de cada celda de la hoja en ``offset``; textos de TXO a ``shapes``."""
+    pending_formula: Optional[Tuple[int, int]] = None
+    txo: Optional[Tuple[int, List[bytes]]] = None  # (cch, CONTINUE del TXO en curso)
+    for pos, rtype, rec in _iter_records(stream, offset):
+        try:
+            if txo is not None:
+                if rtype == REC_CONTINUE:
+                    txo[1].append(rec)
+                    continue
+                if shapes is not None:
+                    shapes.append(_txo_text(*txo))
+                txo = None
+            if rtype == REC_EOF:
+                break
+            if rtype in _CELL_RECORDS and rec[3]:
+                # Columna >= 256 (byte alto no nulo): la fila es de 16 bits y no puede pasarse
+                raise _damaged(f"celda fuera de rango en el registro 0x{rtype:04X}", pos)
+            if rtype == REC_TXO:
+                txo = (struct.unpack_from("<H", rec, 10)[0] if len(rec) >= 12 else 0, [])
+            elif rtype == REC_LABELSST:
+                row, col, _xf, idx = struct.unpack_from("<HHHI", rec)
+                yield row, col, sst[idx] if idx < len(sst) else None
+            elif rtype == REC_NUMBER:
+                row, col, _xf, value = struct.unpack_from("<HHHd", rec)
+                yield row, col, value
+            elif rtype == REC_RK:
+                row, col, _xf, rk = struct.unpack_from("<HHHI", rec)
+                yield row, col, _rk_value(rk)
+            elif rtype == REC_MULRK:
+                row, first_col = struct.unpack_from("<HH", rec)
+                count = (len(rec) - 6) // 6
+                if first_col + count > BIFF8_MAX_COLS:
+                    raise _damaged("celda fuera de rango en el registro MULRK", pos)
+                for i in range(count):
+                    _xf, rk = struct.unpack_from("<HI", rec, 4 + 6 * i)
+                    yield row, first_col + i, _rk_value(rk)
+            elif rtype in (REC_LABEL, REC_RSTRING):
+                row, col, _xf = struct.unpack_from("<HHH", rec)
+                text, _ = _short_string(rec, 6, len_size=2)
+                yield row, col, text
+            elif rtype == REC_BOOLERR:
+                row, col, _xf, val, is_err = struct.unpack_from("<HHHBB", rec)
+                if not is_err:
+                    yield row, col, bool(val)
+            elif rtype == REC_FORMULA:
+                row, col, _xf = struct.unpack_from("<HHH", rec)
+                result = rec[6:14]
+                if result[6:8] == b"\xFF\xFF":
+                    kind = result[0]
+                    if kind == 0:
+                        pending_formula = (row, col)  # el texto llega en el STRING siguiente
+                    elif kind == 1:
+                        yield row, col, bool(result[2])
+                else:
+                    yield row, col, struct.unpack("<d", result)[0]
+            elif rtype == REC_STRING and pending_formula is not None:
+                text, _ = _short_string(rec, 0, len_size=2)
+                yield pending_formula[0], pending_formula[1], text
+                pending_formula = None
+        except _DECODE_ERRORS as exc:
+            raise _damaged(f"registro 0x{rtype:04X}", pos) from exc
+
+
+def _parse_sheet(stream: Stream, offset: int, sheet: XlsSheet, sst: List[str]) -> None:
+    for row0, col0, value in _iter_sheet_cells(stream, offset, sst, sheet.shapes):
+        _set(sheet, row0, col0, value)
+
+
+def _parse_globals(stream: Stream) -> Tuple[List[Tuple[int, str]], List[str]]:
+    """Substream global: [(offset, nombre)] de las hojas de cálculo y la tabla SST."""
+    records = _iter_records(stream)
+    try:
+        _pos, rtype, rec = next(records)
+    except StopIteration:
+        raise XlsReadError("Libro vacío.") from None
+    if rtype != REC_BOF or len(rec) < 2 or struct.unpack_from("<H", rec)[0] != BIFF8_VERSION:
+        raise XlsReadError("Formato no soportado (se requiere Excel 97-2003 / BIFF8).")
+
+    bound: List[Tuple[int, str]] = []
+    sst_chunks: List[bytes] = []
+    last_type = None
+    for pos, rtype, rec in records:
+        if rtype == REC_EOF:
+            break
+        if rtype == REC_BOUNDSHEET:
+            try:
+                offset, _vis, kind = struct.unpack_from("<IBB", rec)
+                name, _ = _short_string(rec, 6)
+            except _DECODE_ERRORS as exc:
+                raise _damaged("registro BOUNDSHEET", pos) from exc
+            if kind == 0:  # hoja de cálculo (no gráficos / macros)
+                bound.append((offset, name))
+        elif rtype == REC_SST:
+            sst_chunks = [rec]
+        elif rtype == REC_CONTINUE and last_type in (REC_SST, REC_CONTINUE) and sst_chunks:
+            sst_chunks.append(rec)
+            continue
+        last_type = rtype
+    return bound, _parse_sst(sst_chunks) if sst_chunks else []
+
+
+class XlsFile:
+    """
+    Libro abierto de forma perezosa: índice de hojas y SST al abrir; cada hoja
+    se interpreta al pedirla (``sheet``) o se recorre sin guardarla
+    (``iter_cells``). Mismo acceso que ``XlsBook`` (``sheet_names``, ``sheet``,
+    ``sheets``). Con ``mmap`` hay que cerrarlo (``close`` o ``with``).
+    """
+
+    def __init__(self, stream: Stream, closer=None):
+        self._stream = stream
+        self._closer = closer
+        self._bound, self._sst = _parse_globals(stream)
+        self._loaded: Dict[int, XlsSheet] = {}
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return [name for _offset, name in self._bound]
+
+    def _position(self, key: Union[int, str]) -> int:
+        if isinstance(key, int):
+            if not 1 <= key <= len(self._bound):
+                raise IndexError(key)
+            return key
+        for i, (_offset, name) in enumerate(self._bound, start=1):
+            if name == key:
+                return i
+        raise KeyError(key)
+
+    def sheet(self, key: Union[int, str]) -> XlsSheet:
+        position = self._position(key)
+        sheet = self._loaded.get(position)
+        if sheet is None:
+            offset, name = self._bound[position - 1]
+            sheet = XlsSheet(name=name, index=position)
+            if offset < self._stream.size:
+                _parse_sheet(self._stream, offset, sheet, self._sst)
+            self._loaded[position] = sheet
+        return sheet
+
+    @property
+    def sheets(self) -> List[XlsSheet]:
+        """Todas las hojas (las interpreta todas)."""
+        return [self.sheet(i) for i in range(1, len(self._bound) + 1)]
+
+    def iter_cells(self, key: Union[int, str]) -> Iterator[Tuple[int, int, CellValue]]:
+        """(fila, columna, valor) 1-based de las celdas con dato, en orden de archivo."""
+        offset, _name = self._bound[self._position(key) - 1]
+        if offset >= self._stream.size:
+            return
+        for row0, col0, value in _iter_sheet_cells(self._stream, offset, self._sst):
+            if value is not None and value != "":
+                yield row0 + 1, col0 + 1, value
+
+    def stream_sheet(self, key: Union[int, str]) -> "XlsSheetStream":
+        """Hoja sin cargar, para recorrerla por filas con memoria constante."""
+        position = self._position(key)
+        return XlsSheetStream(self, position, self._bound[position - 1][1])
+
+    def close(self) -> None:
+        closer, self._closer = self._closer, None
+        self._stream = _BytesStream(b"")
+        if closer is not None:
+            closer()
+
+    def __enter__(self) -> "XlsFile":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class XlsSheetStream:
+    """
+    Hoja de un ``XlsFile`` abierto que se recorre desde el archivo en cada
+    pasada, sin guardar sus celdas. Una primera pasada calcula los límites
+    con datos (como ``XlsSheet.nrows/ncols``) y comprueba que las celdas
+    vengan ordenadas por fila (Excel las escribe así); si no, las filas se
+    sirven desde la hoja interpretada completa.
+    """
+
+    def __init__(self, book: XlsFile, index: int, name: str):
+        self.book = book
+        self.index = index
+        self.name = name
+        self._bounds: Optional[Tuple[int, int, bool]] = None
+
+    def iter_cells(self) -> Iterator[Tuple[int, int, CellValue]]:
+        return self.book.iter_cells(self.index)
+
+    def _scan(self) -> Tuple[int, int, bool]:
+        if self._bounds is None:
+            nrows = ncols = 0
+            ordered = True
+            for r, c, _value in self.iter_cells():
+                if r < nrows:
+                    ordered = False
+                nrows = max(nrows, r)
+                ncols = max(ncols, c)
+            self._bounds = (nrows, ncols, ordered)
+        return self._bounds
+
+    @property
+    def nrows(self) -> int:
+        return self._scan()[0]
+
+    @property
+    def ncols(self) -> int:
+        return self._scan()[1]
+
+    def iter_row_chunks(
+        self,
+        first_col: int,
+        last_col: int,
+        start: int,
+        end: int,
+        chunk: int,
+    ) -> Iterator[Tuple[int, List[Tuple[CellValue, ...]]]]:
+        """Bloques (primera fila, filas) de ``start`` a ``end`` con las columnas pedidas."""
+        if not self._scan()[2]:
+            sheet = self.book.sheet(self.index)
+            for first in range(start, end + 1, chunk):
+                last = min(end, first + chunk - 1)
+                yield first, [tuple(sheet.row_values(r, first_col, last_col)) for r in range(first, last + 1)]
+            return
+
+        width = last_col - first_col + 1
+        empty = (None,) * width
+        rows: List[Tuple[CellValue, ...]] = []
+        block_start = start
+        next_row = start             # próxima fila a emitir
+        current: Optional[List[CellValue]] = None
+        current_row = 0
+        for r, c, value in self.iter_cells():
+            if r > end:
+                break                # ordenadas: no hay más filas del rango
+            if r < start or c < first_col or c > last_col:
+                continue
+            if r != current_row:
+                if current is not None:
+                    rows.append(tuple(current))
+                    next_row = current_row + 1
+                while next_row < r:
+                    rows.append(empty)
+                    next_row += 1
+                current, current_row = [None] * width, r
+                while len(rows) >= chunk:
+                    yield block_start, rows[:chunk]
+                    rows = rows[chunk:]
+                    block_start += chunk
+            current[c - first_col] = value
+        if current is not None:
+            rows.append(tuple(current))
+            next_row = current_row + 1
+        while next_row <= end:
+            rows.append(empty)
+            next_row += 1
+        while rows:
+            yield block_start, rows[:chunk]
+            rows = rows[chunk:]
+            block_start += chunk
+
+
+def open_xls(path: Union[str, Path]) -> XlsFile:
+    """Abre el .xls con ``mmap`` (sólo lectura); usar con ``with``."""
+    fh = open(path, "rb")
+    try:
+        if os.fstat(fh.fileno()).st_size == 0:
+            raise XlsReadError("No es un archivo OLE2 (.xls de Excel 97-2003).")
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except BaseException:
+        fh.close()
+        raise
+
+    def closer() -> None:
+        mm.close()
+        fh.close()
+
+    try:
+        return XlsFile(_OleFile(mm).open_stream("Workbook", "Book"), closer)
+    except BaseException:
+        closer()
+        raise
+
+
+def parse_workbook(stream: bytes) -> XlsBook:
+    """Interpreta el stream 'Workbook' BIFF8."""
+    return XlsBook(sheets=XlsFile(_BytesStream(stream)).sheets)
+
+
+def read_xls(path: Union[str, Path]) -> XlsBook:
+    with open_xls(path) as book:
+        return XlsBook(sheets=book.sheets)
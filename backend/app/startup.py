@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+startup.py
+----------
+Diagnóstico y señalización del arranque:
+- marca hitos (import de la app, lifespan, socket listo) con tiempos relativos,
+- precalienta en segundo plano las dependencias pesadas (pywin32, pypdf),
+- genera un reporte estilo ``-X importtime`` bajo demanda,
+- expone eventos de "listo" para que los lanzadores no hagan polling HTTP.
+"""
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("cobranza.startup")
+
+PROCESS_T0 = time.perf_counter()
+
+# Módulos pesados que no se importan al cargar la app (se cargan al primer uso
+# o en el precalentamiento posterior al bind del socket).
+PREWARM_MODULES = (
+    "pythoncom",
+    "win32timezone",
+    "win32com.client",
+    "pypdf",
+)
+
+_milestones: Dict[str, float] = {}
+_prewarm: Dict[str, Dict[str, object]] = {}
+_state_lock = threading.Lock()
+_app_ready = threading.Event()
+_socket_ready = threading.Event()
+_importtime_cache: Dict[str, List[Dict[str, object]]] = {}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _elapsed_ms() -> float:
+    return round((time.perf_counter() - PROCESS_T0) * 1000, 2)
+
+
+def mark(name: str) -> None:
+    """Registra un hito de arranque (ms desde que se importó este módulo)."""
+    with _state_lock:
+        _milestones.setdefault(name, _elapsed_ms())
+
+
+def mark_app_ready() -> None:
+    """Llamado desde el lifespan de la app cuando ya puede atender peticiones."""
+    mark("lifespan_ready")
+    _app_ready.set()
+
+
+def mark_socket_ready() -> None:
+    mark("socket_ready")
+    _socket_ready.set()
+
+
+def wait_until_ready(timeout: float = 40.0) -> bool:
+    """Bloquea hasta que el servidor haya hecho bind y el lifespan terminó."""
+    return _socket_ready.wait(timeout) and _app_ready.wait(max(0.0, timeout))
+
+
+def is_ready() -> bool:
+    return _app_ready.is_set()
+
+
+def _prewarm_worker(modules: tuple[str, ...]) -> None:
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            ok, error = True, None
+        except Exception as exc:  # p.ej. pywin32 fuera de Windows
+            ok, error = False, str(exc)
+        with _state_lock:
+            _prewarm[name] = {
+                "ok": ok,
+                "ms": round((time.perf_counter() - started) * 1000, 2),
+                "error": error,
+            }
+    mark("prewarm_done")
+    logger.info("Prewarm finished: %s", {k: v["ms"] for k, v in _prewarm.items()})
+
+    if _env_bool("COBRANZA_IMPORTTIME", default=False):
+        for row in importtime_report(top=10):
+            logger.info("importtime cumulative_ms=%s self_ms=%s module=%s",
+                        row["cumulative_ms"], row["self_ms"], row["module"])
+
+
+def start_prewarm(modules: tuple[str, ...] = PREWARM_MODULES) -> Optional[threading.Thread]:
+    """Importa en un hilo de fondo las dependencias pesadas (desactivable con COBRANZA_PREWARM=0)."""
+    if not _env_bool("COBRANZA_PREWARM", default=True):
+        return None
+    th = threading.Thread(target=_prewarm_worker, args=(modules,), name="cobranza-prewarm", daemon=True)
+    th.start()
+    return th
+
+
+def _default_main_module() -> str:
+    return f"{__package__}.main" if __package__ else "app.main"
+
+
+def _import_root() -> str:
+    """Carpeta que debe estar en sys.path para importar el paquete de la app."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    for _ in (__package__ or "app").split("."):
+        root = os.path.dirname(root)
+    return root
+
+
+def importtime_report(module: Optional[str] = None, top: int = 25) -> List[Dict[str, object]]:
+    """
+    Ejecuta ``python -X importtime -c "import <module>"`` en un subproceso y
+    devuelve los ``top`` imports con mayor tiempo acumulado (en ms).
+    No disponible en el ejecutable congelado (PyInstaller).
+    """
+    if getattr(sys, "frozen", False):
+        return []
+    module = module or _default_main_module()
+    cache_key = f"{module}:{top}"
+    if cache_key in _importtime_cache:
+        return _importtime_cache[cache_key]
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [_import_root(), env.get("PYTHONPATH", "")]))
+    env["COBRANZA_PREWARM"] = "0"
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            timeout=120,
+            env=env,
+        )
+    except Exception as exc:
+        logger.warning("importtime report failed: %s", exc)
+        return []
+
+    rows: List[Dict[str, object]] = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, indent, name = m.groups()
+        rows.append({
+            "module": name,
+            "self_ms": round(int(self_us) / 1000, 2),
+            "cumulative_ms": round(int(cum_us) / 1000, 2),
+            "depth": len(indent) // 2,
+        })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)  # type: ignore[arg-type, return-value]
+    report = rows[:top]
+    _importtime_cache[cache_key] = report
+    return report
+
+
+def startup_payload(include_importtime: bool = False) -> Dict[str, object]:
+    with _state_lock:
+        payload: Dict[str, object] = {
+            "ready": _app_ready.is_set(),
+            "socket_ready": _socket_ready.is_set(),
+            "milestones_ms": dict(_milestones),
+            "prewarm": {k: dict(v) for k, v in _prewarm.items()},
+            "lazy_modules_loaded": [m for m in PREWARM_MODULES if m in sys.modules],
+        }
+    if include_importtime:
+        payload["importtime"] = importtime_report()
+    return payload
+
+
+def make_server(config):
+    """
+    Devuelve un ``uvicorn.Server`` que marca el socket como listo en cuanto
+    termina su arranque (bind + lifespan), sin necesidad de hacer polling.
+    """
+    import uvicorn
+
+    class _ReadyServer(uvicorn.Server):
+        async def startup(self, sockets=None) -> None:
+            await super().startup(sockets=sockets)
+            if not self.should_exit:
+                mark_socket_ready()
+
+    return _ReadyServer(config)
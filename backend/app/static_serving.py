@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+static_serving.py
+-----------------
+Servido del build del frontend (SPA) pensado para enlaces lentos:
+- precomprime (gzip y, si está instalado, brotli) los assets al arrancar,
+  reutilizando variantes ``.gz``/``.br`` generadas en el build si existen,
+- negocia ``Accept-Encoding``,
+- ``Cache-Control`` inmutable para assets con hash en el nombre y ETag fuerte
+  (hash del contenido) para el resto,
+- fallback SPA a ``index.html`` servido desde memoria.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+logger = logging.getLogger("cobranza.static")
+
+COMPRESSIBLE_EXT = {
+    ".html", ".htm", ".js", ".mjs", ".css", ".json", ".map", ".svg",
+    ".txt", ".xml", ".ico", ".ttf", ".otf", ".eot", ".webmanifest",
+}
+MIN_COMPRESS_BYTES = 1024
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Vite: assets/<nombre>-<hash8>.<ext> ; webpack (adminator): <hash hex>.<ext>
+_VITE_HASHED_RE = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+_HEX_HASHED_RE = re.compile(r"^[0-9a-f]{16,}\.[A-Za-z0-9]+$")
+
+
+def _brotli():
+    try:
+        import brotli  # type: ignore[import-not-found]
+
+        return brotli
+    except Exception:
+        return None
+
+
+def _is_hashed_asset(rel_path: str) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    if _HEX_HASHED_RE.match(name):
+        return True
+    return rel_path.startswith("assets/") and bool(_VITE_HASHED_RE.search(name))
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def _pick_encoding(header: str, available: Dict[str, object]) -> Optional[str]:
+    """Elige 'br' o 'gzip' según Accept-Encoding (prioriza brotli a igual q)."""
+    if not header or not available:
+        return None
+    accepted = _parse_accept_encoding(header)
+    best: Optional[str] = None
+    best_q = 0.0
+    for enc in ("br", "gzip"):
+        if enc not in available:
+            continue
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+@dataclass
+class _Asset:
+    path: str
+    stat_result: os.stat_result
+    etag: str
+    media_type: str
+    cache_control: str
+    variants: Dict[str, tuple[str, os.stat_result]] = field(default_factory=dict)
+
+
+class SPAStaticFiles(StaticFiles):
+    """
+    Variante de StaticFiles que hace fallback a index.html (SPA) ante 404.
+    Tras ``warm()`` sirve desde un índice en memoria con variantes
+    precomprimidas; antes de eso se comporta como StaticFiles normal.
+    """
+
+    def __init__(
+        self,
+        *args,
+        spa_index: str = "index.html",
+        cache_dir: Optional[str] = None,
+        **kwargs,
+    ):
+        self.spa_index = spa_index
+        self.cache_dir = cache_dir or os.getenv("COBRANZA_STATIC_CACHE_DIR") or os.path.join(
+            tempfile.gettempdir(), "cobranza_static_cache"
+        )
+        self._assets: Optional[Dict[str, _Asset]] = None
+        self._index_bodies: Dict[Optional[str], bytes] = {}
+        self._warm_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    # ---------------- índice / precompresión ----------------
+    def _variant_path(self, full_path: str, digest: str, enc: str, data: bytes) -> Optional[str]:
+        ext = "br" if enc == "br" else "gz"
+        sibling = f"{full_path}.{ext}"
+        if os.path.isfile(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(full_path):
+            return sibling  # generado en el build
+
+        target = os.path.join(self.cache_dir, f"{digest}.{ext}")
+        if os.path.isfile(target):
+            return target  # direccionado por contenido: reutilizable entre arranques
+        if enc == "br":
+            brotli = _brotli()
+            if brotli is None:
+                return None
+            payload = brotli.compress(data, quality=11)
+        else:
+            payload = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(payload) >= len(data):
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(payload)
+        os.replace(tmp, target)
+        return target
+
+    def _build_index(self) -> Dict[str, _Asset]:
+        assets: Dict[str, _Asset] = {}
+        if not self.directory:
+            return assets
+        root = os.path.abspath(str(self.directory))
+        for dirpath, _dirnames, filenames in os.walk(root):
+            for fname in filenames:
+                if fname.endswith((".gz", ".br")):
+                    continue
+                full_path = os.path.join(dirpath, fname)
+                rel = os.path.relpath(full_path, root).replace(os.sep, "/")
+                try:
+                    st = os.stat(full_path)
+                    with open(full_path, "rb") as fh:
+                        data = fh.read()
+                except OSError:
+                    continue
+                digest = hashlib.sha1(data).hexdigest()
+                media_type = mimetypes.guess_type(fname)[0] or "text/plain"
+                asset = _Asset(
+                    path=full_path,
+                    stat_result=st,
+                    etag=f'"{digest}"',
+                    media_type=media_type,
+                    cache_control=IMMUTABLE_CACHE if _is_hashed_asset(rel) else REVALIDATE_CACHE,
+                )
+                ext = os.path.splitext(fname)[1].lower()
+                if ext in COMPRESSIBLE_EXT and st.st_size >= MIN_COMPRESS_BYTES:
+                    for enc in ("br", "gzip"):
+                        try:
+                            vpath = self._variant_path(full_path, digest, enc, data)
+                        except OSError as exc:
+                            logger.warning("Precompression failed for %s (%s): %s", rel, enc, exc)
+                            vpath = None
+                        if vpath:
+                            asset.variants[enc] = (vpath, os.stat(vpath))
+                if rel == self.spa_index:
+                    self._index_bodies[None] = data
+                    for enc, (vpath, _st) in asset.variants.items():
+                        with open(vpath, "rb") as fh:
+                            self._index_bodies[enc] = fh.read()
+                assets[rel] = asset
+        return assets
+
+    def warm(self) -> None:
+        """Construye el índice y las variantes comprimidas (idempotente)."""
+        with self._warm_lock:
+            if self._assets is not None:
+                return
+            try:
+                assets = self._build_index()
+            except Exception as exc:
+                logger.warning("Static index build failed; serving without precompression: %s", exc)
+                return
+            self._assets = assets
+            logger.info(
+                "Static index ready: %d files, %d precompressed",
+                len(assets),
+                sum(1 for a in assets.values() if a.variants),
+            )
+
+    def warm_in_background(self) -> threading.Thread:
+        th = threading.Thread(target=self.warm, name="cobranza-static-warm", daemon=True)
+        th.start()
+        return th
+
+    # ---------------- respuestas ----------------
+    def _asset_response(self, asset: _Asset, scope) -> Response:
+        request_headers = Headers(scope=scope)
+        enc = _pick_encoding(request_headers.get("accept-encoding", ""), asset.variants)
+        headers = {"cache-control": asset.cache_control}
+        if asset.variants:
+            headers["vary"] = "Accept-Encoding"
+        if enc:
+            path, st = asset.variants[enc]
+            headers["content-encoding"] = enc
+            headers["etag"] = f'{asset.etag[:-1]}-{enc}"'
+        else:
+            path, st = asset.path, asset.stat_result
+            headers["etag"] = asset.etag
+
+        response = FileResponse(path, stat_result=st, headers=headers, media_type=asset.media_type)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _spa_fallback(self, scope) -> Optional[Response]:
+        assert self._assets is not None
+        index = self._assets.get(self.spa_index)
+        if index is None or None not in self._index_bodies:
+            return None
+        request_headers = Headers(scope=scope)
+        enc = _pick_encoding(request_headers.get("accept-encoding", ""), index.variants)
+        headers = {"cache-control": REVALIDATE_CACHE, "vary": "Accept-Encoding"}
+        if enc and enc in self._index_bodies:
+            headers["content-encoding"] = enc
+            headers["etag"] = f'{index.etag[:-1]}-{enc}"'
+            body = self._index_bodies[enc]
+        else:
+            headers["etag"] = index.etag
+            body = self._index_bodies[None]
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+        return Response(content=body, media_type="text/html", headers=headers)
+
+    async def get_response(self, path: str, scope):
+        if self._assets is None or scope["method"] not in ("GET", "HEAD"):
+            try:
+                return await super().get_response(path, scope)
+            except HTTPException as exc:
+                if exc.status_code == 404 and scope["method"] in ("GET", "HEAD"):
+                    try:
+                        return await super().get_response(self.spa_index, scope)
+                    except HTTPException:
+                        pass
+                raise
+
+        rel = path.replace(os.sep, "/")
+        if rel in ("", "."):
+            rel = self.spa_index
+        asset = self._assets.get(rel)
+        if asset is None and self.html:
+            asset = self._assets.get(f"{rel.rstrip('/')}/index.html")
+            if asset is not None and not scope["path"].endswith("/"):
+                # Directorios: mismo redirect que StaticFiles
+                return await super().get_response(path, scope)
+        if asset is not None:
+            return self._asset_response(asset, scope)
+
+        fallback = self._spa_fallback(scope)
+        if fallback is not None:
+            return fallback
+        return await super().get_response(path, scope)
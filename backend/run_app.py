@@ -1,20 +1,16 @@
 # run_app.py
+import logging
 import os
 import sys
-import time
 import threading
 import socket
 import webbrowser
-import traceback
 from pathlib import Path
 
-LOG = Path("CobranzaApp_error.log")
+from app.logging_setup import configure_logging
 
-def _log(msg: str) -> None:
-    try:
-        LOG.write_text((LOG.read_text(encoding="utf-8") if LOG.exists() else "") + msg + "\n", encoding="utf-8")
-    except Exception:
-        pass
+configure_logging()
+log = logging.getLogger("cobranza.launcher")
 
 def base_dir_app() -> Path:
     """
@@ -42,21 +38,22 @@ def serve(port: int):
     try:
         base = base_dir_app()
         os.environ["COBRANZA_BASE_DIR"] = str(base)
-        _log(f"[serve] COBRANZA_BASE_DIR={base}")
+        log.info(f"[serve] COBRANZA_BASE_DIR={base}")
 
         idx1 = base / "index.html"
         idx2 = base / "static" / "index.html"
-        _log(f"[serve] index candidates -> {idx1} (exists={idx1.exists()}), {idx2} (exists={idx2.exists()})")
-        _log(f"[serve] static dir -> {(base / 'static')} (exists={(base / 'static').exists()})")
-        _log(f"[serve] data dir   -> {(base / 'data')} (exists={(base / 'data').exists()})")
+        log.info(f"[serve] index candidates -> {idx1} (exists={idx1.exists()}), {idx2} (exists={idx2.exists()})")
+        log.info(f"[serve] static dir -> {(base / 'static')} (exists={(base / 'static').exists()})")
+        log.info(f"[serve] data dir   -> {(base / 'data')} (exists={(base / 'data').exists()})")
 
         # Pre-import para capturar y loguear errores de importación
         import importlib
         importlib.import_module("app.main")
-        _log("[serve] import app.main OK")
+        log.info("[serve] import app.main OK")
 
         import uvicorn
-        uvicorn.run(
+        from app import startup
+        config = uvicorn.Config(
             "app.main:app",
             host="127.0.0.1",
             port=port,
@@ -65,29 +62,25 @@ def serve(port: int):
             log_level="warning",
             access_log=False,     # opcional: menos ruido
         )
+        # Señaliza "listo" desde el arranque del servidor (bind + lifespan)
+        startup.make_server(config).run()
 
     except Exception:
-        _log("[serve] FATAL\n" + traceback.format_exc())
+        log.exception("[serve] FATAL")
 
 def wait_ready(port: int, timeout: float = 40.0) -> bool:
-    import http.client
-    t0 = time.time()
-    while time.time() - t0 < timeout:
-        try:
-            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=0.6)
-            conn.request("GET", "/")
-            resp = conn.getresponse()
-            if 200 <= resp.status < 500:
-                _log(f"[ready] OK status={resp.status}")
-                return True
-        except Exception:
-            time.sleep(0.25)
-    _log("[ready] TIMEOUT")
+    from app import startup
+    if startup.wait_until_ready(timeout):
+        log.info(f"[ready] OK port={port} {startup.startup_payload()['milestones_ms']}")
+        return True
+    log.warning("[ready] TIMEOUT")
     return False
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # trabajadores de Excel en procesos (PyInstaller)
     port = find_free_port(8010)
-    _log(f"[main] chosen port={port}")
+    log.info(f"[main] chosen port={port}")
     th = threading.Thread(target=serve, args=(port,), daemon=True)
     th.start()
 
@@ -98,5 +91,5 @@ if __name__ == "__main__":
             pass
         th.join()
     else:
-        _log("No se pudo iniciar el servidor en el tiempo esperado.")
+        log.error("No se pudo iniciar el servidor en el tiempo esperado.")
         sys.exit(1)
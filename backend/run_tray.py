@@ -1,37 +1,23 @@
 # -*- coding: utf-8 -*-
+import logging
 import os
 import sys
 import threading
 import time
 import webbrowser
-import socket
-import traceback
-from datetime import datetime
 from pathlib import Path
 from typing import Optional
 from urllib.request import urlopen, Request
 from urllib.error import URLError
 
-import pystray
-from PIL import Image
 import uvicorn
 
-# ---------------- Helpers de logging ----------------
-def _log_path() -> Path:
-    if getattr(sys, "frozen", False):
-        return Path(sys.executable).resolve().parent / "tray.log"
-    return Path(__file__).resolve().parent / "tray.log"
+# ---------------- Logging (no bloqueante, con rotación) ----------------
+from backend.app.logging_setup import configure_logging
 
-def _write_tray_log(message: str) -> None:
-    try:
-        log_file = _log_path()
-        log_file.parent.mkdir(parents=True, exist_ok=True)
-        with log_file.open("a", encoding="utf-8") as fh:
-            fh.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {message}\n")
-    except Exception:
-        pass
-
-_write_tray_log("=== Iniciando CobranzaTray ===")
+configure_logging()
+log = logging.getLogger("cobranza.tray")
+log.info("=== Iniciando CobranzaTray ===")
 
 # En EXE windowed (sin consola), sys.stdout/stderr pueden ser None.
 # Asegura que existan para evitar fallos en librerías que asumen streams válidos.
@@ -42,9 +28,10 @@ if sys.stdout is None:
 
 # ---------------- Import del backend ----------------
 try:
+    from backend.app import startup
     from backend.app.main import app  # noqa
 except Exception:
-    _write_tray_log("Falla import backend.app.main:\n" + traceback.format_exc())
+    log.exception("Falla import backend.app.main")
     raise
 
 # ---------------- Parámetros base ----------------
@@ -53,6 +40,23 @@ PORT = int(os.getenv("COBRANZA_PORT", "8010"))
 URL = f"http://{HOST}:{PORT}/"
 server: Optional[uvicorn.Server] = None
 
+
+def _env_workers() -> int:
+    try:
+        return max(1, int(os.getenv("COBRANZA_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+
+# Procesos de uvicorn. Con más de uno el estado de los trabajos se comparte
+# por SQLite (backend.app.job_store) y cada proceso tiene su propio pool de
+# Excel: en modo process hay WORKERS x COBRANZA_EXCEL_WORKERS instancias.
+# Cada hijo escribe su propio log (cobranza.<pid>.log, ver logging_setup).
+WORKERS = _env_workers()
+APP_IMPORT = "backend.app.main:app"
+WORKER_STOP_TIMEOUT = 10.0
+supervisor = None  # uvicorn.supervisors.Multiprocess si WORKERS > 1
+
 # Forzar ruta del frontend cuando se ejecuta compilado
 if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
     os.environ.setdefault(
@@ -61,8 +65,36 @@ if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
     )
 
 # ---------------- Arranque del server ----------------
+def _make_supervisor():
+    """
+    Supervisor de WORKERS procesos sobre un mismo socket. Se crea en el hilo
+    principal (instala manejadores de señales) y corre en el hilo del server.
+    """
+    from uvicorn.supervisors import Multiprocess
+
+    config = uvicorn.Config(
+        APP_IMPORT,  # cada proceso importa la app por su cuenta
+        host=HOST,
+        port=PORT,
+        log_config=None,
+        access_log=False,
+        workers=WORKERS,
+    )
+    sock = config.bind_socket()
+    return Multiprocess(config, target=uvicorn.Server(config).run, sockets=[sock])
+
+
 def _run_server():
     global server
+    if supervisor is not None:
+        try:
+            log.info("Arrancando servidor FastAPI con %d procesos...", WORKERS)
+            supervisor.run()
+            log.info("Servidor FastAPI finalizó.")
+        except Exception:
+            log.exception("Excepción en el supervisor de procesos")
+            raise
+        return
     try:
         config = uvicorn.Config(
         app,
@@ -73,17 +105,18 @@ def _run_server():
            access_log=False,
            workers=1,
     )
-        server = uvicorn.Server(config)
+        # El servidor marca "listo" al terminar bind + lifespan (sin polling).
+        server = startup.make_server(config)
         if hasattr(server, "install_signal_handlers"):
             try:
                server.install_signal_handlers = (lambda: None)  # type: ignore[attr-defined]
             except Exception:
                pass
-        _write_tray_log("Arrancando servidor FastAPI...")
+        log.info("Arrancando servidor FastAPI...")
         server.run()
-        _write_tray_log("Servidor FastAPI finalizó.")
+        log.info("Servidor FastAPI finalizó.")
     except Exception:
-        _write_tray_log("Excepción en servidor:\n" + traceback.format_exc())
+        log.exception("Excepción en servidor")
         raise
 
 def start_server_in_thread():
@@ -91,21 +124,39 @@ def start_server_in_thread():
     thread.start()
     return thread
 
-def wait_for_server(timeout: float = 20.0) -> bool:
-    end = time.time() + timeout
-    while time.time() < end:
+def _wait_http_ready(timeout: float) -> bool:
+    """Con varios procesos los eventos de "listo" quedan en cada hijo: se consulta /health."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
         try:
-            with socket.create_connection((HOST, PORT), timeout=0.6):
+            with urlopen(Request(URL + "health", headers={"User-Agent": "CobranzaTray"}), timeout=1):
                 return True
-        except OSError:
-            time.sleep(0.3)
+        except Exception:
+            time.sleep(0.1)
     return False
 
+def wait_for_server(timeout: float = 20.0) -> bool:
+    if supervisor is not None:
+        return _wait_http_ready(timeout)
+    return startup.wait_until_ready(timeout)
+
 def stop_server():
     global server
+    if supervisor is not None:
+        supervisor.should_exit.set()
     if server is not None:
         server.should_exit = True
 
+def _reap_workers(server_thread: threading.Thread) -> None:
+    """Da tiempo al cierre ordenado de los procesos y mata los que sigan vivos (evita colgar la salida)."""
+    if supervisor is None:
+        return
+    server_thread.join(WORKER_STOP_TIMEOUT)
+    for process in supervisor.processes:
+        if process.process.is_alive():
+            log.warning("Proceso de servidor %s no terminó; se fuerza el cierre.", process.pid)
+            process.kill()
+
 # ---------------- UI helpers ----------------
 def open_ui(_icon=None, _item=None):
     webbrowser.open(URL)
@@ -144,7 +195,10 @@ def _dev_static_dir() -> Path:
             return p
     return here
 
-def load_icon_image() -> Image.Image:
+def load_icon_image():
+    # PIL se importa aquí: no es necesario para levantar el servidor.
+    from PIL import Image
+
     exe_dir = _exe_dir()
     candidates = [exe_dir / "app" / "static" / "cobranza.ico"]
 
@@ -158,20 +212,23 @@ def load_icon_image() -> Image.Image:
     for p in candidates:
         try:
             if p.is_file():
-                _write_tray_log(f"Usando icono: {p}")
+                log.info(f"Usando icono: {p}")
                 return Image.open(str(p))
         except Exception:
             continue
 
-    _write_tray_log("Icono no encontrado; usando fallback.")
+    log.warning("Icono no encontrado; usando fallback.")
     return Image.new("RGBA", (64, 64), (20, 30, 50, 255))
 
 # ---------------- Main ----------------
 def main():
-    start_server_in_thread()
+    global supervisor
+    if WORKERS > 1:
+        supervisor = _make_supervisor()
+    server_thread = start_server_in_thread()
 
     if wait_for_server():
-        _write_tray_log(f"Servidor disponible en {URL}")
+        log.info(f"Servidor disponible en {URL} ({startup.startup_payload()['milestones_ms']})")
     else:
         # doble verificación por HTTP para dejar rastro del error real si lo hubiese
         try:
@@ -179,11 +236,13 @@ def main():
             with urlopen(req, timeout=2):
                 pass
         except URLError as e:
-            _write_tray_log(f"No se pudo verificar el servidor: {getattr(e, 'reason', repr(e))}")
+            log.warning(f"No se pudo verificar el servidor: {getattr(e, 'reason', repr(e))}")
         except Exception as e:
-            _write_tray_log(f"No se pudo verificar el servidor: {e!r}")
+            log.warning(f"No se pudo verificar el servidor: {e!r}")
+
+        log.warning(f"Advertencia: no se pudo verificar el servidor en {URL} dentro del timeout.")
 
-        _write_tray_log(f"Advertencia: no se pudo verificar el servidor en {URL} dentro del timeout.")
+    import pystray
 
     icon = pystray.Icon(
         "CobranzaXLS",
@@ -196,6 +255,10 @@ def main():
         ),
     )
     icon.run()
+    _reap_workers(server_thread)
 
 if __name__ == "__main__":
+    # Necesario para los trabajadores de Excel en procesos (COBRANZA_EXEC_MODE=process) en el .exe
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""Configuración común de las pruebas: importa ``app`` desde backend/ y aísla logs y bases."""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+_TMP = Path(tempfile.mkdtemp(prefix="cobranza_tests_"))
+os.environ.setdefault("COBRANZA_LOG_DIR", str(_TMP))
+os.environ.setdefault("COBRANZA_JOB_DB", str(_TMP / "jobs.sqlite3"))
+os.environ.setdefault("COBRANZA_HISTORY_DB", str(_TMP / "history.sqlite3"))
+os.environ.setdefault("COBRANZA_EXCEL_PID_DIR", str(_TMP / "excel_pids"))
+os.environ.setdefault("COBRANZA_PREWARM", "0")
+
+# Maestro de ejemplo (hojas destino) y un origen exportado por el ERP
+MASTER_XLS = BACKEND_DIR / "app" / "data" / "COBRANZA-formateado.XLS"
+SOURCE_XLS = BACKEND_DIR.parent / "docs" / "COBRANZA 24-01-26.XLS"
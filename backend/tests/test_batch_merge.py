@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import pytest
+
+from app.services.batch_merge import merge_batch
+
+from conftest import SOURCE_XLS
+
+
+@pytest.fixture
+def stub_thread_mode(monkeypatch):
+    monkeypatch.setenv("COBRANZA_EXEC_MODE", "thread")
+    monkeypatch.setenv("COBRANZA_EXCEL_ENGINE", "app.services.excel_workers:StubEngine")
+
+
+def test_merge_batch_moves_outputs_and_removes_work_dirs(stub_thread_mode, tmp_path, monkeypatch):
+    temp = tmp_path / "temp"
+    temp.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp))
+    out_dir = tmp_path / "lote"
+
+    summary = merge_batch([(str(SOURCE_XLS), "SUR.xls"), (str(SOURCE_XLS), "NORTE.xls")], str(SOURCE_XLS), str(out_dir))
+
+    assert summary["ok"] == 2
+    assert sorted(os.listdir(out_dir)) == ["NORTE.xls", "SUR.xls"]
+    # Ni la carpeta temporal de cada merge queda en %TEMP%
+    assert os.listdir(temp) == []
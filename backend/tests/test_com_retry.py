@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Política de reintentos COM y ``MessageFilter`` sin Excel: reloj falso y errores simulados."""
+import pytest
+
+from app import metrics
+from app.services import com_retry
+from app.services.com_retry import (
+    DISP_E_EXCEPTION,
+    RPC_E_CALL_REJECTED,
+    SERVERCALL_RETRYLATER,
+    VBA_E_IGNORE,
+    XL_E_METHOD_FAILED,
+    MessageFilter,
+    RetryPolicy,
+    hresult_of,
+)
+
+SERVERCALL_REJECTED = 1
+
+
+class ComError(Exception):
+    """Como ``pywintypes.com_error``: (hresult con signo, texto, excepinfo, argerr)."""
+
+    def __init__(self, hresult: int, excepinfo=None):
+        signed = hresult - (1 << 32) if hresult & 0x80000000 else hresult
+        super().__init__(signed, "com_error", excepinfo, None)
+        self.hresult = signed
+
+
+class FakeClock:
+    """``time.monotonic``/``time.sleep`` de com_retry: dormir sólo adelanta el reloj."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(round(seconds * 1000))
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(com_retry.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(com_retry.time, "sleep", fake.sleep)
+    metrics.reset()
+    return fake
+
+
+def failing(errors, result="ok"):
+    """Función que lanza ``errors`` en orden y después devuelve ``result``."""
+    pending = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if pending:
+            raise pending.pop(0)
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+def counters():
+    return metrics.snapshot()["counters"]
+
+
+def test_transient_error_is_retried_and_counted(clock):
+    fn = failing([ComError(RPC_E_CALL_REJECTED), ComError(VBA_E_IGNORE)])
+
+    assert RetryPolicy().call(fn) == "ok"
+    assert len(fn.calls) == 3
+    assert clock.sleeps == [25, 50]
+    assert counters()["com.retries"] == 2
+    assert "com.giveups" not in counters()
+
+
+def test_permanent_error_raises_immediately(clock):
+    fn = failing([ComError(XL_E_METHOD_FAILED)])
+
+    with pytest.raises(ComError):
+        RetryPolicy().call(fn)
+    assert len(fn.calls) == 1
+    assert clock.sleeps == []
+    assert "com.retries" not in counters()
+
+
+def test_gives_up_after_total_time(clock):
+    fn = failing([ComError(RPC_E_CALL_REJECTED)] * 100)
+    policy = RetryPolicy(base_ms=10, cap_ms=40, total_ms=100)
+
+    with pytest.raises(ComError):
+        policy.call(fn)
+    # 10 + 20 + 40 = 70 ms; la siguiente espera (40) pasaría de 100
+    assert clock.sleeps == [10, 20, 40]
+    assert counters()["com.retries"] == 3
+    assert counters()["com.giveups"] == 1
+
+
+def test_with_transient_adds_hresults(clock):
+    fn = failing([ComError(XL_E_METHOD_FAILED)])
+
+    assert RetryPolicy().with_transient([XL_E_METHOD_FAILED]).call(fn) == "ok"
+    assert counters()["com.retries"] == 1
+
+
+def test_hresult_unwraps_disp_exception_scode():
+    # (wcode, fuente, descripción, ayuda, contexto, scode)
+    excepinfo = (0, "Microsoft Excel", "ocupado", None, 0, VBA_E_IGNORE - (1 << 32))
+    exc = ComError(DISP_E_EXCEPTION, excepinfo)
+
+    assert hresult_of(exc) == VBA_E_IGNORE
+    assert RetryPolicy().is_transient(exc)
+    assert hresult_of(ComError(DISP_E_EXCEPTION, (0, None, None, None, 0, 0))) == DISP_E_EXCEPTION
+    assert hresult_of(ValueError("sin hresult")) is None
+
+
+@pytest.mark.parametrize(
+    "tick, reject_type, expected",
+    [
+        (0, SERVERCALL_REJECTED, -1),             # rechazo definitivo: no se reintenta
+        (0, SERVERCALL_RETRYLATER, 100),          # por debajo de 100 ms COM reintenta sin esperar
+        (500, SERVERCALL_RETRYLATER, 500),        # espera lo ya transcurrido
+        (5000, SERVERCALL_RETRYLATER, 1000),      # acotado al tope
+        (30000, SERVERCALL_RETRYLATER, -1),       # plazo total agotado
+    ],
+)
+def test_message_filter_retry_rejected_call(tick, reject_type, expected):
+    metrics.reset()
+    assert MessageFilter(RetryPolicy()).RetryRejectedCall(None, tick, reject_type) == expected
+
+
+def test_message_filter_counts_retries_and_giveups():
+    metrics.reset()
+    message_filter = MessageFilter(RetryPolicy(base_ms=25, cap_ms=1000, total_ms=2000))
+    for tick in (50, 800, 1600, 2000):
+        message_filter.RetryRejectedCall(None, tick, SERVERCALL_RETRYLATER)
+
+    assert counters()["com.filter_retries"] == 3
+    assert counters()["com.filter_giveups"] == 1
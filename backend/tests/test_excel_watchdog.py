@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Watchdog con ``FakeProcessTable`` y reloj falso: plazos por etapa y barrido de huérfanos."""
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from app.services.excel_watchdog import (
+    IDLE_STAGE,
+    ExcelPidRegistry,
+    ExcelStageTimeout,
+    ExcelWatchdog,
+    FakeProcessTable,
+    ProcessTable,
+    SystemProcessTable,
+    parse_stage_timeouts,
+)
+from app.services.job_report import JobReport
+
+EXCEL_PID = 4242
+TIMEOUTS = {"open": 120.0, "paste": 180.0, "default": 300.0}
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def table():
+    return FakeProcessTable({EXCEL_PID: "EXCEL.EXE"})
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ExcelPidRegistry(tmp_path / "excel_pids")
+
+
+@pytest.fixture
+def watchdog(table, registry, clock):
+    # Sondeo de una hora: el hilo supervisor no interviene, las pasadas son check() a mano
+    wd = ExcelWatchdog(table=table, registry=registry, timeouts=dict(TIMEOUTS), poll_interval=3600, clock=clock)
+    yield wd
+    wd.stop()
+
+
+def test_stage_deadline_kills_excel(watchdog, table, registry, clock):
+    watchdog.launched(EXCEL_PID)
+    report = JobReport()
+    with watchdog.watch(EXCEL_PID, "merge") as job:
+        with report.stage("open"):
+            clock.advance(119)
+            assert watchdog.check() == []
+            clock.advance(2)
+            assert watchdog.check() == [job]
+            assert watchdog.check() == []                    # se mata una sola vez
+    assert job.expired == ("open", 120.0)
+    assert table.killed == [EXCEL_PID]
+    assert registry.entries() == []
+    assert watchdog.status() == []
+
+
+def test_nested_stage_restores_outer_deadline(watchdog, table, clock):
+    report = JobReport()
+    with watchdog.watch(EXCEL_PID) as job:
+        with report.stage("paste"):                          # vence a los 180 s
+            clock.advance(10)
+            with report.stage("open"):                       # vence a los 10 + 120 s
+                assert job.current[0] == "open"
+                clock.advance(40)
+            assert job.current[0] == "paste"
+            clock.advance(125)                               # 175 s: pasado el de open, no el de paste
+            assert watchdog.check() == []
+            clock.advance(6)
+            assert watchdog.check() == [job]
+    assert job.expired == ("paste", 180.0)
+    assert table.killed == [EXCEL_PID]
+
+
+def test_unknown_stage_uses_default(watchdog, clock):
+    report = JobReport()
+    with watchdog.watch(EXCEL_PID) as job:
+        with report.stage("calculate"):
+            clock.advance(299)
+            assert watchdog.check() == []
+            clock.advance(2)
+            assert watchdog.check() == [job]
+    assert job.expired == ("calculate", 300.0)
+
+
+def test_idle_frame_restarts_after_each_stage(watchdog, table, clock):
+    report = JobReport()
+    with watchdog.watch(EXCEL_PID) as job:
+        clock.advance(250)
+        with report.stage("open"):
+            clock.advance(100)
+        # Entre etapas vuelve a correr el plazo "default" desde la salida de la etapa
+        assert job.current[0] == IDLE_STAGE
+        clock.advance(299)
+        assert watchdog.check() == []
+        clock.advance(2)
+        assert watchdog.check() == [job]
+    assert job.expired == (IDLE_STAGE, 300.0)
+    assert table.killed == [EXCEL_PID]
+
+
+def test_watch_without_pid_is_not_supervised(watchdog, clock):
+    with watchdog.watch(None) as job:
+        clock.advance(10_000)
+        assert job is None
+        assert watchdog.check() == []
+
+
+def test_sweep_kills_only_registered_orphans(table, registry, clock):
+    owner_alive = table.spawn(10, "python.exe")
+    owner_dead = 11
+    table.spawn(200, "EXCEL.EXE")                            # Excel de un dueño vivo
+    table.spawn(300, "EXCEL.EXE")                            # Excel huérfano
+    table.spawn(400, "notepad.exe")                          # pid reciclado por otro programa
+    table.spawn(500, "EXCEL.EXE")                            # Excel del usuario, sin registrar
+    for pid, owner in ((200, owner_alive), (300, owner_dead), (400, owner_dead)):
+        registry.register(pid, owner=owner, created=table.create_time(pid))
+    registry.register(600, owner=owner_dead, created=1.0)    # ya terminó
+    wd = ExcelWatchdog(table=table, registry=registry, timeouts=dict(TIMEOUTS), poll_interval=3600, clock=clock)
+
+    assert wd.sweep() == {"killed": 1, "stale": 2}
+    assert table.killed == [300]
+    assert sorted(e["pid"] for e in registry.entries()) == [200]
+    assert {200, 400, 500} <= set(table.procs)
+    assert wd.sweep() == {"killed": 0, "stale": 0}
+
+
+def test_sweep_spares_reused_pid(table, registry, clock):
+    table.spawn(300, "EXCEL.EXE")
+    registry.register(300, owner=11, created=table.create_time(300))
+    table.kill(300)
+    table.killed.clear()
+    table.spawn(300, "EXCEL.EXE")                            # el usuario abre Excel y recibe el mismo pid
+    table.spawn(301, "EXCEL.EXE")
+    registry.register(301, owner=11)                         # sin hora de creación: no se puede confirmar
+    wd = ExcelWatchdog(table=table, registry=registry, timeouts=dict(TIMEOUTS), poll_interval=3600, clock=clock)
+
+    assert wd.sweep() == {"killed": 0, "stale": 2}
+    assert table.killed == []
+    assert {300, 301} <= set(table.procs)
+    assert registry.entries() == []
+
+
+def test_launched_records_create_time(watchdog, table, registry):
+    watchdog.launched(EXCEL_PID)
+    [entry] = registry.entries()
+    assert entry["created"] == table.create_time(EXCEL_PID)
+
+
+def test_system_create_time_is_stable():
+    table = SystemProcessTable()
+    first = table.create_time(os.getpid())
+    assert first is not None and first == table.create_time(os.getpid())
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    assert table.create_time(child.pid) is None
+
+
+def test_process_table_requires_every_method():
+    class NoCreateTime(ProcessTable):
+        def excel_pids(self):
+            return set()
+
+        def alive(self, pid):
+            return False
+
+        def kill(self, pid, wait=0.0):
+            return True
+
+    with pytest.raises(TypeError, match="create_time"):
+        NoCreateTime()
+
+
+def test_registry_defaults_owner_and_drops_damaged_entries(registry):
+    registry.register(123)
+    (registry.directory / "999.json").write_text("{", encoding="utf-8")
+    assert [(e["pid"], e["owner"]) for e in registry.entries()] == [(123, os.getpid())]
+    assert not (registry.directory / "999.json").exists()
+
+
+def test_stage_timeout_survives_pickling():
+    exc = pickle.loads(pickle.dumps(ExcelStageTimeout("save", 0.5)))
+    assert (exc.stage, exc.seconds) == ("save", 0.5)
+    assert "0.5 s" in str(exc)
+
+
+def test_parse_stage_timeouts():
+    timeouts = parse_stage_timeouts("open=90, save = 60,bogus,paste=x")
+    assert timeouts["open"] == 90.0
+    assert timeouts["save"] == 60.0
+    assert timeouts["paste"] == 180.0
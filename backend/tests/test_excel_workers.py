@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Supervisor del pool con ``StubEngine`` (sin Excel): protocolo, fallos y reemplazo de procesos."""
+import threading
+import time
+
+import pytest
+
+from app.services.cancellation import CancelToken, JobCancelled
+from app.services.excel_workers import (
+    ExcelWorkerError,
+    ExcelWorkerPool,
+    WorkerCancelled,
+    WorkerCrashed,
+    WorkerTimeout,
+    run_excel_job,
+)
+
+STUB = "app.services.excel_workers:StubEngine"
+
+
+@pytest.fixture
+def pool():
+    p = ExcelWorkerPool(size=1, engine_spec=STUB, job_timeout=30, start_timeout=30, cancel_grace=0.5)
+    p.start()
+    yield p
+    p.shutdown(timeout=5)
+
+
+def _pid(pool: ExcelWorkerPool) -> int:
+    return pool.status()["workers"][0]["pid"]
+
+
+def _cancel_after(token: CancelToken, seconds: float) -> None:
+    timer = threading.Timer(seconds, token.cancel)
+    timer.daemon = True
+    timer.start()
+
+
+def test_echo_with_progress(pool):
+    seen = []
+    assert pool.run("echo", {"a": 1}, lambda pct, msg: seen.append((pct, msg))) == {"a": 1}
+    assert seen == [(10, "stub:echo")]
+    assert pool.status()["jobs"] == 1
+
+
+def test_job_error_keeps_worker(pool):
+    pid = _pid(pool)
+    with pytest.raises(ValueError, match="boom"):
+        pool.run("fail", {"message": "boom"})
+    assert pool.run("echo", {"b": 2}) == {"b": 2}
+    assert _pid(pool) == pid
+    assert pool.status()["errors"] == 1
+    assert pool.status()["restarts"] == 0
+
+
+def test_crash_respawns_worker(pool):
+    pid = _pid(pool)
+    with pytest.raises(WorkerCrashed):
+        pool.run("crash", {})
+    status = pool.status()
+    assert (status["crashes"], status["restarts"]) == (1, 1)
+    assert _pid(pool) != pid
+    assert pool.run("echo", {"c": 3}) == {"c": 3}
+
+
+def test_timeout_kills_and_respawns(pool):
+    pid = _pid(pool)
+    started = time.monotonic()
+    with pytest.raises(WorkerTimeout):
+        pool.run("sleep", {"seconds": 30}, timeout=0.5)
+    assert time.monotonic() - started < 10
+    assert pool.status()["timeouts"] == 1
+    assert _pid(pool) != pid
+    assert pool.run("echo", {"d": 4}) == {"d": 4}
+
+
+def test_cooperative_cancel_reuses_worker(pool):
+    pid = _pid(pool)
+    token = CancelToken()
+    _cancel_after(token, 0.3)
+    with pytest.raises(JobCancelled) as info:
+        pool.run("sleep", {"seconds": 30}, cancel=token)
+    assert not isinstance(info.value, WorkerCancelled)
+    assert pool.status()["cancelled"] == 1
+    assert _pid(pool) == pid                                 # el hijo atendió la cancelación
+    assert pool.run("echo", {"e": 5}) == {"e": 5}            # y su evento se limpió
+
+
+def test_cancel_grace_kills_worker_that_ignores_it(pool):
+    pid = _pid(pool)
+    token = CancelToken()
+    _cancel_after(token, 0.3)
+    with pytest.raises(WorkerCancelled):
+        pool.run("sleep", {"seconds": 30, "ignore_cancel": True}, cancel=token)
+    status = pool.status()
+    assert (status["cancelled"], status["restarts"]) == (1, 1)
+    assert _pid(pool) != pid
+    assert pool.run("echo", {"f": 6}) == {"f": 6}
+
+
+def test_queued_job_cancelled_is_dropped(pool):
+    busy = threading.Thread(target=pool.run, args=("sleep", {"seconds": 1}))
+    busy.start()
+    time.sleep(0.2)
+    token = CancelToken()
+    _cancel_after(token, 0.2)
+    with pytest.raises(JobCancelled):
+        pool.run("echo", {"never": True}, cancel=token)
+    busy.join()
+    status = pool.status()
+    assert status["dropped"] == 1
+    assert status["jobs"] == 1                               # el encolado no llegó al trabajador
+
+
+def _failing_spawn(pool: ExcelWorkerPool, monkeypatch, times: int) -> None:
+    real_spawn = pool._spawn
+    left = [times]
+
+    def spawn(slot):
+        if left[0] > 0:
+            left[0] -= 1
+            raise ExcelWorkerError(f"El trabajador {slot} no pudo iniciar: prueba")
+        return real_spawn(slot)
+
+    monkeypatch.setattr(pool, "_spawn", spawn)
+
+
+def test_failed_respawn_is_retried_by_next_job(pool, monkeypatch):
+    _failing_spawn(pool, monkeypatch, times=1)
+    with pytest.raises(WorkerCrashed):
+        pool.run("crash", {})
+    # El siguiente trabajo no recibe el proceso muerto: lo relanza y corre
+    assert pool.run("echo", {"g": 7}) == {"g": 7}
+    assert pool.status()["restarts"] == 2
+    assert pool.status()["workers"][0]["alive"]
+
+
+def test_failed_respawn_does_not_lose_the_slot(pool, monkeypatch):
+    _failing_spawn(pool, monkeypatch, times=2)
+    with pytest.raises(WorkerCrashed):
+        pool.run("crash", {})
+    with pytest.raises(ExcelWorkerError, match="no pudo iniciar"):
+        pool.run("echo", {})
+    assert pool.run("echo", {"h": 8}) == {"h": 8}
+
+
+def test_worker_dead_while_idle_is_respawned(pool):
+    [handle] = pool._handles.values()
+    handle.process.kill()
+    handle.process.join(5)
+    assert pool.run("echo", {"i": 9}) == {"i": 9}
+    assert pool.status()["restarts"] == 1
+
+
+def test_thread_mode_without_progress_callback(monkeypatch, tmp_path):
+    monkeypatch.setenv("COBRANZA_EXEC_MODE", "thread")
+    monkeypatch.setenv("COBRANZA_EXCEL_ENGINE", STUB)
+    xls = tmp_path / "origen.xls"
+    xls.write_bytes(b"")
+    [block] = run_excel_job("list_blocks", {"xls_path": str(xls)})
+    assert block["id"] == "stub:origen.xls"
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.job_store import RECOVERED_MSG, JobStore, MemoryJobStore, SqliteJobStore
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _stored(store: SqliteJobStore, job_id: str):
+    row = store._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Intervalo largo: el hilo escritor no interviene, se vacía a mano con flush()
+    s = SqliteJobStore(tmp_path / "jobs.sqlite3", flush_interval=60)
+    yield s
+    s.close()
+
+
+def test_progress_is_coalesced_until_flush(store, monkeypatch):
+    writes = []
+    original = store._write
+
+    def counting_write(items, replace=False):
+        items = list(items)
+        writes.append(items)
+        original(items, replace)
+
+    monkeypatch.setattr(store, "_write", counting_write)
+
+    store.create("a", status="queued", pct=0)
+    for pct in range(1, 51):
+        store.progress("a", status="running", pct=pct, msg=f"paso {pct}")
+
+    assert len(writes) == 1                                  # sólo el create
+    assert _stored(store, "a")["pct"] == 0
+    assert store.get("a")["pct"] == 50                       # get ve lo pendiente
+
+    store.flush()
+    assert len(writes) == 2
+    assert _stored(store, "a") == {"status": "running", "pct": 50, "msg": "paso 50"}
+
+
+def test_update_writes_pending_progress_with_it(store):
+    store.create("a", status="running", pct=0)
+    store.progress("a", pct=40, msg="Pegando")
+    store.update("a", status="done", pct=100, out_path="x.xls")
+
+    assert _stored(store, "a") == {"status": "done", "pct": 100, "msg": "Pegando", "out_path": "x.xls"}
+    store.flush()
+    assert _stored(store, "a")["pct"] == 100                 # lo pendiente no pisa al estado final
+
+
+def test_delete_drops_pending_progress(store):
+    store.create("a", status="running")
+    store.progress("a", pct=10)
+    assert store.delete("a")
+    store.flush()
+    assert store.get("a") is None
+    assert not store.delete("a")
+
+
+def test_recover_fails_orphans_and_purges_old_jobs(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    out = tmp_path / "resultado.xls"
+    out.write_bytes(b"xls")
+
+    previous = SqliteJobStore(path, flush_interval=0)
+    previous._pid = _dead_pid()                              # trabajos de una bandeja que ya no existe
+    previous.create("huerfano", status="running", pct=40)
+    previous.create("en_cola", status="queued")
+    previous.create("listo", status="done", out_path=str(out))
+    previous.create("viejo", status="done", out_path=str(tmp_path / "borrado.xls"))
+    previous._pid = os.getpid()
+    previous.create("propio", status="running")              # de este mismo proceso: sigue en curso
+    old = time.time() - 30 * 86400
+    previous._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = 'viejo'", (old,))
+    previous.close()
+
+    store = SqliteJobStore(path, flush_interval=0)
+    try:
+        assert store.recover() == {"failed": 2, "available": 1, "purged": 1}
+        for job_id in ("huerfano", "en_cola"):
+            state = store.get(job_id)
+            assert state["status"] == "error"
+            assert state["msg"] == RECOVERED_MSG
+            assert state["recovered"] is True
+        assert store.get("huerfano")["pct"] == 100
+        assert store.get("propio")["status"] == "running"
+        assert store.get("listo")["status"] == "done"
+        assert store.get("viejo") is None
+        assert store.recover() == {"failed": 0, "available": 1, "purged": 0}
+    finally:
+        store.close()
+
+
+def test_memory_store_has_same_semantics():
+    store = MemoryJobStore()
+    store.create("a", status="queued")
+    store.progress("a", status="running", pct=5)
+    store.update("a", pct=10)
+    assert store.get("a") == {"status": "running", "pct": 10}
+    assert store.recover() == {"failed": 0, "available": 0, "purged": 0}
+    assert store.delete("a") and store.get("a") is None
+
+
+def test_incomplete_store_fails_on_instantiation():
+    class NoDelete(JobStore):
+        def create(self, job_id, **fields): ...
+        def update(self, job_id, **fields): ...
+        def get(self, job_id): ...
+
+    with pytest.raises(TypeError, match="delete"):
+        NoDelete()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+from app.logging_setup import process_log_path, prune_child_logs
+
+
+def _child_log_path(path: str, out) -> None:
+    out.put((os.getpid(), str(process_log_path(Path(path)))))
+
+
+def test_main_process_keeps_configured_file(tmp_path):
+    path = tmp_path / "cobranza.log"
+    assert process_log_path(path) == path
+
+
+def test_child_process_gets_its_own_file(tmp_path):
+    """Un proceso hijo (como los de uvicorn o el pool de Excel) nunca abre el archivo del principal."""
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    child = ctx.Process(target=_child_log_path, args=(str(tmp_path / "cobranza.log"), out))
+    child.start()
+    pid, path = out.get(timeout=30)
+    child.join(30)
+    assert path == str(tmp_path / f"cobranza.{pid}.log")
+
+
+def test_prune_removes_only_old_child_logs(tmp_path):
+    path = tmp_path / "cobranza.log"
+    names = ["cobranza.log", "cobranza.log.1", "cobranza.101.log", "cobranza.101.log.2", "cobranza.202.log", "otro.303.log"]
+    for name in names:
+        (tmp_path / name).write_text("{}\n", encoding="utf-8")
+    old = time.time() - 10 * 86400
+    for name in ["cobranza.log", "cobranza.log.1", "cobranza.101.log", "cobranza.101.log.2", "otro.303.log"]:
+        os.utime(tmp_path / name, (old, old))
+
+    assert prune_child_logs(path, max_age_days=7) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["cobranza.202.log", "cobranza.log", "cobranza.log.1", "otro.303.log"]
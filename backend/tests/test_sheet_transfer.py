@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""Verificación directo vs. portapapeles contra un Excel simulado en memoria (sin COM)."""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import metrics
+from app.services.com_retry import CLIPBRD_E_CANT_OPEN
+from app.services.sheet_transfer import XL_NONE, XL_RANGE_VALUE_XML, paste_via_clipboard, verify_direct_transfer
+
+DEFAULT_WIDTH = 8.43
+
+
+class ComError(Exception):
+    """Como ``pywintypes.com_error``: HRESULT con signo en ``hresult`` y ``args[0]``."""
+
+    def __init__(self, hresult: int):
+        signed = hresult - (1 << 32) if hresult & 0x80000000 else hresult
+        super().__init__(signed, "com_error", None, None)
+        self.hresult = signed
+
+
+class FakeOle:
+    """``_oleobj_`` del rango: sólo ``Value(11)`` (XML), aquí JSON con las celdas relativas."""
+
+    def __init__(self, rng: "FakeRange"):
+        self.rng = rng
+
+    def GetIDsOfNames(self, name):  # noqa: N802
+        assert name == "Value"
+        return 6
+
+    def Invoke(self, dispid, lcid, flags, result_wanted, *args):  # noqa: N802
+        assert args[0] == XL_RANGE_VALUE_XML
+        if len(args) == 1:
+            return json.dumps(self.rng.relative_cells())
+        for dr, dc, value in json.loads(args[1]):
+            self.rng.sheet.cells[(self.rng.r1 + dr, self.rng.c1 + dc)] = value
+        return None
+
+
+class FakeColumns:
+    def __init__(self, sheet: "FakeSheet", c1: int, c2: int):
+        self.sheet, self.c1, self.c2 = sheet, c1, c2
+
+    @property
+    def ColumnWidth(self):  # noqa: N802
+        return self.sheet.widths.get(self.c1, DEFAULT_WIDTH)
+
+    @ColumnWidth.setter
+    def ColumnWidth(self, width):  # noqa: N802
+        for c in range(self.c1, self.c2 + 1):
+            self.sheet.widths[c] = width
+
+
+class FakeRange:
+    def __init__(self, sheet: "FakeSheet", r1: int, c1: int, r2: int, c2: int):
+        self.sheet, self.r1, self.c1, self.r2, self.c2 = sheet, r1, c1, r2, c2
+        self._oleobj_ = FakeOle(self)
+        # Formato de celda fijo: igual en ambas hojas
+        self.NumberFormat = "General"
+        self.Font = SimpleNamespace(Name="Arial", Size=10, Bold=False, Italic=False, Underline=XL_NONE, Color=0)
+        self.Interior = SimpleNamespace(Pattern=XL_NONE)
+        self.HorizontalAlignment = 1
+        self.VerticalAlignment = -4107
+        self.WrapText = False
+        self.MergeCells = False
+
+    @property
+    def Row(self):  # noqa: N802
+        return self.r1
+
+    @property
+    def Column(self):  # noqa: N802
+        return self.c1
+
+    @property
+    def Rows(self):  # noqa: N802
+        return SimpleNamespace(Count=self.r2 - self.r1 + 1)
+
+    @property
+    def Columns(self):  # noqa: N802
+        return SimpleNamespace(Count=self.c2 - self.c1 + 1)
+
+    def Borders(self, edge):  # noqa: N802
+        return SimpleNamespace(LineStyle=XL_NONE)
+
+    def relative_cells(self):
+        return [
+            [r - self.r1, c - self.c1, v]
+            for (r, c), v in sorted(self.sheet.cells.items())
+            if self.r1 <= r <= self.r2 and self.c1 <= c <= self.c2
+        ]
+
+    def _grid(self):
+        rows = tuple(
+            tuple(self.sheet.cells.get((r, c)) for c in range(self.c1, self.c2 + 1))
+            for r in range(self.r1, self.r2 + 1)
+        )
+        return rows if (self.r1, self.c1) != (self.r2, self.c2) else rows[0][0]
+
+    Value2 = property(_grid)
+    FormulaR1C1 = property(_grid)
+
+    def Copy(self, Destination=None):  # noqa: N802
+        self.sheet.excel.clipboard = self.relative_cells()
+
+    def PasteSpecial(self, Paste=None):  # noqa: N802
+        self.sheet.excel.paste_into(self)
+
+
+class FakeSheet:
+    def __init__(self, excel: "FakeExcel", cells=None):
+        self.excel = excel
+        self.cells = dict(cells or {})
+        self.widths = {}
+        self.paste_errors = []                 # HRESULT a lanzar en los próximos Paste
+
+    @property
+    def UsedRange(self):  # noqa: N802
+        rows = max((r for r, _ in self.cells), default=1)
+        cols = max((c for _, c in self.cells), default=1)
+        return FakeRange(self, 1, 1, rows, cols)
+
+    def Cells(self, r, c):  # noqa: N802
+        return FakeRange(self, r, c, r, c)
+
+    def Columns(self, c):  # noqa: N802
+        return FakeColumns(self, c, c)
+
+    def Range(self, first, last=None):  # noqa: N802
+        if first == "A1":
+            return self.Cells(1, 1)
+        if isinstance(first, FakeColumns):
+            return FakeColumns(self, first.c1, last.c2)
+        return FakeRange(self, first.r1, first.c1, last.r2, last.c2)
+
+    def Paste(self, Destination=None):  # noqa: N802
+        if self.paste_errors:
+            raise ComError(self.paste_errors.pop(0))
+        self.excel.paste_into(Destination)
+
+
+class FakeWorksheets:
+    def __init__(self, excel):
+        self.excel = excel
+        self.items = [FakeSheet(excel)]
+
+    @property
+    def Count(self):  # noqa: N802
+        return len(self.items)
+
+    def __call__(self, index):
+        return self.items[index - 1]
+
+    def Add(self, After=None):  # noqa: N802
+        sheet = FakeSheet(self.excel)
+        self.items.append(sheet)
+        return sheet
+
+
+class FakeWorkbook:
+    def __init__(self, excel):
+        self.Worksheets = FakeWorksheets(excel)
+        self.closed = False
+
+    def Close(self, SaveChanges=True):  # noqa: N802
+        self.closed = True
+
+
+class FakeExcel:
+    def __init__(self):
+        self.CutCopyMode = False
+        self.clipboard = None
+        self.opened = []
+        self.Workbooks = SimpleNamespace(Add=self._add_workbook)
+
+    def _add_workbook(self):
+        wb = FakeWorkbook(self)
+        self.opened.append(wb)
+        return wb
+
+    def paste_into(self, dest: FakeRange):
+        if self.clipboard is None:
+            raise ComError(0x800A03EC)
+        for dr, dc, value in self.clipboard:
+            dest.sheet.cells[(dest.r1 + dr, dest.c1 + dc)] = value
+
+
+@pytest.fixture
+def excel():
+    return FakeExcel()
+
+
+@pytest.fixture
+def source(excel):
+    sheet = FakeSheet(excel, {(1, 1): "Vendedor", (1, 2): "Saldo", (2, 1): "JUAN PEREZ", (2, 2): 90.5, (3, 2): 12.0})
+    sheet.widths = {1: 30.0, 2: 12.5}
+    return sheet
+
+
+def test_verify_direct_transfer_matches_clipboard(excel, source):
+    result = verify_direct_transfer(excel, source)
+
+    assert result["ok"] is True, result["differences"]
+    assert (result["rows"], result["cols"]) == (3, 2)
+    assert result["clipboard_method"] == "Worksheet.Paste"
+    assert result["clipboard_ms"] >= 0 and result["direct_ms"] >= 0
+    assert [wb.closed for wb in excel.opened] == [True]
+
+
+def test_verify_direct_transfer_reports_differences(excel, source, monkeypatch):
+    from app.services import sheet_transfer
+
+    original = sheet_transfer.take_snapshot
+
+    def lossy_snapshot(ws):
+        snap = original(ws)
+        snap.column_widths[0] = 10.0
+        return snap
+
+    monkeypatch.setattr(sheet_transfer, "take_snapshot", lossy_snapshot)
+    result = verify_direct_transfer(excel, source)
+    assert result["ok"] is False
+    assert result["differences"] == ["C1 ancho: 30.0 != 10.0"]
+
+
+def test_paste_retries_busy_clipboard(excel, source):
+    metrics.reset()
+    dest = FakeSheet(excel)
+    dest.paste_errors = [CLIPBRD_E_CANT_OPEN, CLIPBRD_E_CANT_OPEN]
+
+    assert paste_via_clipboard(excel, source, dest) == "Worksheet.Paste"
+    assert dest.cells == source.cells
+    assert metrics.snapshot()["counters"]["com.retries"] == 2
+
+
+def test_paste_falls_back_on_permanent_error(excel, source):
+    dest = FakeSheet(excel)
+    dest.paste_errors = [0x80004005]                          # E_FAIL: no se reintenta
+
+    assert paste_via_clipboard(excel, source, dest) == "Range.PasteSpecial(xlPasteAll)"
+    assert dest.cells == source.cells
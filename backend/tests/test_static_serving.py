@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.static_serving import SPAStaticFiles
+
+INDEX = "<!doctype html><title>Cobranza</title>" + "<div></div>" * 200
+
+
+@pytest.fixture
+def spa(tmp_path):
+    (tmp_path / "index.html").write_text(INDEX, encoding="utf-8")
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "app-1a2b3c4d.js").write_text("console.log(1);" * 100, encoding="utf-8")
+    static = SPAStaticFiles(directory=str(tmp_path), html=True)
+    app = FastAPI()
+    app.mount("/", static, name="spa")
+    return static, TestClient(app)
+
+
+@pytest.mark.parametrize("warm", [False, True])
+def test_client_route_falls_back_to_index(spa, warm):
+    """Recargar una ruta del cliente sirve el SPA también antes de terminar warm() (p.ej. tras reiniciar)."""
+    static, client = spa
+    if warm:
+        static.warm()
+    response = client.get("/clientes/42")
+    assert response.status_code == 200
+    assert response.text == INDEX
+
+
+@pytest.mark.parametrize("warm", [False, True])
+def test_assets_are_served(spa, warm):
+    static, client = spa
+    if warm:
+        static.warm()
+    response = client.get("/assets/app-1a2b3c4d.js")
+    assert response.status_code == 200
+    assert response.text.startswith("console.log(1);")
+
+
+def test_non_get_is_not_rewritten(spa):
+    _static, client = spa
+    assert client.post("/clientes/42").status_code in (404, 405)
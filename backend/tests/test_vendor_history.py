@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from app.services.vendor_history import VendorHistory, import_source_file
+from app.services.vendor_matcher import VendorMatcher
+
+from conftest import SOURCE_XLS
+
+
+@pytest.fixture
+def history(tmp_path):
+    return VendorHistory(tmp_path / "history.sqlite3")
+
+
+@pytest.fixture
+def matcher():
+    return VendorMatcher({})
+
+
+def test_two_sources_same_date_accumulate(history, matcher):
+    """Un lote con dos sucursales del mismo día conserva los vendedores de ambas."""
+    history.record("2026-01-24", {"JUAN PEREZ": (100.0, 10.0, 90.0)}, source_name="SUR.xls", matcher=matcher)
+    history.record("2026-01-24", {"ANA GOMEZ": (50.0, 0.0, 50.0)}, source_name="NORTE.xls", matcher=matcher)
+
+    rows = history.totals(start="2026-01-24", end="2026-01-24")
+    assert [(r.vendor, r.saldo) for r in rows] == [("ANA GOMEZ", 50.0), ("JUAN PEREZ", 90.0)]
+    [snapshot] = history.snapshots()
+    assert snapshot["vendors"] == 2
+
+
+def test_rerecording_a_source_replaces_its_vendors(history, matcher):
+    history.record("2026-01-24", {"JUAN PEREZ": (100.0, 10.0, 90.0)}, matcher=matcher)
+    history.record("2026-01-24", {"ANA GOMEZ": (50.0, 0.0, 50.0)}, matcher=matcher)
+    history.record("2026-01-24", {"JUAN PEREZ": (120.0, 20.0, 100.0)}, matcher=matcher)
+
+    rows = {r.vendor: r.saldo for r in history.totals()}
+    assert rows == {"ANA GOMEZ": 50.0, "JUAN PEREZ": 100.0}
+    assert history.snapshots()[0]["vendors"] == 2
+
+
+def test_delete_snapshot_removes_every_source(history, matcher):
+    history.record("2026-01-24", {"JUAN PEREZ": (1.0, 0.0, 1.0)}, matcher=matcher)
+    history.record("2026-01-24", {"ANA GOMEZ": (2.0, 0.0, 2.0)}, matcher=matcher)
+    history.record("2026-01-25", {"ANA GOMEZ": (3.0, 0.0, 3.0)}, matcher=matcher)
+
+    assert history.delete_snapshot("2026-01-24")
+    assert [(r.vendor, r.as_of) for r in history.totals()] == [("ANA GOMEZ", "2026-01-25")]
+
+
+def test_import_erp_source_keeps_all_three_totals(history):
+    """El origen del ERP trae Importe, A cuenta y Saldo; el saldo está en la última columna."""
+    result = import_source_file(str(SOURCE_XLS), history=history)
+
+    assert result["date"] == "2026-01-24"
+    rows = history.totals()
+    assert len(rows) == result["vendors"] > 0
+    for row in rows:
+        assert row.saldo is not None, row.vendor
+        assert row.saldo == pytest.approx(row.importe - row.a_cuenta, abs=0.01), row.vendor
+    assert any(
+        (r.importe, r.a_cuenta, r.saldo) == pytest.approx((5338.3, 216.5, 5121.8)) for r in rows
+    )
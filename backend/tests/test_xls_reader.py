@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from app.services.row_iter import iter_rows
+from app.services.xls_reader import XlsReadError, open_xls, read_xls
+
+from conftest import MASTER_XLS, SOURCE_XLS
+
+
+def _read_all(path):
+    with open_xls(path) as book:
+        for position in range(1, len(book.sheet_names) + 1):
+            for _r, _row in iter_rows(book.stream_sheet(position)):
+                pass
+
+
+def test_samples_read():
+    master = read_xls(MASTER_XLS)
+    assert master.sheet_names[1:] == ["SUR", "NORTE", "GENERAL"]
+    source = read_xls(SOURCE_XLS)
+    assert (source.sheet(1).nrows, source.sheet(1).ncols) == (512, 19)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_damaged_file_raises_xls_read_error(tmp_path, seed):
+    """Truncado o con bytes cambiados: lee bien o lanza XlsReadError (nunca struct.error)."""
+    rnd = random.Random(seed)
+    data = bytearray(SOURCE_XLS.read_bytes())
+    if seed % 3 == 0:
+        data = data[: rnd.randrange(512, len(data))]
+    else:
+        for _ in range(rnd.randint(1, 40)):
+            data[rnd.randrange(512, len(data))] = rnd.randrange(256)
+    path = tmp_path / "danado.xls"
+    path.write_bytes(bytes(data))
+    try:
+        _read_all(path)
+    except XlsReadError:
+        pass
+
+
+def test_short_record_is_xls_read_error(tmp_path):
+    """Un LABELSST de 4 bytes (en vez de 10) es un archivo dañado."""
+    from app.services import xls_reader
+
+    stream = xls_reader._BytesStream(b"\xFD\x00\x04\x00\x01\x00\x02\x00")
+    with pytest.raises(XlsReadError):
+        list(xls_reader._iter_sheet_cells(stream, 0, []))
+
+
+def test_cell_beyond_biff8_columns_is_rejected(tmp_path):
+    """Un byte dañado en la columna de una celda no debe convertir la hoja en 40.000 columnas."""
+    data = bytearray(SOURCE_XLS.read_bytes())
+    number = data.find(b"\x03\x02\x0e\x00")  # primer registro NUMBER (14 bytes)
+    assert number > 0
+    data[number + 4 + 3] = 0xAA             # byte alto de la columna
+    path = tmp_path / "columna.xls"
+    path.write_bytes(bytes(data))
+
+    with open_xls(path) as book:
+        with pytest.raises(XlsReadError):
+            book.stream_sheet(1).ncols